@@ -0,0 +1,371 @@
+"""
+Headless HTTP API
+~~~~~~~~~~~~~~~~~
+ASGI (FastAPI) JSON front end for :mod:`service`, for running Osusume behind
+a load balancer without the Gradio UI.
+
+Endpoints
+---------
+``POST /recommendations``  ``{"request": "..."}`` → ``{"items": [...], "elapsed_s": ...}``
+``GET  /healthz``          Liveness plus worker/queue occupancy and the
+                           operational stats below, as JSON.
+``GET  /metrics``          The same in Prometheus text format, plus per-stage
+                           metrics (with ``OSUSUME_TRACING=1``).
+
+Operational stats: AniList response cache hits and entries, profile store
+counters, rate-limiter queue depth and waits, single-flight coalescing per
+group, HTTP pool requests/retries/connections, time to first streamed card,
+prefetcher cycles and the API worker pool. They are read on a worker thread,
+since the cache and stores count SQLite rows.
+
+Behaviour
+---------
+* Every request runs on its own crew (fresh Agents/Tasks, see
+  :meth:`service.service.build_crew`) inside a bounded worker pool.
+* Admission control: at most ``workers + queue size`` requests are accepted;
+  beyond that the API answers ``429`` with ``Retry-After`` instead of
+  queueing without bound.
+* Requests taking longer than the timeout get ``504``. The worker slot is
+  only freed once the abandoned run actually ends, so backpressure stays
+  accurate.
+* On shutdown, new requests get ``503`` while in-flight ones get a grace
+  period to finish.
+* The process reports healthy right after start-up. The crew/LLM stack is
+  loaded by a background warm-up that runs meanwhile (``"warm"`` in
+  ``/healthz``).
+* With ``OSUSUME_PREFETCH=1`` a background prefetcher keeps seasonal, genre
+  and frequent searches warm in the AniList cache (:mod:`src.prefetch`).
+
+Scale across cores with several processes (``--processes``); the AniList
+rate limiter and caches are already shared between processes on a host.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_API_WORKERS``           Concurrent pipeline runs per process (4).
+``OSUSUME_API_QUEUE_SIZE``        Requests allowed to wait for a worker (16).
+``OSUSUME_API_TIMEOUT_S``         Per-request timeout (60 s).
+``OSUSUME_API_SHUTDOWN_GRACE_S``  Drain period on shutdown (30 s).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from service import RecommendationItem, service, stream_stats
+from src.cache import get_cache
+from src.http_client import aclose, pool_stats
+from src.prefetch import get_prefetcher, start_prefetcher, stop_prefetcher
+from src.profile_store import get_profile_store
+from src.rate_limiter import RateLimitTimeout, get_rate_limiter
+from src.singleflight import flight_stats
+from src.tracing import metrics_text
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_WORKERS: int = int(os.getenv("OSUSUME_API_WORKERS", 4))
+_QUEUE_SIZE: int = int(os.getenv("OSUSUME_API_QUEUE_SIZE", 16))
+_TIMEOUT_S: float = float(os.getenv("OSUSUME_API_TIMEOUT_S", 60))
+_SHUTDOWN_GRACE_S: float = float(os.getenv("OSUSUME_API_SHUTDOWN_GRACE_S", 30))
+# Retry-After hint sent with 429s.
+_RETRY_AFTER_S: int = 5
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------- #
+#  Schemas
+# --------------------------------------------------------------------------- #
+
+class RecommendationRequest(BaseModel):
+    request: str = Field(..., min_length=1, max_length=500, description="Free-text request.")
+
+
+class RecommendationResponse(BaseModel):
+    items: List[RecommendationItem]
+    elapsed_s: float
+
+# --------------------------------------------------------------------------- #
+#  Worker pool with bounded admission
+# --------------------------------------------------------------------------- #
+
+class WorkerPool:
+    """Thread pool that refuses work instead of queueing it without bound."""
+
+    def __init__(self, workers: int = _WORKERS, queue_size: int = _QUEUE_SIZE) -> None:
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.admitted = 0
+        self.draining = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="osusume-api")
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0, "timeouts": 0}
+
+    async def run(self, fn, *args, timeout_s: Optional[float] = None) -> Any:
+        """Run ``fn(*args)`` on a worker; HTTP errors for overload and timeouts."""
+        timeout_s = _TIMEOUT_S if timeout_s is None else timeout_s
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Server is shutting down.")
+        if self.admitted >= self.capacity:
+            self._stats["rejected"] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests in flight, retry later.",
+                headers={"Retry-After": str(_RETRY_AFTER_S)},
+            )
+
+        loop = asyncio.get_running_loop()
+        self.admitted += 1
+        self._idle.clear()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            # Shield: a timeout abandons the run, it doesn't free its slot.
+            result = await asyncio.wait_for(asyncio.shield(future), timeout_s)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise HTTPException(status_code=504, detail=f"Timed out after {timeout_s:.0f}s.")
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        self._stats["completed"] += 1
+        return result
+
+    async def drain(self, grace_s: float = _SHUTDOWN_GRACE_S) -> None:
+        """Stop admitting, wait up to *grace_s* for in-flight work, then stop."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), grace_s)
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with %d request(s) still running", self.admitted)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self.admitted,
+            "queued": max(0, self.admitted - self.workers),
+            "draining": self.draining,
+            **self._stats,
+        }
+
+    def _release(self, _future: asyncio.Future) -> None:
+        self.admitted -= 1
+        if self.admitted == 0:
+            self._idle.set()
+
+# --------------------------------------------------------------------------- #
+#  Application
+# --------------------------------------------------------------------------- #
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI) -> AsyncIterator[None]:
+    app.state.pool = WorkerPool()
+    app.state.service = service()
+    # Importing crewai/litellm takes seconds; do it off the event loop so the
+    # worker can report healthy (and queue requests) meanwhile.
+    app.state.warm_up = asyncio.get_running_loop().run_in_executor(None, app.state.service.warm_up)
+    app.state.warm_up.add_done_callback(_log_warm_up_failure)
+    start_prefetcher()
+    yield
+    stop_prefetcher()
+    await app.state.pool.drain()
+    await aclose()
+
+
+def _log_warm_up_failure(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Warm-up failed; the first request will retry it", exc_info=future.exception())
+
+
+app = FastAPI(title="Osusume", lifespan=_lifespan)
+
+
+@app.post("/recommendations", response_model=RecommendationResponse)
+async def recommendations(body: RecommendationRequest) -> RecommendationResponse:
+    started = time.perf_counter()
+    try:
+        items = await app.state.pool.run(app.state.service.get_recommendations, body.request.strip())
+    except RateLimitTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(_RETRY_AFTER_S)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Upstream failures (AniList, OpenAI, unparseable crew output).
+        logger.exception("Recommendation request failed")
+        raise HTTPException(status_code=502, detail=str(e))
+    return RecommendationResponse(items=items, elapsed_s=round(time.perf_counter() - started, 3))
+
+
+@app.get("/healthz")
+async def healthz() -> Dict[str, Any]:
+    pool: WorkerPool = app.state.pool
+    return {
+        "status": "draining" if pool.draining else "ok",
+        "warm": app.state.warm_up.done(),
+        "pool": pool.stats(),
+        **await asyncio.to_thread(_ops_stats),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    stats = await asyncio.to_thread(_ops_stats)
+    text = metrics_text() + _ops_metrics_text(app.state.pool.stats(), stats)
+    text += await asyncio.to_thread(get_profile_store().metrics_text)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+# --------------------------------------------------------------------------- #
+#  Operational metrics
+# --------------------------------------------------------------------------- #
+
+def _ops_stats() -> Dict[str, Any]:
+    """Stats of the shared caches, stores and clients. Blocks on SQLite reads."""
+    return {
+        "cache": get_cache().stats(),
+        "profiles": get_profile_store().stats(),
+        "rate_limiter": get_rate_limiter().stats(),
+        "singleflight": flight_stats(),
+        "http": pool_stats(),
+        "streams": stream_stats(),
+        "prefetch": get_prefetcher().stats(),
+    }
+
+
+def _metric(name: str, kind: str, help_text: str, samples: Dict[tuple, Any], labels: tuple = ()) -> List[str]:
+    """One metric family; *samples* maps label values to a number (``None`` is skipped)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for key, value in samples.items():
+        if value is None:
+            continue
+        label_text = ",".join(f'{label}="{v}"' for label, v in zip(labels, key))
+        value = value if isinstance(value, int) else round(float(value), 6)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def _ops_metrics_text(pool: Dict[str, Any], stats: Dict[str, Any]) -> str:
+    """:func:`_ops_stats` plus the worker pool in Prometheus text format."""
+    cache, limiter, streams, prefetch = (
+        stats["cache"], stats["rate_limiter"], stats["streams"], stats["prefetch"]
+    )
+    flights, http = stats["singleflight"], stats["http"]
+    lines: List[str] = []
+    lines += _metric(
+        "osusume_api_requests", "gauge", "API requests admitted, by state.",
+        {("running",): pool["in_flight"] - pool["queued"], ("queued",): pool["queued"]}, ("state",),
+    )
+    lines += _metric(
+        "osusume_api_requests_total", "counter", "API requests finished, by outcome.",
+        {(k,): pool[k] for k in ("completed", "failed", "rejected", "timeouts")}, ("outcome",),
+    )
+    lines += _metric(
+        "osusume_response_cache_lookups_total", "counter", "AniList response cache lookups, by result.",
+        {("memory_hit",): cache["memory_hits"], ("disk_hit",): cache["disk_hits"], ("miss",): cache["misses"]},
+        ("result",),
+    )
+    lines += _metric(
+        "osusume_response_cache_entries", "gauge", "AniList responses cached, by tier.",
+        {("memory",): cache["memory_entries"], ("disk",): cache.get("disk_entries")}, ("tier",),
+    )
+    lines += _metric(
+        "osusume_rate_limit_queue_depth", "gauge", "Callers waiting for an AniList slot, by priority.",
+        {(p,): n for p, n in limiter["queue_depth"].items()}, ("priority",),
+    )
+    lines += _metric(
+        "osusume_rate_limit_acquired_total", "counter", "AniList slots granted, by priority.",
+        {(p,): n for p, n in limiter["acquired"].items()}, ("priority",),
+    )
+    lines += _metric(
+        "osusume_rate_limit_timeouts_total", "counter", "Callers that gave up waiting, by priority.",
+        {(p,): n for p, n in limiter["timeouts"].items()}, ("priority",),
+    )
+    lines += _metric(
+        "osusume_rate_limit_wait_seconds_total", "counter", "Time spent waiting for AniList slots.",
+        {(): limiter["wait_s_total"]},
+    )
+    lines += _metric(
+        "osusume_rate_limit_wait_seconds_max", "gauge", "Longest wait for an AniList slot.",
+        {(): limiter["wait_s_max"]},
+    )
+    lines += _metric(
+        "osusume_rate_limit_throttle_events_total", "counter", "429 answers that drained the shared bucket.",
+        {(): limiter["throttle_events"]},
+    )
+    lines += _metric(
+        "osusume_singleflight_calls_total", "counter", "Coalescable calls, by group and role.",
+        {
+            (group, role): s[key]
+            for group, s in flights.items()
+            for role, key in (("leader", "executions"), ("follower", "coalesced"))
+        },
+        ("group", "role"),
+    )
+    lines += _metric(
+        "osusume_http_requests_total", "counter", "Outbound AniList HTTP attempts, by client and kind.",
+        {
+            (client, kind): s[kind]
+            for client, s in http.items()
+            for kind in ("requests", "retries", "failures")
+        },
+        ("client", "kind"),
+    )
+    lines += _metric(
+        "osusume_http_in_flight", "gauge", "Outbound AniList requests in flight, by client.",
+        {(client,): s["in_flight"] for client, s in http.items()}, ("client",),
+    )
+    lines += _metric(
+        "osusume_http_open_connections", "gauge", "Pooled connections open, by client.",
+        {(client,): s.get("open_connections") for client, s in http.items()}, ("client",),
+    )
+    lines += _metric(
+        "osusume_stream_first_card_seconds", "gauge", "Time to first streamed card over recent streams.",
+        {("0.5",): streams["first_card_s_p50"], ("0.95",): streams["first_card_s_p95"]}, ("quantile",),
+    )
+    lines += _metric(
+        "osusume_streams_total", "counter", "Recommendation streams, by result.",
+        {("cards",): streams["streams"] - streams["empty"], ("empty",): streams["empty"]}, ("result",),
+    )
+    lines += _metric(
+        "osusume_prefetch_queries_total", "counter", "Prefetcher queries, by outcome.",
+        {(k,): prefetch[k] for k in ("refreshed", "fresh", "local", "deferred", "failed")}, ("outcome",),
+    )
+    return "\n".join(lines) + "\n"
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the Osusume JSON API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--processes", type=int, default=1, help="uvicorn worker processes")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(
+        "api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.processes,
+        timeout_graceful_shutdown=int(_SHUTDOWN_GRACE_S),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Columnar Representation Benchmark
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Compares :class:`src.columnar.MediaTable` with the dict and positional-list
+forms it replaces, on the stub's synthetic catalog. Reports JSON.
+
+``memory``    Bytes per media (``tracemalloc``) as decoded ``Anime`` dicts,
+              as catalog records (positional lists), and as a table.
+``catalog``   Building :class:`CatalogIndex` and :class:`SimilarityEngine`,
+              and a filtered, sorted 20-result search.
+``ranking``   :meth:`Ranker.rank` on dicts against :meth:`Ranker.rank_table`
+              on a table, per pool size.
+``cache``     In-memory :class:`ResponseCache` hits and sets of one page with
+              plain dicts against ``compact=True`` (:class:`PackedPage`).
+
+Usage::
+
+    python benchmarks/columnar.py
+    python benchmarks/columnar.py --size 20000 --output columnar.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from benchmarks.stub_server import SyntheticCatalog
+from src.catalog import CatalogIndex, _encode
+from src.cache import ResponseCache
+from src.columnar import MediaTable
+from src.ranking import Ranker
+from src.request_parser import AnimeSearchParams
+from src.similarity import SimilarityEngine
+
+# --------------------------------------------------------------------------- #
+#  Helpers
+# --------------------------------------------------------------------------- #
+
+def _timed(fn: Callable[[], Any], repeats: int, unit: str = "ms") -> Dict[str, float]:
+    scale = {"ms": 1e3, "us": 1e6}[unit]
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * scale)
+    timings.sort()
+    return {
+        f"p50_{unit}": round(statistics.median(timings), 3),
+        f"p95_{unit}": round(timings[int(0.95 * (len(timings) - 1))], 3),
+    }
+
+
+def _allocated(build: Callable[[], Any]) -> int:
+    """Bytes still held by what *build* returns."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return after - before
+
+# --------------------------------------------------------------------------- #
+#  Measurements
+# --------------------------------------------------------------------------- #
+
+def measure_memory(media: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Round-trip through JSON so nothing shares strings with the generator.
+    blob = json.dumps(media)
+    records_blob = json.dumps([_encode(m) for m in media])
+    n = len(media)
+    per_media = {
+        "dicts": _allocated(lambda: json.loads(blob)) / n,
+        "records": _allocated(lambda: json.loads(records_blob)) / n,
+        "table": _allocated(lambda: MediaTable.from_media(json.loads(blob))) / n,
+    }
+    report = {f"{name}_bytes_per_media": round(v) for name, v in per_media.items()}
+    report["table_vs_dicts"] = round(per_media["dicts"] / per_media["table"], 1)
+    return report
+
+
+def measure_catalog(media: List[Dict[str, Any]], repeats: int) -> Dict[str, Any]:
+    records = [_encode(m) for m in media]
+    index = CatalogIndex(records)
+    variables = {"genres": ["Action"], "sort": ["SCORE_DESC"], "perPage": 20}
+    return {
+        "index_build": _timed(lambda: CatalogIndex(records), max(1, repeats // 10)),
+        "similarity_build": _timed(lambda: SimilarityEngine(index), max(1, repeats // 10)),
+        "search_20": _timed(lambda: index.search(variables), repeats),
+    }
+
+
+def measure_ranking(
+    media: List[Dict[str, Any]], sizes: List[int], repeats: int, seed: int
+) -> Dict[str, Any]:
+    ranker = Ranker()
+    params = AnimeSearchParams(genres=["Action", "Comedy"], tags=["Isekai"], year=2020)
+    rng = random.Random(seed)
+    report = {}
+    for size in sizes:
+        pool = rng.sample(media, min(size, len(media)))
+        table = MediaTable.from_media(pool)
+        report[str(size)] = {
+            "dicts": _timed(lambda: ranker.rank(pool, params), repeats),
+            "table": _timed(lambda: ranker.rank_table(table, params), repeats),
+        }
+    return report
+
+
+def measure_cache(media: List[Dict[str, Any]], repeats: int) -> Dict[str, Any]:
+    """Memory-tier hits and sets of one page, plain dicts against packed tables."""
+    report = {}
+    for per_page in (20, 50):
+        payload = {"data": {"Page": {"pageInfo": {"hasNextPage": True}, "media": media[:per_page]}}}
+        row = {}
+        for name, compact in (("plain", False), ("compact", True)):
+            cache = ResponseCache(path=None, compact=compact)
+            cache.set("page", payload)
+            row[f"{name}_set"] = _timed(lambda: cache.set("page", payload), repeats, "us")
+            row[f"{name}_hit"] = _timed(lambda: cache.get("page"), repeats, "us")
+        row["compact_hit_vs_plain"] = round(row["compact_hit"]["p50_us"] / row["plain_hit"]["p50_us"], 1)
+        report[str(per_page)] = row
+    return report
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the columnar media table.")
+    parser.add_argument("--size", type=int, default=6000, help="synthetic catalog size")
+    parser.add_argument("--pool-sizes", default="50,200,1000")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    media = json.loads(json.dumps(SyntheticCatalog(size=args.size, seed=args.seed).media))
+    report = {
+        "media": len(media),
+        "memory": measure_memory(media),
+        "catalog": measure_catalog(media, args.repeats),
+        "ranking": measure_ranking(
+            media, [int(s) for s in args.pool_sizes.split(",") if s.strip()],
+            args.repeats, args.seed,
+        ),
+        "cache": measure_cache(media, args.repeats),
+    }
+
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    else:
+        print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Import-Time Benchmark
+~~~~~~~~~~~~~~~~~~~~~
+Measures how long the entry points take to import in a fresh interpreter
+(what an autoscaled worker pays before it can answer), using
+``python -X importtime``. Each module is imported several times, each time
+in a new process. The report gives the median/min/max cumulative import time,
+the slowest imports it pulled in, and which of the heavy packages (crewai,
+litellm, openai, ...) were loaded eagerly.
+
+Usage::
+
+    python benchmarks/import_time.py --modules service,api --runs 5 --max-ms 1000
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+# Packages that should only load on first use.
+_HEAVY = ("crewai", "litellm", "openai", "chromadb", "gradio")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def _import_once(module: str) -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """Import *module* in a new interpreter; return (ms, [(import, cumulative ms)], heavy)."""
+    probe = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([m for m in {_HEAVY!r} if m in sys.modules]))"
+    )
+    env = dict(os.environ, PYTHONPATH=parent_dir)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=parent_dir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+
+    total_us = 0
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        entries.append((name, cumulative / 1000.0))
+        if indent <= 1:
+            total_us += cumulative
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    return total_us / 1000.0, entries, heavy
+
+
+def measure(module: str, runs: int, top: int) -> Dict[str, Any]:
+    totals, last_entries, heavy = [], [], []
+    for _ in range(runs):
+        total_ms, last_entries, heavy = _import_once(module)
+        totals.append(total_ms)
+    slowest = sorted(last_entries, key=lambda e: -e[1])
+    return {
+        "module": module,
+        "runs": runs,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "heavy_loaded": heavy,
+        "slowest_imports": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in slowest[:top]],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the entry points.")
+    parser.add_argument("--modules", default="service,api,ui.gradio_app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list per module")
+    parser.add_argument("--max-ms", type=float, help="exit non-zero if a median exceeds this")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    results = []
+    for module in [m.strip() for m in args.modules.split(",") if m.strip()]:
+        try:
+            results.append(measure(module, args.runs, args.top))
+        except RuntimeError as exc:
+            results.append({"module": module, "error": str(exc)})
+
+    rendered = json.dumps({"python": sys.version.split()[0], "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    if args.max_ms is not None:
+        slow = [r for r in results if "median_ms" in r and r["median_ms"] > args.max_ms]
+        for r in slow:
+            print(f"{r['module']}: median import {r['median_ms']:.0f} ms > {args.max_ms:.0f} ms", file=sys.stderr)
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
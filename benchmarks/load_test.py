@@ -0,0 +1,384 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Offline Load Test
+~~~~~~~~~~~~~~~~~
+Drives a prompt corpus through :class:`service.service` at several
+concurrency levels against :mod:`benchmarks.stub_server`, and reports
+latency percentiles, throughput and a per-stage time breakdown as JSON.
+
+The stub is started as a subprocess (or reused with ``--stub-url``) and the
+app is pointed at it through its own environment variables before it is
+imported. Caches, catalog and profile store go to a throwaway directory and
+start empty at every level unless ``--warm`` is given. The AniList rate
+limiter is lifted, because the stub answers for AniList.
+
+Stages
+------
+``filters``     Local filter extraction (:func:`src.filter_extractor.extract_filters`).
+``mapper``      Mapper LLM completions.
+``researcher``  Researcher agent LLM completions (crew pipeline).
+``tool``        ``search_anime`` tool runs, including the analyzer calls they make.
+``analyzer``    Seed taste-profile lookups.
+``describe``    Direct-mode description completions, until the stream ends.
+``rendering``   Turning crew output / media into ``RecommendationItem``.
+
+Stages nest (``tool`` contains ``analyzer``; the crew contains everything),
+so their totals don't add up to the request latency.
+
+Usage::
+
+    python benchmarks/load_test.py --concurrency 1,4,16 --requests 40 --output bench.json
+    python benchmarks/load_test.py --pipeline direct --baseline bench.json --max-regression 0.15
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_DEFAULT_CORPUS = os.path.join(_HERE, "prompts.jsonl")
+
+# --------------------------------------------------------------------------- #
+#  Stage timing
+# --------------------------------------------------------------------------- #
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class StageProbe:
+    """Thread-safe collector of per-stage durations."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def wrap(self, stage: str, fn: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+    def report(self, requests: int) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self._samples.items()}
+        return {
+            stage: {
+                "calls": len(values),
+                "total_s": round(sum(values), 4),
+                "per_request_ms": round(sum(values) / max(requests, 1) * 1000, 2),
+                "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+            }
+            for stage, values in sorted(samples.items())
+        }
+
+
+def install_probes(probe: StageProbe) -> None:
+    """Wrap the pipeline's stage entry points with timers."""
+    import litellm
+    import service as service_module
+    import src.recommender as recommender
+    from benchmarks.stub_server import classify
+
+    # The bundled model map may predate the configured model; without an
+    # entry litellm can't tell which provider (and so which base URL) to use.
+    model = service_module.service.llm.model
+    if model not in litellm.model_cost:
+        litellm.register_model({model: {"litellm_provider": "openai", "mode": "chat"}})
+
+    completion = litellm.completion
+
+    def timed_completion(*args, **kwargs):
+        stage = classify(kwargs.get("messages") or [])
+        started = time.perf_counter()
+        result = completion(*args, **kwargs)
+        if not kwargs.get("stream"):
+            probe.add(stage, time.perf_counter() - started)
+            return result
+
+        def drain():
+            try:
+                yield from result
+            finally:
+                probe.add(stage, time.perf_counter() - started)
+        return drain()
+
+    litellm.completion = timed_completion
+    service_module.extract_filters = probe.wrap("filters", service_module.extract_filters)
+    recommender.get_relevant_tags_and_genres = probe.wrap(
+        "analyzer", recommender.get_relevant_tags_and_genres
+    )
+    tool_cls = recommender.SearchAnimeTool
+    tool_cls._run = probe.wrap("tool", tool_cls._run)
+    svc = service_module.service
+    svc._parse_crew_output = staticmethod(probe.wrap("rendering", svc._parse_crew_output))
+    svc._build_item = staticmethod(probe.wrap("rendering", svc._build_item))
+
+# --------------------------------------------------------------------------- #
+#  Environment
+# --------------------------------------------------------------------------- #
+
+def configure_environment(stub_url: str, args: argparse.Namespace, workdir: str) -> None:
+    """Point the app at the stub; must run before ``service`` is imported."""
+    os.environ.update({
+        "OSUSUME_ANILIST_URL": stub_url + "/graphql",
+        "OPENAI_BASE_URL": stub_url + "/v1",
+        "OPENAI_API_BASE": stub_url + "/v1",
+        "OPENAI_API_KEY": "stub",
+        "OSUSUME_PIPELINE": args.pipeline,
+        "OSUSUME_RATE_LIMIT_BACKEND": "memory",
+        "OSUSUME_ANILIST_RATE_PER_MIN": "1000000000",
+        "OSUSUME_ANILIST_BURST": "1000000000",
+        "OSUSUME_HTTP_HTTP2": "0",
+        "OSUSUME_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "OSUSUME_PROFILE_STORE_PATH": os.path.join(workdir, "profiles.sqlite3"),
+        "OSUSUME_CATALOG_PATH": os.path.join(workdir, "catalog.jsonl.gz"),
+        "CREWAI_DISABLE_TELEMETRY": "true",
+        "OTEL_SDK_DISABLED": "true",
+        # Offline: don't fetch litellm's model map at import.
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    if args.descriptions:
+        os.environ["OSUSUME_DIRECT_DESCRIPTIONS"] = args.descriptions
+    if not args.warm:
+        os.environ["OSUSUME_SEMANTIC_CACHE_DISABLED"] = "1"
+
+
+def reset_state() -> None:
+    """Empty the response cache and profile store between levels."""
+    from src.cache import get_cache
+    from src.profile_store import get_profile_store
+
+    get_cache().clear()
+    get_profile_store().invalidate()
+
+
+def start_stub(args: argparse.Namespace) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(_HERE, "stub_server.py"),
+        "--port", str(args.stub_port),
+        "--anilist-latency-ms", str(args.anilist_latency_ms),
+        "--openai-latency-ms", str(args.openai_latency_ms),
+        "--openai-chunk-ms", str(args.openai_chunk_ms),
+        "--jitter", str(args.jitter),
+        "--seed", str(args.seed),
+    ]
+    if args.fixtures:
+        command += ["--fixtures", args.fixtures]
+    return subprocess.Popen(command)
+
+
+def wait_for_stub(stub_url: str, timeout_s: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            with urllib.request.urlopen(stub_url + "/healthz", timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Stub server at {stub_url} did not come up")
+            time.sleep(0.1)
+
+
+def stub_calls(stub_url: str, reset: bool = False) -> Dict[str, int]:
+    request = urllib.request.Request(
+        stub_url + ("/stats/reset" if reset else "/stats"), method="POST" if reset else "GET"
+    )
+    with urllib.request.urlopen(request, timeout=5) as resp:
+        return json.loads(resp.read())
+
+# --------------------------------------------------------------------------- #
+#  Load generation
+# --------------------------------------------------------------------------- #
+
+def load_corpus(path: str) -> List[str]:
+    prompts = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            prompts.append(json.loads(line)["prompt"] if line.startswith("{") else line)
+    return prompts
+
+
+def run_level(
+    svc, prompts: List[str], concurrency: int, requests: int, probe: StageProbe, stub_url: str,
+) -> Dict[str, Any]:
+    """Send *requests* prompts with *concurrency* in flight; return the level report."""
+    reset_state()
+    probe.reset()
+    stub_calls(stub_url, reset=True)
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        prompt = prompts[i % len(prompts)]
+        started = time.perf_counter()
+        try:
+            svc.get_recommendations(prompt)
+        except Exception as exc:  # noqa: BLE001 - counted, not fatal
+            with lock:
+                errors[type(exc).__name__] += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall_s = time.perf_counter() - started
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(latencies) / wall_s, 3) if wall_s else 0.0,
+        "latency_ms": {
+            "p50": ms(_percentile(latencies, 0.50)),
+            "p95": ms(_percentile(latencies, 0.95)),
+            "p99": ms(_percentile(latencies, 0.99)),
+            "mean": ms(statistics.fmean(latencies)) if latencies else None,
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        "stages": probe.report(requests),
+        "upstream_calls": stub_calls(stub_url),
+    }
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """p95 latencies that got worse than *baseline* by more than *max_regression*."""
+    before = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    found = []
+    for level in report["levels"]:
+        old = before.get(level["concurrency"])
+        if not old or not old["latency_ms"]["p95"] or level["latency_ms"]["p95"] is None:
+            continue
+        ratio = level["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1.0
+        if ratio > max_regression:
+            found.append(
+                f"concurrency {level['concurrency']}: p95 {old['latency_ms']['p95']:.0f} ms "
+                f"-> {level['latency_ms']['p95']:.0f} ms (+{ratio:.0%})"
+            )
+    return found
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> int:
+    from benchmarks.stub_server import add_latency_arguments
+
+    parser = argparse.ArgumentParser(description="Offline load test against the stub upstreams.")
+    parser.add_argument("--corpus", default=_DEFAULT_CORPUS, help="JSONL ({\"prompt\": ...}) or one prompt per line")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level (default: corpus size)")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before the first level")
+    parser.add_argument("--pipeline", choices=("crew", "direct"), default=os.getenv("OSUSUME_PIPELINE", "crew"))
+    parser.add_argument("--descriptions", choices=("auto", "llm", "template"), help="direct-mode descriptions")
+    parser.add_argument("--warm", action="store_true", help="keep caches between levels")
+    parser.add_argument("--stub-url", help="use an already running stub server")
+    parser.add_argument("--stub-port", type=int, default=8799)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="earlier report to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="allowed relative p95 increase before exiting non-zero")
+    add_latency_arguments(parser)
+    parser.set_defaults(record=None)
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    prompts = load_corpus(args.corpus)
+    requests = args.requests or len(prompts)
+
+    stub = None
+    stub_url = args.stub_url or f"http://127.0.0.1:{args.stub_port}"
+    if not args.stub_url:
+        stub = start_stub(args)
+    workdir = tempfile.mkdtemp(prefix="osusume-bench-")
+    try:
+        wait_for_stub(stub_url)
+        configure_environment(stub_url, args, workdir)
+
+        import service as service_module
+
+        probe = StageProbe()
+        install_probes(probe)
+        svc = service_module.service()
+        for prompt in prompts[:args.warmup]:
+            svc.get_recommendations(prompt)
+
+        report = {
+            "pipeline": args.pipeline,
+            "corpus": os.path.relpath(args.corpus),
+            "prompts": len(prompts),
+            "latency_model": {
+                "anilist_ms": args.anilist_latency_ms,
+                "openai_ms": args.openai_latency_ms,
+                "openai_chunk_ms": args.openai_chunk_ms,
+                "jitter": args.jitter,
+            },
+            "warm": args.warm,
+            "levels": [
+                run_level(svc, prompts, level, requests, probe, stub_url) for level in levels
+            ],
+        }
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait(timeout=10)
+
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    else:
+        print(rendered)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            found = regressions(report, json.load(fh), args.max_regression)
+        for line in found:
+            print("p95 regression: " + line, file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
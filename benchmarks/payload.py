@@ -0,0 +1,93 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Tool Payload Benchmark
+~~~~~~~~~~~~~~~~~~~~~~
+Token cost of one ``search_anime`` result page as the researcher agent reads
+it, per :mod:`src.payload` mode, on pages of the stub's synthetic catalog.
+Reports JSON: mean tokens and characters per page, the share saved against
+``full``, and the encoding time.
+
+Tokens come from :func:`src.payload.count_tokens` (``tokenizer`` in the
+report says whether tiktoken or the 4 chars/token estimate was used).
+
+Usage::
+
+    python benchmarks/payload.py
+    python benchmarks/payload.py --per-page 50 --fields id,title,tags,cover --top-tags 3
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.stub_server import SyntheticCatalog
+from src.payload import DEFAULT_FIELDS, MODES, _encoding, count_tokens, encode, parse_fields
+
+
+def measure(
+    pages: List[List[Dict[str, Any]]], fields: tuple, top_n: int, model: str
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {}
+    for mode in MODES:
+        tokens, chars, timings = [], [], []
+        for page in pages:
+            started = time.perf_counter()
+            text = encode(page, mode, fields, top_n)
+            timings.append((time.perf_counter() - started) * 1000)
+            tokens.append(count_tokens(text, model))
+            chars.append(len(text))
+        report[mode] = {
+            "tokens_per_page": round(statistics.mean(tokens), 1),
+            "chars_per_page": round(statistics.mean(chars), 1),
+            "encode_p50_ms": round(statistics.median(timings), 3),
+        }
+    full = report["full"]["tokens_per_page"]
+    for mode in MODES:
+        report[mode]["saved_vs_full"] = round(1 - report[mode]["tokens_per_page"] / full, 3)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure search_anime payload tokens per mode.")
+    parser.add_argument("--per-page", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--fields", default=",".join(DEFAULT_FIELDS))
+    parser.add_argument("--top-tags", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4.1")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    media = SyntheticCatalog(seed=args.seed).media
+    rng = random.Random(args.seed)
+    pages = [rng.sample(media, args.per_page) for _ in range(args.pages)]
+    fields = parse_fields(args.fields)
+    report = {
+        "per_page": args.per_page,
+        "pages": args.pages,
+        "fields": list(fields),
+        "top_tags": args.top_tags,
+        "tokenizer": "tiktoken" if _encoding(args.model) is not None else "chars/4",
+        "modes": measure(pages, fields, args.top_tags, args.model),
+    }
+
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    else:
+        print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Re-Ranking Benchmark
+~~~~~~~~~~~~~~~~~~~~
+Measures :mod:`src.ranking` on two axes and reports JSON.
+
+Speed
+    Ranks pools of 50–1000 media drawn from the stub's synthetic catalog,
+    once per corpus prompt (filters from the local extractor). Reports
+    p50/p95 milliseconds per pool size.
+
+Agreement with the agent
+    For each case (prompt, the ``search_anime`` results the researcher saw,
+    and the five titles it picked), the ranker re-picks from the same pool.
+    ``ranker_overlap`` is the share of the agent's picks the ranker also
+    chose. ``anilist_order_overlap`` is the same for AniList's own top five,
+    as a baseline. Cases come from ``--cases FILE``. ``--record-cases FILE`` first
+    runs the crew pipeline over the corpus and saves them. That run uses the
+    stub, whose "agent" simply takes the first results, or the real
+    upstreams with ``--live``.
+
+Usage::
+
+    python benchmarks/ranking.py                                  # speed only
+    python benchmarks/ranking.py --record-cases cases.jsonl --live --output report.json
+    python benchmarks/ranking.py --cases cases.jsonl --weights "recency=0,diversity=0.5"
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.load_test import (
+    _DEFAULT_CORPUS, configure_environment, load_corpus, start_stub, wait_for_stub,
+)
+from benchmarks.stub_server import SyntheticCatalog, add_latency_arguments
+from src.filter_extractor import extract_filters
+from src.ranking import Ranker, RankingWeights
+from src.request_parser import AnimeSearchParams
+
+_K: int = 5
+
+# --------------------------------------------------------------------------- #
+#  Speed
+# --------------------------------------------------------------------------- #
+
+def measure_speed(
+    ranker: Ranker, prompts: List[str], sizes: List[int], repeats: int, seed: int
+) -> Dict[str, Any]:
+    universe = SyntheticCatalog(seed=seed).media
+    rng = random.Random(seed)
+    params = [extract_filters(p).params for p in prompts]
+    report = {}
+    for size in sizes:
+        timings = []
+        for _ in range(repeats):
+            for p in params:
+                pool = rng.sample(universe, min(size, len(universe)))
+                started = time.perf_counter()
+                ranker.rank(pool, p, _K)
+                timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        report[str(size)] = {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3),
+            "runs": len(timings),
+        }
+    return report
+
+# --------------------------------------------------------------------------- #
+#  Agreement
+# --------------------------------------------------------------------------- #
+
+def _title(media: Dict[str, Any]) -> Optional[str]:
+    return media["title"].get("english") or media["title"].get("romaji")
+
+
+def _params_from_tool_args(args: Dict[str, Any]) -> Dict[str, Any]:
+    genres = ([args["genre"]] if args.get("genre") else []) + list(args.get("genres") or [])
+    params = {
+        "season": args.get("season"),
+        "year": args.get("year"),
+        "genres": genres or None,
+        "tags": args.get("tags"),
+    }
+    return {k: v for k, v in params.items() if v is not None}
+
+
+def record_cases(prompts: List[str], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run the crew pipeline and capture each prompt's tool results and final picks."""
+    stub = None
+    if not args.live:
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+        stub = start_stub(args)
+        wait_for_stub(stub_url)
+        configure_environment(stub_url, args, tempfile.mkdtemp(prefix="osusume-rank-"))
+    os.environ["OSUSUME_PIPELINE"] = "crew"
+    os.environ["OSUSUME_SEMANTIC_CACHE_DISABLED"] = "1"
+    try:
+        import litellm
+        import service as service_module
+        from src.recommender import SearchAnimeTool
+
+        # Same as the load test: older bundled model maps lack the configured model.
+        model = service_module.service.llm.model
+        if model not in litellm.model_cost:
+            litellm.register_model({model: {"litellm_provider": "openai", "mode": "chat"}})
+
+        calls: List[tuple] = []
+        original = SearchAnimeTool._run
+
+        def capture(self, **kwargs):
+            result = original(self, **kwargs)
+            calls.append((kwargs, result))
+            return result
+
+        SearchAnimeTool._run = capture
+        svc = service_module.service()
+        cases = []
+        for prompt in prompts:
+            calls.clear()
+            try:
+                items = svc.get_recommendations(prompt)
+            except Exception as exc:  # noqa: BLE001 - skip failed runs, keep the rest
+                print(f"skipping {prompt!r}: {exc}", file=sys.stderr)
+                continue
+            candidates: Dict[int, Dict[str, Any]] = {}
+            for _, result in calls:
+                for media in result:
+                    candidates.setdefault(media["id"], media)
+            by_title = {_title(m): m["id"] for m in candidates.values()}
+            cases.append({
+                "prompt": prompt,
+                "params": _params_from_tool_args(calls[-1][0]) if calls else {},
+                "candidates": list(candidates.values()),
+                "agent_ids": [by_title.get(item.title) for item in items],
+            })
+        SearchAnimeTool._run = original
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait(timeout=10)
+    return cases
+
+
+def measure_agreement(ranker: Ranker, cases: List[Dict[str, Any]]) -> Dict[str, Any]:
+    per_case = []
+    for case in cases:
+        agent = [i for i in case["agent_ids"] if i is not None]
+        if not agent or not case["candidates"]:
+            continue
+        params = AnimeSearchParams(**case["params"])
+        ranked = [m["id"] for m in ranker.rank(case["candidates"], params, _K)]
+        anilist = [m["id"] for m in case["candidates"][:_K]]
+        per_case.append({
+            "prompt": case["prompt"],
+            "pool": len(case["candidates"]),
+            "agent_picks_in_pool": len(agent) / len(case["agent_ids"]),
+            "ranker_overlap": len(set(ranked) & set(agent)) / len(agent),
+            "anilist_order_overlap": len(set(anilist) & set(agent)) / len(agent),
+        })
+
+    def mean(name: str) -> Optional[float]:
+        return round(statistics.mean(c[name] for c in per_case), 3) if per_case else None
+
+    return {
+        "cases": len(per_case),
+        "k": _K,
+        "ranker_overlap": mean("ranker_overlap"),
+        "anilist_order_overlap": mean("anilist_order_overlap"),
+        "agent_picks_in_pool": mean("agent_picks_in_pool"),
+        "per_case": per_case,
+    }
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the local re-ranker.")
+    parser.add_argument("--corpus", default=_DEFAULT_CORPUS)
+    parser.add_argument("--pool-sizes", default="50,200,500,1000")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--weights", default="", help='overrides, e.g. "tags=1.5,diversity=0"')
+    parser.add_argument("--cases", help="JSONL of recorded cases to score")
+    parser.add_argument("--record-cases", help="run the crew pipeline first and save its cases here")
+    parser.add_argument("--live", action="store_true", help="record against the real upstreams")
+    parser.add_argument("--stub-port", type=int, default=8799)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    add_latency_arguments(parser)
+    parser.set_defaults(pipeline="crew", descriptions=None, warm=False)
+    args = parser.parse_args()
+
+    prompts = load_corpus(args.corpus)
+    ranker = Ranker(RankingWeights.parse(args.weights))
+    report: Dict[str, Any] = {
+        "weights": ranker.weights.__dict__,
+        "speed": measure_speed(
+            ranker, prompts, [int(s) for s in args.pool_sizes.split(",") if s.strip()],
+            args.repeats, args.seed,
+        ),
+    }
+
+    cases: List[Dict[str, Any]] = []
+    if args.record_cases:
+        cases = record_cases(prompts, args)
+        with open(args.record_cases, "w", encoding="utf-8") as fh:
+            for case in cases:
+                fh.write(json.dumps(case) + "\n")
+    elif args.cases:
+        with open(args.cases, encoding="utf-8") as fh:
+            cases = [json.loads(line) for line in fh if line.strip()]
+    if cases:
+        report["agreement"] = measure_agreement(ranker, cases)
+
+    rendered = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(rendered + "\n")
+    else:
+        print(rendered)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,525 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+"""
+Offline AniList / OpenAI Stub
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+A small ASGI server that stands in for both upstreams during load tests, so
+benchmarks are repeatable, free and don't eat into AniList's rate limit.
+
+AniList (``POST /graphql``)
+    Answers from a fixture file of recorded responses (keyed like
+    :func:`src.cache.make_key`) when one matches. Otherwise it filters a
+    seeded synthetic catalog by the query's variables (search, season, year,
+    genres, tags, sort, paging) and also handles the aliased batch documents
+    built by :func:`src.anilist_query_searcher.search_anime_batch`. Unknown
+    titles still resolve, so seed lookups never come back empty.
+
+OpenAI (``POST /v1/chat/completions`` and ``POST /v1/responses``)
+    Canned answers shaped like the real model's, derived from the prompt:
+    the mapper gets the locally extracted filters, the researcher agent gets
+    a ReAct tool call followed by a final answer built from the tool
+    observation, direct-mode description calls get a (streamed) JSON array,
+    and the analyzer gets its tags as JSON (or a Python list when no
+    ``json_schema`` format was requested).
+
+Every route waits an injectable latency (plus jitter) before answering;
+streamed completions also wait between chunks. ``GET /stats`` returns call
+counts per route and ``POST /stats/reset`` clears them.
+
+Recording
+---------
+With ``--record FILE``, AniList queries that miss the fixtures are proxied
+to the real API and appended to *FILE*, which can then be replayed with
+``--fixtures FILE``.
+
+Usage::
+
+    python benchmarks/stub_server.py --port 8799 --anilist-latency-ms 250 --openai-latency-ms 900
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from src.cache import make_key
+from src.filter_extractor import extract_filters
+from src.payload import decode_lines
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+_GENRES: List[str] = json.load(open(os.path.join(parent_dir, "genres.json")))
+_TAGS: List[str] = json.load(open(os.path.join(parent_dir, "tags.json")))
+_SEASONS = ("WINTER", "SPRING", "SUMMER", "FALL")
+_FORMATS = ("TV", "TV", "TV", "MOVIE", "ONA", "OVA")
+
+# Size of the synthetic catalog; big enough that tag/genre filters still match.
+_UNIVERSE_SIZE: int = 6000
+_RECOMMENDATION_COUNT: int = 5
+
+
+class StubConfig:
+    """Latency model and fixture locations shared by the route handlers."""
+
+    def __init__(
+        self,
+        anilist_latency_ms: float = 0.0,
+        openai_latency_ms: float = 0.0,
+        openai_chunk_ms: float = 0.0,
+        jitter: float = 0.0,
+        fixtures: Optional[str] = None,
+        record: Optional[str] = None,
+        upstream: str = "https://graphql.anilist.co",
+        seed: int = 7,
+    ) -> None:
+        self.anilist_latency_ms = anilist_latency_ms
+        self.openai_latency_ms = openai_latency_ms
+        self.openai_chunk_ms = openai_chunk_ms
+        self.jitter = jitter
+        self.record = record
+        self.upstream = upstream
+        self.seed = seed
+        self.fixtures = _load_fixtures(fixtures) if fixtures else {}
+
+    def delay_s(self, latency_ms: float) -> float:
+        if latency_ms <= 0:
+            return 0.0
+        spread = latency_ms * self.jitter
+        return max(0.0, random.uniform(latency_ms - spread, latency_ms + spread)) / 1000.0
+
+
+def _load_fixtures(path: str) -> Dict[str, Dict[str, Any]]:
+    fixtures = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                entry = json.loads(line)
+                fixtures[entry["key"]] = entry["response"]
+    return fixtures
+
+# --------------------------------------------------------------------------- #
+#  Synthetic AniList catalog
+# --------------------------------------------------------------------------- #
+
+class SyntheticCatalog:
+    """Deterministic fake media, filterable like AniList's ``Page.media``."""
+
+    def __init__(self, size: int = _UNIVERSE_SIZE, seed: int = 7) -> None:
+        rng = random.Random(seed)
+        self.media = [self._make(i, rng) for i in range(1, size + 1)]
+        self._extra: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _make(media_id: int, rng: random.Random, title: Optional[str] = None) -> Dict[str, Any]:
+        tags = rng.sample(_TAGS, 8)
+        return {
+            "id": media_id,
+            "title": {
+                "romaji": title or f"Gisei Anime {media_id}",
+                "english": title or (f"Synthetic Anime {media_id}" if media_id % 3 else None),
+            },
+            "genres": rng.sample(_GENRES, rng.randint(2, 4)),
+            "tags": [
+                {"id": _TAGS.index(name), "name": name, "rank": rng.randint(20, 100),
+                 "isMediaSpoiler": rng.random() < 0.1}
+                for name in tags
+            ],
+            "averageScore": None if media_id % 19 == 0 else rng.randint(35, 92),
+            "episodes": rng.choice((1, 12, 13, 24, 25, 50)),
+            "format": rng.choice(_FORMATS),
+            "status": "FINISHED",
+            "season": rng.choice(_SEASONS),
+            "seasonYear": rng.randint(1985, 2026),
+            "popularity": rng.randint(100, 800_000),
+            "coverImage": {"medium": f"https://s4.anilist.co/file/anilistcdn/media/anime/cover/small/bx{media_id}.jpg"},
+        }
+
+    def page(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one ``Page(page, perPage) { media(...) }`` selection."""
+        matches = [m for m in self.media if self._matches(m, variables)]
+        search = variables.get("search")
+        if search and not matches:
+            matches = [self._title_match(search)]
+        sort = variables.get("sort") or ["POPULARITY_DESC"]
+        sort = sort[0] if isinstance(sort, list) else sort
+        if sort.startswith("SCORE"):
+            matches.sort(key=lambda m: m["averageScore"] or 0, reverse=sort.endswith("_DESC"))
+        elif sort.startswith("POPULARITY"):
+            matches.sort(key=lambda m: m["popularity"], reverse=sort.endswith("_DESC"))
+
+        page = int(variables.get("page") or 1)
+        per_page = int(variables.get("perPage") or 20)
+        start = (page - 1) * per_page
+        return {
+            "pageInfo": {
+                "total": len(matches),
+                "currentPage": page,
+                "lastPage": max(1, -(-len(matches) // per_page)),
+                "hasNextPage": start + per_page < len(matches),
+                "perPage": per_page,
+            },
+            "media": matches[start:start + per_page],
+        }
+
+    @staticmethod
+    def _matches(media: Dict[str, Any], variables: Dict[str, Any]) -> bool:
+        search = variables.get("search")
+        if search:
+            needle = search.lower()
+            titles = [t.lower() for t in media["title"].values() if t]
+            if not any(needle in t for t in titles):
+                return False
+        if variables.get("season") and media["season"] != variables["season"]:
+            return False
+        if variables.get("seasonYear") and media["seasonYear"] != variables["seasonYear"]:
+            return False
+        if variables.get("genre") and variables["genre"] not in media["genres"]:
+            return False
+        # AniList's genre_in / tag_in: media must carry every listed value.
+        if variables.get("genres") and not set(variables["genres"]) <= set(media["genres"]):
+            return False
+        if variables.get("tags"):
+            names = {t["name"] for t in media["tags"]}
+            if not set(variables["tags"]) <= names:
+                return False
+        return True
+
+    def _title_match(self, title: str) -> Dict[str, Any]:
+        """A stable media for a title the synthetic catalog doesn't contain."""
+        with self._lock:
+            media = self._extra.get(title.lower())
+            if media is None:
+                rng = random.Random(title.lower())
+                media_id = 100_000 + rng.randint(0, 899_999)
+                media = self._extra[title.lower()] = self._make(media_id, rng, title=title)
+            return media
+
+
+_BATCH_ALIAS_RE = re.compile(r"\b(t\d+)\s*:\s*Page\b")
+_BATCH_SEARCH_RE = re.compile(r"media\(search:\s*\$(s\d+)")
+
+
+def answer_graphql(catalog: SyntheticCatalog, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Synthesize the ``data`` payload for *query*, single or aliased batch."""
+    aliases = _BATCH_ALIAS_RE.findall(query)
+    if not aliases:
+        return {"data": {"Page": catalog.page(variables)}}
+    data = {}
+    for alias, var in zip(aliases, _BATCH_SEARCH_RE.findall(query)):
+        data[alias] = catalog.page({
+            "search": variables.get(var),
+            "sort": variables.get("sort"),
+            "page": 1,
+            "perPage": variables.get("perPage", 1),
+        })
+    return {"data": data}
+
+# --------------------------------------------------------------------------- #
+#  Canned OpenAI answers
+# --------------------------------------------------------------------------- #
+
+_USER_REQUEST_RE = re.compile(r"USER_REQUEST:\s*\n(.*?)\n", re.S)
+_FILTERS_RE = re.compile(r"FILTERS \(AnimeSearchParams JSON\):\s*\n(\{.*?\})\s*\n", re.S)
+_CONTEXT_RE = re.compile(r"context you're working with:\s*\n(\{.*?\})", re.S)
+_ARRAY_COUNT_RE = re.compile(r"JSON array of (\d+) strings")
+_ANALYZER_TAGS_RE = re.compile(r"and the tags (\[.*\])\s*$", re.S)
+_OBSERVED_MEDIA_RE = re.compile(
+    r"'romaji': '([^']*)', 'english': (?:None|'([^']*)').*?'medium': '([^']*)'", re.S
+)
+
+
+def classify(messages: List[Dict[str, Any]]) -> str:
+    """Which pipeline stage sent this chat completion."""
+    text = _messages_text(messages)
+    if "validates against AnimeSearchParams" in text:
+        return "mapper"
+    if "one-sentence justification of why it fits" in text:
+        return "describe"
+    if "search_anime" in text:
+        return "researcher"
+    return "other"
+
+
+def _messages_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def chat_answer(stage: str, messages: List[Dict[str, Any]]) -> str:
+    text = _messages_text(messages)
+    if stage == "mapper":
+        match = _USER_REQUEST_RE.search(text)
+        params = extract_filters(match.group(1) if match else "").params
+        return "Thought: I now know the filters.\nFinal Answer: " + params.model_dump_json(exclude_none=True)
+    if stage == "describe":
+        match = _ARRAY_COUNT_RE.search(text)
+        count = int(match.group(1)) if match else _RECOMMENDATION_COUNT
+        return json.dumps([f"Pick {i + 1} matches the requested genres and mood." for i in range(count)])
+    if stage == "researcher":
+        # CrewAI feeds tool results back as assistant turns ending in "Observation: ...".
+        observed = _messages_text([m for m in messages if m.get("role") == "assistant"])
+        if "Observation:" in observed:
+            return "Thought: I now know the final answer.\nFinal Answer: " + json.dumps(_observed_items(observed))
+        return (
+            "Thought: I should search AniList with the user's filters.\n"
+            "Action: search_anime\n"
+            "Action Input: " + json.dumps(_tool_input(text))
+        )
+    return "OK"
+
+
+def _tool_input(text: str) -> Dict[str, Any]:
+    match = _FILTERS_RE.search(text) or _CONTEXT_RE.search(text)
+    try:
+        params = json.loads(match.group(1)) if match else {}
+    except json.JSONDecodeError:
+        params = {}
+    params = {k: v for k, v in params.items() if v is not None}
+    if isinstance(params.get("sort"), str):
+        params["sort"] = [params["sort"]]
+    return params
+
+
+def _observed_items(text: str) -> List[Dict[str, str]]:
+    """The first results of the last tool observation, in any payload mode."""
+    observation = text.rsplit("Observation:", 1)[-1]
+    found = [(english or romaji, cover) for romaji, english, cover in _OBSERVED_MEDIA_RE.findall(observation)]
+    if not found:
+        try:
+            rows = json.loads(observation[observation.index("["):observation.rindex("]") + 1])
+        except ValueError:
+            rows = decode_lines(observation)
+        found = [(row.get("title"), row.get("cover")) for row in rows if isinstance(row, dict)]
+    return [
+        {"title": title, "description": "Matches the requested filters.", "image_url": cover}
+        for title, cover in found[:_RECOMMENDATION_COUNT]
+        if title and cover
+    ]
+
+
+def analyzer_answer(prompt: str, structured: bool = False) -> str:
+    match = _ANALYZER_TAGS_RE.search(prompt)
+    try:
+        tags = ast.literal_eval(match.group(1)) if match else []
+    except (ValueError, SyntaxError):
+        tags = []
+    if structured:
+        return json.dumps({"tags": list(tags[:3])})
+    return repr(list(tags[:3]))
+
+
+def _usage(prompt: str, completion: str) -> Dict[str, int]:
+    # ~4 characters per token is close enough for throughput bookkeeping.
+    prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(completion) // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+# --------------------------------------------------------------------------- #
+#  Application
+# --------------------------------------------------------------------------- #
+
+def create_app(config: StubConfig) -> Starlette:
+    catalog = SyntheticCatalog(seed=config.seed)
+    calls: Counter = Counter()
+    record_lock = threading.Lock()
+
+    async def graphql(request: Request) -> Response:
+        body = await request.json()
+        query, variables = body.get("query", ""), body.get("variables") or {}
+        key = make_key(query, variables)
+        await asyncio.sleep(config.delay_s(config.anilist_latency_ms))
+
+        payload = config.fixtures.get(key)
+        if payload is not None:
+            calls["anilist.replayed"] += 1
+        elif config.record:
+            calls["anilist.recorded"] += 1
+            payload = await _proxy(config.upstream, body)
+            with record_lock, open(config.record, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"key": key, "response": payload}) + "\n")
+            config.fixtures[key] = payload
+        else:
+            calls["anilist.synthetic"] += 1
+            payload = answer_graphql(catalog, query, variables)
+        return JSONResponse(payload)
+
+    async def chat_completions(request: Request) -> Response:
+        body = await request.json()
+        messages = body.get("messages") or []
+        stage = classify(messages)
+        calls[f"openai.{stage}"] += 1
+        answer = chat_answer(stage, messages)
+        model = body.get("model", "gpt-4.1")
+        completion_id = "chatcmpl-" + uuid.uuid4().hex[:24]
+        await asyncio.sleep(config.delay_s(config.openai_latency_ms))
+
+        if body.get("stream"):
+            return StreamingResponse(
+                _sse_chunks(config, completion_id, model, answer),
+                media_type="text/event-stream",
+            )
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(_messages_text(messages), answer),
+        })
+
+    async def responses(request: Request) -> Response:
+        body = await request.json()
+        prompt = body.get("input") if isinstance(body.get("input"), str) else json.dumps(body.get("input"))
+        calls["openai.analyzer"] += 1
+        # A json_schema text format asks for {"tags": [...]}, as the real model returns.
+        structured = ((body.get("text") or {}).get("format") or {}).get("type") == "json_schema"
+        answer = analyzer_answer(prompt, structured)
+        await asyncio.sleep(config.delay_s(config.openai_latency_ms))
+        usage = _usage(prompt, answer)
+        return JSONResponse({
+            "id": "resp_" + uuid.uuid4().hex[:24],
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model", "gpt-4.1"),
+            "status": "completed",
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "output": [{
+                "type": "message",
+                "id": "msg_" + uuid.uuid4().hex[:24],
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": answer, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": usage["prompt_tokens"],
+                "output_tokens": usage["completion_tokens"],
+                "total_tokens": usage["total_tokens"],
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        })
+
+    async def stats(request: Request) -> Response:
+        if request.method == "POST":
+            calls.clear()
+        return JSONResponse(dict(calls))
+
+    async def healthz(request: Request) -> Response:
+        return JSONResponse({"status": "ok"})
+
+    return Starlette(routes=[
+        Route("/graphql", graphql, methods=["POST"]),
+        Route("/", graphql, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/responses", responses, methods=["POST"]),
+        Route("/stats", stats, methods=["GET"]),
+        Route("/stats/reset", stats, methods=["POST"]),
+        Route("/healthz", healthz, methods=["GET"]),
+    ])
+
+
+async def _sse_chunks(config: StubConfig, completion_id: str, model: str, answer: str) -> AsyncIterator[str]:
+    created = int(time.time())
+
+    def event(delta: Dict[str, Any], finish_reason: Optional[str]) -> str:
+        return "data: " + json.dumps({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }) + "\n\n"
+
+    yield event({"role": "assistant", "content": ""}, None)
+    # Roughly token-sized pieces, paced like a real stream.
+    for piece in re.findall(r"\s*\S{1,6}", answer):
+        await asyncio.sleep(config.delay_s(config.openai_chunk_ms))
+        yield event({"content": piece}, None)
+    yield event({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+async def _proxy(upstream: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    import httpx
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        resp = await client.post(upstream, json=body)
+        return resp.json()
+
+# --------------------------------------------------------------------------- #
+#  CLI
+# --------------------------------------------------------------------------- #
+
+def add_latency_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--anilist-latency-ms", type=float, default=150.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=600.0,
+                        help="time to first byte of every completion")
+    parser.add_argument("--openai-chunk-ms", type=float, default=15.0,
+                        help="delay between streamed chunks")
+    parser.add_argument("--jitter", type=float, default=0.2,
+                        help="uniform ± fraction applied to every delay")
+    parser.add_argument("--fixtures", help="JSONL of recorded AniList responses to replay")
+    parser.add_argument("--record", help="proxy AniList misses upstream and append them to this JSONL")
+    parser.add_argument("--seed", type=int, default=7, help="synthetic catalog seed")
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        anilist_latency_ms=args.anilist_latency_ms,
+        openai_latency_ms=args.openai_latency_ms,
+        openai_chunk_ms=args.openai_chunk_ms,
+        jitter=args.jitter,
+        fixtures=args.fixtures,
+        record=args.record,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve stub AniList and OpenAI endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,67 @@
 # File: /Users/tirsolopezausens/Documents/osusume/service.py
 
+from __future__ import annotations
+
 import os
 import json
-from typing import List
+import asyncio
+import time
+import logging
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 from pydantic import BaseModel, AnyHttpUrl
-from crewai import Agent, Crew, Task, Process, LLM
 from src.request_parser import AnimeSearchParams, OFFICIAL_GENRES
-from src.recommender import SearchAnimeTool
+from src.filter_extractor import FAST_PATH_MIN_CONFIDENCE, extract_filters
+from src.ranking import rank_candidates
+from src.semantic_cache import get_result_cache
+from src.structured import StructuredOutputError, parse_list, parse_object, repair_fields
+from src.tracing import record_span, span, traced
+from src.vocabulary import snap_params
+
+# crewai and litellm take seconds to import; they are loaded on first use
+# so importing this module (API/UI workers starting up) stays fast.
+if TYPE_CHECKING:
+    from crewai import Agent, Crew, Task
+
+# "crew" runs the researcher agent; "direct" calls the search tool itself.
+_PIPELINE: str = os.getenv("OSUSUME_PIPELINE", "crew")
+# Direct-mode descriptions: "llm" (one batched call), "template", or "auto"
+# (LLM only when the mapper was skipped, so a request costs at most one call).
+_DIRECT_DESCRIPTIONS: str = os.getenv("OSUSUME_DIRECT_DESCRIPTIONS", "auto")
+_RECOMMENDATION_COUNT: int = 5
+# Candidate pool the direct pipeline re-ranks locally (pages of 50 from AniList).
+_DIRECT_CANDIDATES: int = int(os.getenv("OSUSUME_DIRECT_CANDIDATES", 50))
+
+_MAP_REQUEST_DESCRIPTION: str = (
+    "USER_REQUEST:\n"
+    "{user_request}\n\n"
+    "Produce **one JSON object** that validates against AnimeSearchParams.\n"
+    "Rules:\n"
+    f"• Only items in this list may appear in `genres`: {OFFICIAL_GENRES}.\n"
+    "• Any other descriptive phrase (moods, sub-genres like 'School Life', adjectives like 'Wholesome') must go into `tags`.\n"
+    "• Title-case every word (e.g. 'school-life' → 'School Life').\n"
+    "• Omit every key whose value would be null."
+)
+_RECOMMENDATION_DESCRIPTION: str = (
+    "Using the `search_anime` tool, find five anime matching the user's filters.\n"
+    "For each result, extract three fields:\n"
+    "  - `title`: English if available, else Romaji\n"
+    "  - `description`: a one-sentence justification\n"
+    "  - `image_url`: the anime's cover image URL, copied exactly\n"
+    "Return **only** a JSON array of objects, e.g. "
+    "[{\"title\":\"X\",\"description\":\"Y\",\"image_url\":\"Z\"}, ...]"
+)
+
+# Span names for each crew task's run time, by agent role.
+_CREW_STAGES = {"Filter extractor": "mapper", "Anime Researcher": "researcher"}
+
+_FORMAT_NOUNS = {
+    "TV": "series", "TV_SHORT": "short series", "MOVIE": "film",
+    "SPECIAL": "special", "OVA": "OVA", "ONA": "ONA", "MUSIC": "music video",
+}
+
+logger = logging.getLogger(__name__)
 
 
 class RecommendationItem(BaseModel):
@@ -15,94 +70,686 @@ class RecommendationItem(BaseModel):
     image_url: AnyHttpUrl
 
 
-class service:
-    anime_tool = SearchAnimeTool()
-    llm = LLM(
+class _JsonArrayStream:
+    """
+    Incremental parser that returns each string element of a streamed JSON
+    array as soon as its closing quote arrives.
+    """
+
+    _decoder = json.JSONDecoder()
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = -1
+        self.closed = False
+
+    def feed(self, fragment: str) -> List[str]:
+        self._buf += fragment
+        if self._pos < 0:
+            start = self._buf.find("[")
+            if start < 0:
+                return []
+            self._pos = start + 1
+
+        out: List[str] = []
+        while not self.closed:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n,":
+                self._pos += 1
+            if self._pos >= len(self._buf):
+                break
+            if self._buf[self._pos] == "]":
+                self.closed = True
+                break
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                break  # element still incomplete
+            if not isinstance(value, str):
+                self.closed = True
+                break
+            out.append(value)
+            self._pos = end
+        return out
+
+
+class _StreamMetrics:
+    """
+    Time-to-first-card and total time of recent recommendation streams.
+    """
+
+    def __init__(self, window: int = 512) -> None:
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.empty = 0
+        self._first_card_s: deque = deque(maxlen=window)
+        self._total_s: deque = deque(maxlen=window)
+
+    def record(self, first_card_s: Optional[float], total_s: float) -> None:
+        with self._lock:
+            self.streams += 1
+            self._total_s.append(total_s)
+            if first_card_s is None:
+                self.empty += 1
+            else:
+                self._first_card_s.append(first_card_s)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            first = sorted(self._first_card_s)
+            total = list(self._total_s)
+            snapshot: Dict[str, Any] = {"streams": self.streams, "empty": self.empty}
+
+        def pct(values: List[float], q: float) -> Optional[float]:
+            return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+        snapshot["first_card_s_p50"] = pct(first, 0.50)
+        snapshot["first_card_s_p95"] = pct(first, 0.95)
+        snapshot["first_card_s_max"] = first[-1] if first else None
+        snapshot["total_s_mean"] = sum(total) / len(total) if total else None
+        return snapshot
+
+
+_stream_metrics = _StreamMetrics()
+
+
+class _StreamTimer:
+    __slots__ = ("started", "first_card_s")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.first_card_s: Optional[float] = None
+
+    def tick(self) -> None:
+        if self.first_card_s is None:
+            self.first_card_s = time.perf_counter() - self.started
+
+    def finish(self) -> None:
+        _stream_metrics.record(self.first_card_s, time.perf_counter() - self.started)
+
+
+class _Shared:
+    """
+    Class attribute built by factory on first access, then shared by every
+    instance (and by the class itself).
+    """
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        self._factory = factory
+        self._value: Any = None
+        self._lock = threading.Lock()
+
+    def __get__(self, obj: Any, owner: type) -> Any:
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+        return self._value
+
+
+def _make_llm():
+    from crewai import LLM
+
+    return LLM(
         model="gpt-4.1",
         api_key=os.getenv("OPENAI_API_KEY"),
         max_tokens=2000,
         temperature=0
     )
 
+
+def _make_anime_tool():
+    from src.recommender import SearchAnimeTool
+
+    return SearchAnimeTool()
+
+
+class service:
+    pipeline = _PIPELINE
+    anime_tool = _Shared(_make_anime_tool)
+    llm = _Shared(_make_llm)
+
+    # Agents and Tasks keep per-run state (task outputs, agent executors), so
+    # every crew gets fresh instances; only the LLM and the tool are shared.
+
+    def warm_up(self) -> None:
+        """
+        Do the slow imports and build the shared LLM and tool now rather than
+        on the first request.
+        """
+        import litellm  # noqa: F401
+        from crewai import Agent, Crew, Task  # noqa: F401
+        _ = (self.llm, self.anime_tool)
+
     # Step 1: extract filters from user request
-    mapper = Agent(
-        name="AniListRequestMapper",
-        role="Filter extractor",
-        goal="Return only the filters in the user's request as minimal JSON.",
-        backstory="An anime librarian who knows the difference between genres and tags.",
-        allow_delegation=False,
-        llm=llm
-    )
-    map_request = Task(
-        description=(
-            "USER_REQUEST:\n"
-            "{user_request}\n\n"
-            "Produce **one JSON object** that validates against AnimeSearchParams.\n"
-            "Rules:\n"
-            f"• Only items in this list may appear in `genres`: {OFFICIAL_GENRES}.\n"
-            "• Any other descriptive phrase (moods, sub-genres like 'School Life', adjectives like 'Wholesome') must go into `tags`.\n"
-            "• Title-case every word (e.g. 'school-life' → 'School Life').\n"
-            "• Omit every key whose value would be null."
-        ),
-        expected_output="A JSON dict with only the mentioned filters, no nulls.",
-        output_json=AnimeSearchParams,
-        agent=mapper
-    )
+    def mapper(self) -> Agent:
+        from crewai import Agent
+
+        return Agent(
+            name="AniListRequestMapper",
+            role="Filter extractor",
+            goal="Return only the filters in the user's request as minimal JSON.",
+            backstory="An anime librarian who knows the difference between genres and tags.",
+            allow_delegation=False,
+            llm=self.llm
+        )
+
+    def map_request(self, agent: Agent) -> Task:
+        from crewai import Task
+
+        return Task(
+            description=_MAP_REQUEST_DESCRIPTION,
+            expected_output="A JSON dict with only the mentioned filters, no nulls.",
+            output_json=AnimeSearchParams,
+            agent=agent
+        )
 
     # Step 2: retrieve recommendations including cover image URL
-    anime_researcher = Agent(
-        role="Anime Researcher",
-        goal="Find anime that match a user query, using search_anime tool and return JSON.",
-        backstory="You are a seasoned anime critic.",
-        tools=[anime_tool],
-        llm=llm
-    )
-    recommendation_task = Task(
-        description=(
-            "Using the `search_anime` tool, find five anime matching the user's filters.\n"
-            "For each result, extract three fields:\n"
-            "  - `title`: English if available, else Romaji\n"
-            "  - `description`: a one-sentence justification\n"
-            "  - `image_url`: the `coverImage.medium` URL\n"
-            "Return **only** a JSON array of objects, e.g. "
-            "[{\"title\":\"X\",\"description\":\"Y\",\"image_url\":\"Z\"}, ...]"
-        ),
-        expected_output="A JSON array string matching list of recommendations",
-        agent=anime_researcher,
-        llm=llm
-    )
+    def anime_researcher(self) -> Agent:
+        from crewai import Agent
 
-    def build_crew(self) -> Crew:
+        return Agent(
+            role="Anime Researcher",
+            goal="Find anime that match a user query, using search_anime tool and return JSON.",
+            backstory="You are a seasoned anime critic.",
+            tools=[self.anime_tool],
+            llm=self.llm
+        )
+
+    def recommendation_task(self, agent: Agent, with_filters: bool = False) -> Task:
+        """
+        with_filters: the filters were extracted locally and are passed as the
+        `search_params` input instead of coming from the mapper task.
+        """
+        from crewai import Task
+
+        description = _RECOMMENDATION_DESCRIPTION
+        if with_filters:
+            description = (
+                "USER_REQUEST:\n"
+                "{user_request}\n\n"
+                "FILTERS (AnimeSearchParams JSON):\n"
+                "{search_params}\n\n"
+                + description
+            )
+        return Task(
+            description=description,
+            expected_output="A JSON array string matching list of recommendations",
+            agent=agent,
+            llm=self.llm
+        )
+
+    def build_crew(self, fast_path: bool = False) -> Crew:
+        from crewai import Crew, Process
+
+        researcher = self.anime_researcher()
+        if fast_path:
+            return Crew(
+                agents=[researcher],
+                tasks=[self.recommendation_task(researcher, with_filters=True)],
+                process=Process.sequential
+            )
+        mapper = self.mapper()
+        return Crew(
+            agents=[mapper, researcher],
+            tasks=[self.map_request(mapper), self.recommendation_task(researcher)],
+            process=Process.sequential
+        )
+
+    def build_mapper_crew(self) -> Crew:
+        from crewai import Crew, Process
+
+        mapper = self.mapper()
         return Crew(
-            agents=[self.mapper, self.anime_researcher],
-            tasks=[self.map_request, self.recommendation_task],
+            agents=[mapper],
+            tasks=[self.map_request(mapper)],
             process=Process.sequential
         )
 
+    def _plan(self, user_request: str) -> Tuple[Crew, Dict[str, Any]]:
+        """
+        Pick the crew for a request: skip the mapper agent when the local
+        filter extractor is confident, otherwise run the full pipeline.
+        """
+        with span("filters"):
+            extraction = extract_filters(user_request)
+        if extraction.confidence >= FAST_PATH_MIN_CONFIDENCE:
+            logger.debug("Fast-path filters (%.2f): %s", extraction.confidence, extraction.matched)
+            return self.build_crew(fast_path=True), {
+                "user_request": user_request,
+                "search_params": extraction.params.model_dump_json(exclude_none=True),
+            }
+        return self.build_crew(), {"user_request": user_request}
+
     def get_recommendations(self, user_request: str) -> List[RecommendationItem]:
         """
-        Execute the Crew pipeline, parse its raw JSON output, and return typed items.
+        Execute the configured pipeline and return typed items.
+        Paraphrases of a recent request are served from the semantic cache.
         """
-        crew_output = self.build_crew().kickoff(
-            inputs={"user_request": user_request}
-        )  # CrewOutput
+        return list(self.stream_recommendations(user_request))
+
+    async def get_recommendations_async(self, user_request: str) -> List[RecommendationItem]:
+        """
+        Async variant of get_recommendations for event-loop callers (Gradio, ASGI).
+        """
+        return [item async for item in self.stream_recommendations_async(user_request)]
+
+    def stream_recommendations(self, user_request: str) -> Iterator[RecommendationItem]:
+        """
+        Yield each RecommendationItem as soon as it is ready. The direct pipeline
+        yields a card per streamed description; the crew pipeline can only
+        yield once its final answer arrives.
+        """
+        timer = _StreamTimer()
+        try:
+            with span("request", pipeline=self.pipeline) as s:
+                cached = self._cached_recommendations(user_request)
+                s.cache_hit(cached is not None)
+                if cached is not None:
+                    for item in cached:
+                        timer.tick()
+                        yield item
+                    return
+
+                if self.pipeline == "direct":
+                    source = self._direct_stream(user_request)
+                else:
+                    source = iter(self._run_crew(user_request))
+                items = []
+                for item in source:
+                    timer.tick()
+                    items.append(item)
+                    yield item
+                self._remember_recommendations(user_request, items)
+        finally:
+            timer.finish()
+
+    async def stream_recommendations_async(self, user_request: str) -> AsyncIterator[RecommendationItem]:
+        """
+        Async variant of stream_recommendations.
+        """
+        timer = _StreamTimer()
+        try:
+            with span("request", pipeline=self.pipeline) as s:
+                cached = self._cached_recommendations(user_request)
+                s.cache_hit(cached is not None)
+                if cached is not None:
+                    for item in cached:
+                        timer.tick()
+                        yield item
+                    return
+
+                items = []
+                if self.pipeline == "direct":
+                    async for item in self._adirect_stream(user_request):
+                        timer.tick()
+                        items.append(item)
+                        yield item
+                else:
+                    for item in await self._arun_crew(user_request):
+                        timer.tick()
+                        items.append(item)
+                        yield item
+                self._remember_recommendations(user_request, items)
+        finally:
+            timer.finish()
+
+    def _run_crew(self, user_request: str) -> List[RecommendationItem]:
+        crew, inputs = self._plan(user_request)
+        with span("crew") as s:
+            crew_output = crew.kickoff(inputs=inputs)  # CrewOutput
+            self._trace_crew(s, crew, crew_output)
 
         # debug
         # print(crew_output)
 
+        return self._parse_crew_output(crew_output)
+
+    async def _arun_crew(self, user_request: str) -> List[RecommendationItem]:
+        crew, inputs = self._plan(user_request)
+        with span("crew") as s:
+            crew_output = await crew.kickoff_async(inputs=inputs)  # CrewOutput
+            self._trace_crew(s, crew, crew_output)
+        # Repairs may call AniList or the LLM; keep them off the event loop.
+        return await asyncio.to_thread(self._parse_crew_output, crew_output)
+
+    @staticmethod
+    def _trace_crew(s, crew: Crew, crew_output) -> None:
+        """
+        Put the crew's token usage on span s and record each task's run time
+        as a child span (mapper / researcher).
+        """
+        if not s.recording:
+            return
+        usage = getattr(crew_output, "token_usage", None)
+        if usage is not None:
+            s.tokens(usage.prompt_tokens, usage.completion_tokens)
+        for task in crew.tasks:
+            if task.start_time and task.end_time:
+                record_span(
+                    _CREW_STAGES.get(task.agent.role, "task"),
+                    task.start_time.timestamp(),
+                    task.end_time.timestamp(),
+                )
+
+    @staticmethod
+    def _cached_recommendations(user_request: str) -> Optional[List[RecommendationItem]]:
+        cache = get_result_cache()
+        hit = cache.get(user_request) if cache is not None else None
+        if hit is None:
+            return None
+        return [RecommendationItem(**item) for item in hit]
+
+    @staticmethod
+    def _remember_recommendations(user_request: str, items: List[RecommendationItem]) -> None:
+        cache = get_result_cache()
+        if cache is not None and items:
+            cache.set(user_request, [item.model_dump(mode="json") for item in items])
+
+    # ------------------------------------------------------------------ #
+    #  Direct pipeline: no researcher agent, at most one LLM round trip
+    # ------------------------------------------------------------------ #
+
+    def _direct_stream(self, user_request: str) -> Iterator[RecommendationItem]:
+        """
+        Resolve filters (locally or via the mapper), call search_anime directly,
+        rank the candidates locally and yield each pick once it is described.
+        """
+        params, mapper_used = self._resolve_params(user_request)
+        candidates = self.anime_tool._run(**self._tool_args(params))
+        picks = self._rank_candidates(candidates, params)
+
+        done = 0
+        if picks and self._describe_with_llm(mapper_used):
+            try:
+                for description in self._stream_descriptions(user_request, picks):
+                    yield self._build_item(picks[done], params, description)
+                    done += 1
+                    if done == len(picks):
+                        break
+            except Exception as e:
+                logger.warning("Description call failed, falling back to templates: %s", e)
+        for media in picks[done:]:
+            yield self._build_item(media, params)
+
+    async def _adirect_stream(self, user_request: str) -> AsyncIterator[RecommendationItem]:
+        """
+        Async _direct_stream; the tool runs on its native async path.
+        """
+        params, mapper_used = await self._aresolve_params(user_request)
+        candidates = await self.anime_tool._arun(**self._tool_args(params))
+        picks = self._rank_candidates(candidates, params)
+
+        done = 0
+        if picks and self._describe_with_llm(mapper_used):
+            try:
+                async for description in self._astream_descriptions(user_request, picks):
+                    yield self._build_item(picks[done], params, description)
+                    done += 1
+                    if done == len(picks):
+                        break
+            except Exception as e:
+                logger.warning("Description call failed, falling back to templates: %s", e)
+        for media in picks[done:]:
+            yield self._build_item(media, params)
+
+    def _resolve_params(self, user_request: str) -> Tuple[AnimeSearchParams, bool]:
+        """
+        Return the request's filters and whether the mapper agent was needed.
+        """
+        with span("filters"):
+            extraction = extract_filters(user_request)
+        if extraction.confidence >= FAST_PATH_MIN_CONFIDENCE:
+            return extraction.params, False
+        crew = self.build_mapper_crew()
+        with span("crew") as s:
+            crew_output = crew.kickoff(inputs={"user_request": user_request})
+            self._trace_crew(s, crew, crew_output)
+        return self._parse_mapper_output(crew_output), True
+
+    async def _aresolve_params(self, user_request: str) -> Tuple[AnimeSearchParams, bool]:
+        with span("filters"):
+            extraction = extract_filters(user_request)
+        if extraction.confidence >= FAST_PATH_MIN_CONFIDENCE:
+            return extraction.params, False
+        crew = self.build_mapper_crew()
+        with span("crew") as s:
+            crew_output = await crew.kickoff_async(inputs={"user_request": user_request})
+            self._trace_crew(s, crew, crew_output)
+        return await asyncio.to_thread(self._parse_mapper_output, crew_output), True
+
+    @staticmethod
+    @traced("parse")
+    def _parse_mapper_output(crew_output) -> AnimeSearchParams:
+        """
+        Turn the mapper crew's output into validated AnimeSearchParams.
+        Broken filters are repaired or left out (see src.structured).
+        """
+        data = getattr(crew_output, "json_dict", None)
+        if data is not None:
+            data = {k: v for k, v in data.items() if v is not None}
+        raw = getattr(crew_output, "raw", None) or ""
+        repairs = [
+            service._fix_season,
+            lambda record, errors: repair_fields(
+                record, errors, AnimeSearchParams, service._repair_request(), context=raw
+            ),
+        ]
+        try:
+            params = parse_object(
+                data if data is not None else raw, AnimeSearchParams, stage="mapper", repair=repairs
+            )
+        except StructuredOutputError as e:
+            raise RuntimeError(f"Failed to parse mapper JSON: {e}")
+        # The mapper's genre/tag names are often near misses ("School Life").
+        return snap_params(params)
+
+    @staticmethod
+    def _tool_args(params: AnimeSearchParams) -> Dict[str, Any]:
+        """
+        Map AnimeSearchParams onto search_anime arguments, with room to rank.
+        """
+        args = params.model_dump(exclude_none=True)
+        if isinstance(args.get("sort"), str):
+            args["sort"] = [args["sort"]]
+        args.setdefault("limit", _DIRECT_CANDIDATES)
+        return args
+
+    @staticmethod
+    def _rank_candidates(
+        candidates: List[Dict[str, Any]], params: AnimeSearchParams, k: int = _RECOMMENDATION_COUNT
+    ) -> List[Dict[str, Any]]:
+        """
+        Pick the top k locally (src.ranking): tag/genre match, score, recency
+        and a spoiler penalty, diversified with MMR. Titles without a cover
+        image can't be shown and are dropped.
+        """
+        with span("rank"):
+            return rank_candidates(candidates, params, k)
+
+    def _stream_descriptions(self, user_request: str, picks: List[Dict[str, Any]]) -> Iterator[str]:
+        """
+        One batched, streamed LLM call; yields each description as it completes.
+        """
+        import litellm
+
+        request = self._description_request(user_request, picks)
+        parser = _JsonArrayStream()
+        with span("describe") as s:
+            received = []
+            try:
+                for chunk in litellm.completion(**request):
+                    fragment = chunk.choices[0].delta.content or ""
+                    received.append(fragment)
+                    yield from parser.feed(fragment)
+                    if parser.closed:
+                        return
+            finally:
+                self._trace_description(s, request, received)
+
+    async def _astream_descriptions(
+        self, user_request: str, picks: List[Dict[str, Any]]
+    ) -> AsyncIterator[str]:
+        import litellm
+
+        request = self._description_request(user_request, picks)
+        parser = _JsonArrayStream()
+        with span("describe") as s:
+            received = []
+            try:
+                async for chunk in await litellm.acompletion(**request):
+                    fragment = chunk.choices[0].delta.content or ""
+                    received.append(fragment)
+                    for description in parser.feed(fragment):
+                        yield description
+                    if parser.closed:
+                        return
+            finally:
+                self._trace_description(s, request, received)
+
+    @staticmethod
+    def _trace_description(s, request: Dict[str, Any], received: List[str]) -> None:
+        """
+        Streamed completions carry no usage block here, so count tokens locally.
+        """
+        if not s.recording:
+            return
+        import litellm
+
+        try:
+            s.tokens(
+                litellm.token_counter(model=request["model"], messages=request["messages"]),
+                litellm.token_counter(model=request["model"], text="".join(received)),
+            )
+        except Exception:  # noqa: BLE001 - metrics must not break the stream
+            pass
+
+    def _description_request(self, user_request: str, picks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "model": self.llm.model,
+            "api_key": self.llm.api_key,
+            "temperature": self.llm.temperature,
+            "max_tokens": self.llm.max_tokens,
+            "stream": True,
+            "messages": [{"role": "user", "content": self._describe_prompt(user_request, picks)}],
+        }
+
+    @staticmethod
+    def _describe_with_llm(mapper_used: bool) -> bool:
+        if _DIRECT_DESCRIPTIONS == "auto":
+            return not mapper_used
+        return _DIRECT_DESCRIPTIONS == "llm"
+
+    @staticmethod
+    def _describe_prompt(user_request: str, picks: List[Dict[str, Any]]) -> str:
+        lines = []
+        for i, media in enumerate(picks, 1):
+            tags = [t["name"] for t in media.get("tags") or [] if not t.get("isMediaSpoiler")][:5]
+            lines.append(
+                f"{i}. {service._title_of(media)} | genres: {', '.join(media.get('genres') or [])}"
+                f" | tags: {', '.join(tags)} | score: {media.get('averageScore') or 'n/a'}"
+            )
+        return (
+            "USER_REQUEST:\n"
+            f"{user_request}\n\n"
+            "ANIME:\n" + "\n".join(lines) + "\n\n"
+            "For each anime write a one-sentence justification of why it fits the request.\n"
+            f"Return **only** a JSON array of {len(picks)} strings, in the same order."
+        )
+
+    @staticmethod
+    def _template_description(media: Dict[str, Any], params: AnimeSearchParams) -> str:
+        """
+        One sentence built from the media's genres, top tags, year and score.
+        """
+        genres = media.get("genres") or []
+        genres = [g for g in genres if g in (params.genres or [])] or genres[:2]
+        tags = sorted(
+            (t for t in media.get("tags") or [] if not t.get("isMediaSpoiler")),
+            key=lambda t: (t["name"] not in (params.tags or []), -(t.get("rank") or 0)),
+        )
+        noun = _FORMAT_NOUNS.get(media.get("format") or "", "anime")
+        text = f"{' / '.join(genres)} {noun}" if genres else noun
+        sentence = f"{'An' if text[0].lower() in 'aeiou' else 'A'} {text}"
+        if media.get("seasonYear"):
+            sentence += f" from {media['seasonYear']}"
+        if tags:
+            sentence += " with " + " and ".join(t["name"] for t in tags[:2])
+        if media.get("averageScore"):
+            sentence += f", rated {media['averageScore']}/100"
+        return sentence + "."
+
+    @staticmethod
+    def _build_item(
+        media: Dict[str, Any], params: AnimeSearchParams, description: Optional[str] = None
+    ) -> RecommendationItem:
+        return RecommendationItem(
+            title=service._title_of(media),
+            description=description or service._template_description(media, params),
+            image_url=media["coverImage"]["medium"],
+        )
+
+    @staticmethod
+    def _title_of(media: Dict[str, Any]) -> Optional[str]:
+        title = media.get("title") or {}
+        return title.get("english") or title.get("romaji")
+
+    @staticmethod
+    @traced("parse")
+    def _parse_crew_output(crew_output) -> List[RecommendationItem]:
+        """
+        Parse the Crew's raw output into typed items. The JSON array is taken
+        from any surrounding text; items with broken fields are repaired or
+        dropped (see src.structured).
+        """
         raw_json = getattr(crew_output, 'raw', None)
         if raw_json is None:
             raise RuntimeError("No raw output returned from Crew.")
 
+        repairs = [
+            service._lookup_cover,
+            lambda record, errors: repair_fields(
+                record, errors, RecommendationItem, service._repair_request(), context=raw_json
+            ),
+        ]
         try:
-            data = json.loads(raw_json)
-        except json.JSONDecodeError as e:
+            return parse_list(raw_json, RecommendationItem, stage="researcher", repair=repairs)
+        except StructuredOutputError as e:
             raise RuntimeError(f"Failed to parse recommendations JSON: {e}\nRaw: {raw_json}")
 
-        if not isinstance(data, list):
-            raise RuntimeError(f"Expected JSON array but got {type(data).__name__}: {data}")
+    @staticmethod
+    def _repair_request() -> Dict[str, Any]:
+        return {
+            "model": service.llm.model,
+            "api_key": service.llm.api_key,
+            "temperature": 0,
+            "max_tokens": 500,
+        }
+
+    @staticmethod
+    def _fix_season(record: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, Any]:
+        """'fall', 'Autumn' → FALL, without a model call."""
+        season = record.get("season")
+        if "season" not in errors or not isinstance(season, str):
+            return {}
+        season = season.strip().upper()
+        return {"season": "FALL" if season == "AUTUMN" else season}
 
-        return [RecommendationItem.parse_obj(item) for item in data]
+    @staticmethod
+    def _lookup_cover(record: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, Any]:
+        """
+        A missing or malformed image_url is the AniList cover of the titled
+        anime; the model can only guess at URLs it failed to copy.
+        """
+        title = record.get("title")
+        if "image_url" not in errors or not isinstance(title, str) or not title.strip():
+            return {}
+        from src.anilist_query_searcher import search_anime_batch
+
+        try:
+            hits = search_anime_batch([title])[0]
+        except Exception:  # noqa: BLE001 - fall through to the other repairs
+            return {}
+        cover = (hits[0].get("coverImage") or {}).get("medium") if hits else None
+        return {"image_url": cover} if cover else {}
 
 
 # Module-level helper
@@ -110,3 +757,21 @@ _service = service()
 
 def get_recommendations(user_request: str) -> List[RecommendationItem]:
     return _service.get_recommendations(user_request)
+
+async def get_recommendations_async(user_request: str) -> List[RecommendationItem]:
+    return await _service.get_recommendations_async(user_request)
+
+def stream_recommendations(user_request: str) -> Iterator[RecommendationItem]:
+    return _service.stream_recommendations(user_request)
+
+def stream_recommendations_async(user_request: str) -> AsyncIterator[RecommendationItem]:
+    return _service.stream_recommendations_async(user_request)
+
+def warm_up() -> None:
+    _service.warm_up()
+
+def stream_stats() -> Dict[str, Any]:
+    """
+    Time-to-first-card percentiles over recent streams.
+    """
+    return _stream_metrics.snapshot()
@@ -6,23 +6,133 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 import sys
 sys.path.append(parent_dir)
 
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from typing import List, Optional
 
-from openai import OpenAI
-client = OpenAI()
+from pydantic import BaseModel
 
-def get_relevant_tags_and_genres(title: str, genres: list, tags: list) -> tuple[list, list]:
-    response = client.responses.create(
-        model="gpt-4.1",
-        input="Return ONLY a python list of the 3 most relevant tags for the anime " + title + " with the genres " + str(genres) + " and the tags " + str(tags)
-    )
+from src.http_client import get_openai_async_http_client, get_openai_http_client
+from src.profile_store import get_profile_store
+from src.singleflight import SingleFlight
+from src.structured import StructuredOutputError, parse_object, text_format
+from src.tracing import span
+# Clients (and the openai package) are created on first use to keep imports fast
+_client = None
+# (pooled httpx client, AsyncOpenAI) per event loop: connections belong to their loop
+_aclients = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
 
+_MODEL = "gpt-4.1"
+_PROMPT = 'Return ONLY a JSON object {{"tags": [...]}} with the 3 most relevant tags for the anime {title} with the genres {genres} and the tags {tags}'
+
+class _RelevantTags(BaseModel):
+    tags: List[str]
+
+    model_config = {"extra": "forbid"}
+
+# Ask for a JSON object matching _RelevantTags instead of free text
+_TEXT_FORMAT = text_format(_RelevantTags, "relevant_tags", strict=True)
+
+# Stored profiles are only reused while the prompt and model stay the same.
+PROMPT_FINGERPRINT = hashlib.sha256((_MODEL + "\n" + _PROMPT).encode("utf-8")).hexdigest()[:16]
+
+# Identical concurrent lookups (same seed trending) share one LLM call
+_flights = SingleFlight("analyzer")
+
+logger = logging.getLogger(__name__)
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                # share the keep-alive pool instead of a fresh connection per process/client
+                _client = OpenAI(http_client=get_openai_http_client())
+    return _client
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    http_client = get_openai_async_http_client()
+    entry = _aclients.get(loop)
+    # rebuilt when the loop's pool was closed (http_client.aclose) and replaced
+    if entry is None or entry[0] is not http_client:
+        with _client_lock:
+            entry = _aclients.get(loop)
+            if entry is None or entry[0] is not http_client:
+                from openai import AsyncOpenAI
+                entry = _aclients[loop] = (http_client, AsyncOpenAI(http_client=http_client))
+    return entry[1]
+
+def get_relevant_tags_and_genres(title: str, genres: list, tags: list, media_id: Optional[int] = None) -> tuple[list, list]:
+    with span("analyzer") as s:
+        # Seeds resolved to an AniList id are answered from the profile store
+        store = get_profile_store() if media_id is not None else None
+        if store is not None:
+            stored = store.get(media_id, PROMPT_FINGERPRINT)
+            s.cache_hit(stored is not None)
+            if stored is not None:
+                return stored
+
+        def ask() -> tuple[list, list]:
+            response = get_client().responses.create(
+                model=_MODEL,
+                input=_PROMPT.format(title=title, genres=str(genres), tags=str(tags)),
+                text=_TEXT_FORMAT
+            )
+            _trace_usage(s, response)
+            return _parse_and_store(response.output_text, genres, tags, store, media_id)
+
+        return _flights.do(_flight_key(title, genres, tags, media_id), ask)
+
+async def aget_relevant_tags_and_genres(title: str, genres: list, tags: list, media_id: Optional[int] = None) -> tuple[list, list]:
+    # Same as get_relevant_tags_and_genres, without blocking the event loop
+    with span("analyzer") as s:
+        # The store is SQLite: open and query it off the event loop
+        store = await asyncio.to_thread(get_profile_store) if media_id is not None else None
+        if store is not None:
+            stored = await asyncio.to_thread(store.get, media_id, PROMPT_FINGERPRINT)
+            s.cache_hit(stored is not None)
+            if stored is not None:
+                return stored
+
+        async def ask() -> tuple[list, list]:
+            response = await get_async_client().responses.create(
+                model=_MODEL,
+                input=_PROMPT.format(title=title, genres=str(genres), tags=str(tags)),
+                text=_TEXT_FORMAT
+            )
+            _trace_usage(s, response)
+            return await asyncio.to_thread(
+                _parse_and_store, response.output_text, genres, tags, store, media_id
+            )
+
+        return await _flights.ado(_flight_key(title, genres, tags, media_id), ask)
+
+def _trace_usage(s, response) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        s.tokens(usage.input_tokens, usage.output_tokens)
+
+def _flight_key(title: str, genres: list, tags: list, media_id: Optional[int]) -> tuple:
+    return (media_id, title, tuple(genres), tuple(tags))
+
+def _parse_and_store(output_text: str, genres: list, tags: list, store, media_id: Optional[int]) -> tuple[list, list]:
     relevant_genres = [genres[0]]
 
     try:
-        relevant_tags = eval(response.output_text)
-    except:
-        print("Error")
-        print(response.output_text)
+        relevant_tags = parse_object(output_text, _RelevantTags, stage="analyzer").tags
+    except StructuredOutputError as e:
+        logger.warning("Unparseable analyzer answer (%s): %r", e, output_text)
         relevant_tags = [tags[0]]
-        
-    return relevant_genres, relevant_tags
\ No newline at end of file
+        # don't memoize the fallback, retry the LLM next time
+        store = None
+
+    if store is not None:
+        store.put(media_id, PROMPT_FINGERPRINT, relevant_genres, relevant_tags)
+
+    return relevant_genres, relevant_tags
@@ -12,31 +12,41 @@ A collection of functions to interact with the AniList GraphQL API.
 This module provides easy access to anime and manga data through simple function calls.
 """
 
-import requests
+import asyncio
 
+from src.cache import acached_query, cached_query, peek_query, store_query
+from src.http_client import apost_graphql, post_graphql
+from src.catalog import search_local
+from src.pagination import MAX_PER_PAGE, aiter_media, iter_media
+from src.tracing import span, traced
 
-def fetch_from_anilist(query, variables):
+# Aliased Page sub-queries per request; keeps per_page=1 lookups well under
+# AniList's query complexity limit.
+BATCH_CHUNK_SIZE = 10
+
+
+def fetch_from_anilist(query, variables, ttl_s=None):
     """
-    Make a request to the AniList GraphQL API
+    Make a request to the AniList GraphQL API, served from the shared
+    response cache when the same query was answered recently
     
     Args:
         query (str): GraphQL query
         variables (dict): Variables for the query
+        ttl_s (float, optional): Cache lifetime for this response (default: cache TTL)
         
     Returns:
         dict: JSON response from the API
     """
-    url = 'https://graphql.anilist.co'
-    
-    # Make the HTTP request
-    response = requests.post(url, json={'query': query, 'variables': variables})
-    
-    # Check for errors
-    if response.status_code != 200:
-        raise Exception(f"Query failed with status code {response.status_code}. Response: {response.text}")
-    
-    # Return the JSON response
-    return response.json()
+    with span("anilist"):
+        return cached_query(_post_to_anilist, query, variables, ttl_s)
+
+
+def _post_to_anilist(query, variables):
+    """
+    Send the GraphQL request over the shared keep-alive pool, bypassing the cache
+    """
+    return post_graphql(query, variables, raise_on_errors=False)
 
 
 def search_anime(
@@ -93,45 +103,256 @@ def search_anime(
             sort="SCORE_DESC"
         )
     """
-    query = '''
-    query ($search: String, $season: MediaSeason, $seasonYear: Int, $genre: String, $genres: [String], $tags: [String], $page: Int, $perPage: Int, $sort: [MediaSort]) {
-        Page(page: $page, perPage: $perPage) {
-            media(
-                search: $search, 
-                type: ANIME,
-                season: $season,
-                seasonYear: $seasonYear,
-                genre: $genre,
-                genre_in: $genres,
-                tag_in: $tags,
-                sort: $sort
-            ) {
-                id
-                title {
-                    romaji
-                    english
-                }
-                genres
-                tags {
-                    id
-                    name
-                    rank
-                    isMediaSpoiler
-                }
-                averageScore
-                episodes
-                format
-                status
-                seasonYear
-                coverImage {
-                    medium
-                }
-            }
-        }
-    }
-    '''
+    variables = _build_search_variables(
+        search_term, season, year, genre, genres, tags, sort, page, per_page
+    )
     
-    # Build variables dict, only including non-None values
+    # Filter-only queries are answered from the local catalog when synced
+    local = search_local(variables)
+    if local is not None:
+        return local
+
+    response = fetch_from_anilist(SEARCH_QUERY, variables)
+    return response['data']['Page']['media']
+
+
+def iter_search_anime(
+    search_term=None,
+    season=None,
+    year=None,
+    genre=None,
+    genres=None,
+    tags=None,
+    sort="POPULARITY_DESC",
+    page=1,
+    per_page=MAX_PER_PAGE,
+    limit=None
+):
+    """
+    Stream search results across pages instead of returning one page.
+    Follows pageInfo.hasNextPage, fetching the next page while the caller
+    consumes the current one, and stops once limit anime were yielded.
+    
+    Args:
+        Same filters as search_anime, plus:
+        page (int, optional): First page to read (default: 1)
+        per_page (int, optional): Page size (default: 50, AniList's maximum)
+        limit (int, optional): Stop after this many anime (default: all pages)
+        
+    Yields:
+        dict: Each matching anime, in result order, without duplicates
+    
+    Examples:
+        # Up to 300 candidates without collecting them up front
+        for anime in iter_search_anime(genres=["Mecha"], limit=300):
+            ...
+    """
+    variables = _build_search_variables(
+        search_term, season, year, genre, genres, tags, sort, page, per_page
+    )
+    return iter_media(_fetch_search_page, variables, limit)
+
+
+def aiter_search_anime(
+    search_term=None,
+    season=None,
+    year=None,
+    genre=None,
+    genres=None,
+    tags=None,
+    sort="POPULARITY_DESC",
+    page=1,
+    per_page=MAX_PER_PAGE,
+    limit=None
+):
+    """
+    Async version of iter_search_anime (use with `async for`)
+    """
+    variables = _build_search_variables(
+        search_term, season, year, genre, genres, tags, sort, page, per_page
+    )
+    return aiter_media(_afetch_search_page, variables, limit)
+
+
+def _fetch_search_page(variables):
+    """
+    One Page object for iter_search_anime, from the local catalog when possible
+    """
+    local = search_local(variables)
+    if local is not None:
+        return {'media': local}
+    return fetch_from_anilist(SEARCH_QUERY, variables)['data']['Page']
+
+
+async def _afetch_search_page(variables):
+    """
+    Async _fetch_search_page
+    """
+    local = search_local(variables)
+    if local is not None:
+        return {'media': local}
+    return (await afetch_from_anilist(SEARCH_QUERY, variables))['data']['Page']
+
+
+@traced("anilist_batch")
+def search_anime_batch(titles, sort="POPULARITY_DESC", per_page=1, chunk_size=None):
+    """
+    Resolve many title searches in as few round trips as possible.
+    Titles already in the response cache are served from it; the rest are
+    sent as one GraphQL document with an aliased Page sub-query per title,
+    split into chunks that stay under AniList's query complexity limit.
+    Each result is cached exactly as search_anime(search_term=title) would
+    cache it, so later single lookups hit the cache.
+    
+    Args:
+        titles (list): Titles to search for
+        sort (str or list, optional): Sort order (default: "POPULARITY_DESC")
+        per_page (int, optional): Results per title (default: 1)
+        chunk_size (int, optional): Titles per request (default: BATCH_CHUNK_SIZE)
+        
+    Returns:
+        list: One list of anime per input title, in input order
+    
+    Examples:
+        hits = search_anime_batch(["Akira", "Ghost in the Shell", "Paprika"])
+        first_matches = [h[0] for h in hits if h]
+    """
+    results, chunks = _plan_batch(titles, sort, per_page, chunk_size)
+    for chunk in chunks:
+        document, variables = _build_batch_document(chunk, sort, per_page)
+        payload = _post_to_anilist(document, variables)
+        _apply_batch_payload(payload, chunk, sort, per_page, titles, results)
+    return results
+
+
+@traced("anilist_batch")
+async def asearch_anime_batch(titles, sort="POPULARITY_DESC", per_page=1, chunk_size=None):
+    """
+    Async version of search_anime_batch; chunks are sent concurrently
+    """
+    results, chunks = _plan_batch(titles, sort, per_page, chunk_size)
+    documents = [_build_batch_document(chunk, sort, per_page) for chunk in chunks]
+    payloads = await asyncio.gather(
+        *(_apost_to_anilist(document, variables) for document, variables in documents)
+    )
+    for chunk, payload in zip(chunks, payloads):
+        _apply_batch_payload(payload, chunk, sort, per_page, titles, results)
+    return results
+
+
+def _plan_batch(titles, sort, per_page, chunk_size):
+    """
+    Fill results from the cache and split the remaining unique titles into chunks
+    """
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    results = [None] * len(titles)
+    missing = []
+    for i, title in enumerate(titles):
+        variables = _build_search_variables(title, None, None, None, None, None, sort, 1, per_page)
+        cached = peek_query(SEARCH_QUERY, variables)
+        if cached is not None:
+            results[i] = cached['data']['Page']['media']
+        elif title not in missing:
+            missing.append(title)
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    return results, chunks
+
+
+def _build_batch_document(chunk, sort, per_page):
+    """
+    Build one GraphQL document with an aliased Page sub-query per title
+    """
+    declarations = ["$perPage: Int", "$sort: [MediaSort]"]
+    selections = []
+    variables = {"perPage": per_page, "sort": sort if isinstance(sort, list) else [sort]}
+    for i, title in enumerate(chunk):
+        declarations.append(f"$s{i}: String")
+        variables[f"s{i}"] = title
+        selections.append(
+            f"    t{i}: Page(page: 1, perPage: $perPage) {{\n"
+            f"        media(search: $s{i}, type: ANIME, sort: $sort) {{"
+            + _MEDIA_FIELDS
+            + "        }\n    }"
+        )
+    document = "query (" + ", ".join(declarations) + ") {\n" + "\n".join(selections) + "\n}"
+    return document, variables
+
+
+def _apply_batch_payload(payload, chunk, sort, per_page, titles, results):
+    """
+    Scatter a batch response into results and the single-title cache entries
+    """
+    data = payload.get('data') or {}
+    if not data and payload.get('errors'):
+        raise RuntimeError(f"AniList returned errors: {payload['errors']!r}")
+    by_title = {}
+    for i, title in enumerate(chunk):
+        page = data.get(f"t{i}")
+        if page is None:
+            # this alias failed (see payload['errors']); leave it uncached
+            by_title[title] = []
+            continue
+        by_title[title] = page['media']
+        variables = _build_search_variables(title, None, None, None, None, None, sort, 1, per_page)
+        store_query(SEARCH_QUERY, variables, {'data': {'Page': page}})
+    for i, title in enumerate(titles):
+        if title in by_title:
+            results[i] = by_title[title]
+
+
+async def afetch_from_anilist(query, variables, ttl_s=None):
+    """
+    Async version of fetch_from_anilist, using the pooled httpx client
+    
+    Args:
+        query (str): GraphQL query
+        variables (dict): Variables for the query
+        ttl_s (float, optional): Cache lifetime for this response (default: cache TTL)
+        
+    Returns:
+        dict: JSON response from the API
+    """
+    with span("anilist"):
+        return await acached_query(_apost_to_anilist, query, variables, ttl_s)
+
+
+async def _apost_to_anilist(query, variables):
+    """
+    Async _post_to_anilist
+    """
+    return await apost_graphql(query, variables, raise_on_errors=False)
+
+
+async def asearch_anime(
+    search_term=None,
+    season=None,
+    year=None,
+    genre=None,
+    genres=None,
+    tags=None,
+    sort="POPULARITY_DESC",
+    page=1,
+    per_page=20
+):
+    """
+    Async version of search_anime, same arguments and return value
+    """
+    variables = _build_search_variables(
+        search_term, season, year, genre, genres, tags, sort, page, per_page
+    )
+    
+    local = search_local(variables)
+    if local is not None:
+        return local
+
+    response = await afetch_from_anilist(SEARCH_QUERY, variables)
+    return response['data']['Page']['media']
+
+
+def _build_search_variables(search_term, season, year, genre, genres, tags, sort, page, per_page):
+    """
+    Build the GraphQL variables dict, only including non-None values
+    """
     variables = {}
     if search_term:
         variables["search"] = search_term
@@ -153,6 +374,48 @@ def search_anime(
     
     variables["page"] = page
     variables["perPage"] = per_page
-    
-    response = fetch_from_anilist(query, variables)
-    return response['data']['Page']['media']
+    return variables
+
+
+_MEDIA_FIELDS = '''
+            id
+            title {
+                romaji
+                english
+            }
+            genres
+            tags {
+                id
+                name
+                rank
+                isMediaSpoiler
+            }
+            averageScore
+            episodes
+            format
+            status
+            seasonYear
+            coverImage {
+                medium
+            }
+'''
+
+SEARCH_QUERY = '''
+query ($search: String, $season: MediaSeason, $seasonYear: Int, $genre: String, $genres: [String], $tags: [String], $page: Int, $perPage: Int, $sort: [MediaSort]) {
+    Page(page: $page, perPage: $perPage) {
+        pageInfo {
+            hasNextPage
+        }
+        media(
+            search: $search, 
+            type: ANIME,
+            season: $season,
+            seasonYear: $seasonYear,
+            genre: $genre,
+            genre_in: $genres,
+            tag_in: $tags,
+            sort: $sort
+        ) {''' + _MEDIA_FIELDS + '''        }
+    }
+}
+'''
@@ -0,0 +1,459 @@
+"""
+AniList Response Cache
+~~~~~~~~~~~~~~~~~~~~~~
+A two-tier TTL cache for AniList GraphQL responses, shared by
+:func:`src.anilist_query_searcher.fetch_from_anilist` and
+:func:`src.recommender._fetch_from_anilist`.
+
+Features
+--------
+* Keys are a canonical hash of ``(query, variables)``: whitespace in the
+  query is collapsed, variable keys are sorted and set-like filters
+  (``genres``, ``tags``) are order-insensitive.
+* In-process LRU tier for microsecond repeat hits.
+* Optional SQLite tier that survives restarts and is shared between
+  processes on the same host.
+* Per-entry TTLs, size-bounded eviction on both tiers, hit/miss counters.
+* Concurrent misses for one key are coalesced (:mod:`src.singleflight`).
+* Refresh-ahead: :func:`remaining_ttl` and :func:`refresh_query` let the
+  background prefetcher (:mod:`src.prefetch`) renew entries before they expire.
+* Optionally (``OSUSUME_CACHE_COMPACT=1``) single-page ``search_anime``
+  responses are kept in memory as columnar tables (:mod:`src.columnar`), a
+  tenth of their dict size. Every hit then rebuilds the dicts, which costs
+  hundreds of microseconds per 50-media page instead of well under one, so
+  it is off by default and only worth it where memory is the constraint.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_CACHE_PATH``         SQLite file; empty string disables the disk tier.
+``OSUSUME_CACHE_TTL_S``        Default TTL in seconds (6 h).
+``OSUSUME_CACHE_MAX_MEMORY``   Max entries kept in memory.
+``OSUSUME_CACHE_MAX_DISK``     Max rows kept on disk.
+``OSUSUME_CACHE_DISABLED``     Set to ``1`` to bypass caching entirely.
+``OSUSUME_CACHE_COMPACT``      Set to ``1`` to keep pages as columnar tables in memory.
+
+Cached values may be shared between callers and must be treated as read-only.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.singleflight import SingleFlight
+from src.tracing import current_span
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_DEFAULT_PATH: str = os.getenv(
+    "OSUSUME_CACHE_PATH",
+    os.path.join(_PARENT_DIR, ".cache", "anilist_responses.sqlite3"),
+)
+_DEFAULT_TTL_S: float = float(os.getenv("OSUSUME_CACHE_TTL_S", 6 * 60 * 60))
+_DEFAULT_MAX_MEMORY: int = int(os.getenv("OSUSUME_CACHE_MAX_MEMORY", 2048))
+_DEFAULT_MAX_DISK: int = int(os.getenv("OSUSUME_CACHE_MAX_DISK", 50_000))
+_DISABLED: bool = os.getenv("OSUSUME_CACHE_DISABLED", "") == "1"
+_COMPACT: bool = os.getenv("OSUSUME_CACHE_COMPACT", "0") == "1"
+
+# Variables whose list values are filters (OR-ed sets), not ordered keys.
+_SET_VALUED_VARIABLES = frozenset({"genres", "tags"})
+
+# Run disk eviction every N writes instead of on every insert.
+_DISK_PRUNE_EVERY: int = 64
+
+logger = logging.getLogger(__name__)
+
+# Coalesces concurrent cache misses for the same AniList query.
+_flights = SingleFlight("anilist")
+
+# --------------------------------------------------------------------------- #
+#  Key canonicalisation
+# --------------------------------------------------------------------------- #
+
+def make_key(query: str, variables: Optional[Dict[str, Any]]) -> str:
+    """Return a stable hash for a GraphQL ``(query, variables)`` pair."""
+    canonical_vars: Dict[str, Any] = {}
+    for name, value in (variables or {}).items():
+        if value is None:
+            continue
+        if name in _SET_VALUED_VARIABLES and isinstance(value, list):
+            value = sorted(value)
+        canonical_vars[name] = value
+
+    blob = json.dumps(
+        {"q": " ".join(query.split()), "v": canonical_vars},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+# --------------------------------------------------------------------------- #
+#  Cache implementation
+# --------------------------------------------------------------------------- #
+
+class ResponseCache:
+    """Thread-safe LRU + SQLite cache with per-entry TTLs."""
+
+    def __init__(
+        self,
+        path: Optional[str] = _DEFAULT_PATH,
+        ttl_s: float = _DEFAULT_TTL_S,
+        max_memory_entries: int = _DEFAULT_MAX_MEMORY,
+        max_disk_entries: int = _DEFAULT_MAX_DISK,
+        compact: bool = _COMPACT,
+    ) -> None:
+        self.ttl_s = ttl_s
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.compact = compact
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, value)
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._writes_since_prune = 0
+        self._stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "expired": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = self._open_db(path)
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for *key*, or ``None`` on miss/expiry."""
+        now = time.time()
+        blob = None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                else:
+                    del self._memory[key]
+                    self._stats["expired"] += 1
+                    entry = None
+
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    expires_at, blob = row
+                    if expires_at > now:
+                        self._db.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        self._stats["disk_hits"] += 1
+                    else:
+                        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self._stats["expired"] += 1
+                        blob = None
+
+            if entry is None and blob is None:
+                self._stats["misses"] += 1
+                return None
+
+        if entry is not None:
+            return _unpack(value)
+
+        # Decode and pack outside the lock; keep a newer entry set meanwhile.
+        value = json.loads(blob)
+        stored = self._pack(value)
+        with self._lock:
+            current = self._memory.get(key)
+            if current is None or current[0] < expires_at:
+                self._memory_put(key, expires_at, stored)
+        return value
+
+    def set(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        """Store *value* under *key* for *ttl_s* seconds (default: cache TTL)."""
+        now = time.time()
+        expires_at = now + (self.ttl_s if ttl_s is None else ttl_s)
+        stored = self._pack(value)
+        with self._lock:
+            self._memory_put(key, expires_at, stored)
+            self._stats["sets"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, expires_at, accessed_at, value) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, expires_at, now, json.dumps(value, separators=(",", ":"))),
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= _DISK_PRUNE_EVERY:
+                    self._prune_disk(now)
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        ttl_s: Optional[float] = None,
+    ) -> Any:
+        """Return the cached value for *key*, calling *fetch* on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.set(key, value, ttl_s)
+        return value
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until *key* expires, or ``None`` if absent or expired.
+
+        Unlike :meth:`get` this touches neither the counters nor the LRU order.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[0] - now
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    return row[0] - now
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the hit/miss counters and tier sizes."""
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._stats)
+            snapshot["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                snapshot["disk_entries"] = self._db.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()[0]
+        lookups = snapshot["memory_hits"] + snapshot["disk_hits"] + snapshot["misses"]
+        hits = snapshot["memory_hits"] + snapshot["disk_hits"]
+        snapshot["hit_ratio"] = hits / lookups if lookups else 0.0
+        return snapshot
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers (caller holds ``self._lock``, except ``_pack``)
+    # ------------------------------------------------------------------ #
+
+    def _pack(self, value: Any) -> Any:
+        if not self.compact:
+            return value
+        from src.columnar import pack_page
+
+        return pack_page(value) or value
+
+    def _memory_put(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def _prune_disk(self, now: float) -> None:
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        excess = (
+            self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            - self.max_disk_entries
+        )
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "  SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?"
+                ")",
+                (excess,),
+            )
+            self._stats["disk_evictions"] += excess
+
+    @staticmethod
+    def _open_db(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "  key TEXT PRIMARY KEY,"
+                "  expires_at REAL NOT NULL,"
+                "  accessed_at REAL NOT NULL,"
+                "  value TEXT NOT NULL"
+                ")"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            return db
+        except sqlite3.Error as exc:
+            logger.warning("AniList disk cache unavailable at %s: %s", path, exc)
+            return None
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the process-wide :class:`ResponseCache`, creating it on first use."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache()
+    return _shared_cache
+
+
+def cached_query(
+    fetch: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+    query: str,
+    variables: Dict[str, Any],
+    ttl_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run ``fetch(query, variables)`` through the shared response cache.
+
+    Only successful responses are stored: anything *fetch* raises propagates
+    and payloads carrying a GraphQL ``errors`` key are returned uncached.
+    Concurrent misses for the same key share one network call.
+
+    The current tracing span is marked a cache hit only when a cache tier
+    answered; a miss that waited on another caller's fetch is still a miss.
+    """
+    key = make_key(query, variables)
+    if _DISABLED:
+        current_span().cache_hit(False)
+        return _flights.do(_flight_key(fetch, key), lambda: fetch(query, variables))
+
+    cache = get_cache()
+    payload = cache.get(key)
+    current_span().cache_hit(payload is not None)
+    if payload is None:
+        payload = _flights.do(
+            _flight_key(fetch, key),
+            lambda: _fetch_and_store(cache, key, fetch(query, variables), ttl_s),
+        )
+    return payload
+
+
+async def acached_query(
+    afetch: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    query: str,
+    variables: Dict[str, Any],
+    ttl_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Async counterpart of :func:`cached_query` for coroutine fetchers."""
+    key = make_key(query, variables)
+    if _DISABLED:
+        current_span().cache_hit(False)
+        return await _flights.ado(_flight_key(afetch, key), lambda: afetch(query, variables))
+
+    cache = get_cache()
+    payload = cache.get(key)
+    current_span().cache_hit(payload is not None)
+    if payload is None:
+
+        async def fetch_and_store() -> Dict[str, Any]:
+            return _fetch_and_store(cache, key, await afetch(query, variables), ttl_s)
+
+        payload = await _flights.ado(_flight_key(afetch, key), fetch_and_store)
+    return payload
+
+
+def peek_query(query: str, variables: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the cached payload for ``(query, variables)`` without fetching."""
+    if _DISABLED:
+        return None
+    return get_cache().get(make_key(query, variables))
+
+
+def remaining_ttl(query: str, variables: Dict[str, Any]) -> Optional[float]:
+    """Seconds until the cached response to ``(query, variables)`` expires."""
+    if _DISABLED:
+        return None
+    return get_cache().ttl_remaining(make_key(query, variables))
+
+
+def refresh_query(
+    fetch: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+    query: str,
+    variables: Dict[str, Any],
+    ttl_s: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Re-run ``fetch(query, variables)`` and store the result even if cached.
+
+    Concurrent refreshes of one key share a call, but never with interactive
+    misses: those must not wait behind a background-priority request.
+    """
+    if _DISABLED:
+        return fetch(query, variables)
+    key = make_key(query, variables)
+    name, _ = _flight_key(fetch, key)
+    return _flights.do(
+        ("refresh:" + name, key),
+        lambda: _fetch_and_store(get_cache(), key, fetch(query, variables), ttl_s),
+    )
+
+
+def store_query(
+    query: str,
+    variables: Dict[str, Any],
+    payload: Dict[str, Any],
+    ttl_s: Optional[float] = None,
+) -> None:
+    """Cache *payload* as the response to ``(query, variables)``.
+
+    Lets batched fetches populate the same entries single queries read.
+    """
+    if not _DISABLED and "errors" not in payload:
+        get_cache().set(make_key(query, variables), payload, ttl_s)
+
+
+def _unpack(value: Any) -> Any:
+    # Packed pages are always src.columnar.PackedPage; plain values pass through.
+    unpack = getattr(value, "unpack", None)
+    return unpack() if unpack is not None else value
+
+
+def _flight_key(fetch: Callable, key: str) -> Tuple[str, str]:
+    # Fetchers differ in error handling, so never share results across them.
+    return f"{fetch.__module__}.{fetch.__qualname__}", key
+
+
+def _fetch_and_store(
+    cache: ResponseCache, key: str, payload: Dict[str, Any], ttl_s: Optional[float]
+) -> Dict[str, Any]:
+    if "errors" not in payload:
+        cache.set(key, payload, ttl_s)
+    return payload
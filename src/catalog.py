@@ -0,0 +1,392 @@
+"""
+Local AniList Catalog
+~~~~~~~~~~~~~~~~~~~~~
+An on-disk mirror of the AniList anime catalog plus an in-memory inverted
+index, so filter-only searches (genres, tags, season, year, sort) are answered
+locally in well under a millisecond instead of with a GraphQL round trip.
+
+Features
+--------
+* ``sync`` pages through the whole catalog once using keyset pagination
+  (``id_greater``) and writes a compact gzip'd JSON-lines file.
+* ``refresh`` pulls only media updated since the newest ``updatedAt`` seen.
+* Media live in memory as a columnar :class:`~src.columnar.MediaTable`
+  (a few hundred bytes each), and ``Anime`` dicts are only built for returned
+  rows.
+* Genre / tag postings (seeded from ``genres.json`` and ``tags.json``) are
+  sorted ``int32`` row arrays built from the table's CSR columns; season,
+  year, score, popularity and favourites are its NumPy columns.
+* :func:`search_local` mirrors the ``search_anime`` variables contract and
+  returns ``None`` whenever a query needs AniList itself (e.g. free-text
+  title search or an unsupported sort key).
+
+Like AniList's ``genre_in`` / ``tag_in``, multiple genres or tags must all
+be present on a media for it to match.
+
+Usage::
+
+    python src/catalog.py sync       # full download (a few minutes)
+    python src/catalog.py refresh    # incremental update
+    python src/catalog.py stats
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import argparse
+import gzip
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.columnar import ENUMS, MediaTable
+from src.rate_limiter import Priority, request_priority
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_DEFAULT_PATH: str = os.getenv(
+    "OSUSUME_CATALOG_PATH", os.path.join(parent_dir, ".cache", "catalog.jsonl.gz")
+)
+_DISABLED: bool = os.getenv("OSUSUME_CATALOG_DISABLED", "") == "1"
+_SYNC_PAGE_SIZE: int = 50
+
+# Order of the positional fields in each JSON line.
+_FIELDS = (
+    "id", "romaji", "english", "genres", "tags", "averageScore", "episodes",
+    "format", "status", "season", "seasonYear", "popularity", "favourites",
+    "updatedAt", "cover",
+)
+_F = {name: i for i, name in enumerate(_FIELDS)}
+
+# MediaSort key → column used for ordering.
+_SORT_COLUMNS = {
+    "POPULARITY": "popularity",
+    "SCORE": "score",
+    "FAVOURITES": "favourites",
+    "ID": "ids",
+}
+
+logger = logging.getLogger(__name__)
+
+_MEDIA_FIELDS: str = """
+      id
+      title { romaji english }
+      genres
+      tags { id name rank isMediaSpoiler }
+      averageScore
+      episodes
+      format
+      status
+      season
+      seasonYear
+      popularity
+      favourites
+      updatedAt
+      coverImage { medium }
+"""
+
+# Full sync: keyset pagination on id avoids AniList's deep-page limits.
+_SYNC_QUERY: str = ("""
+query ($after: Int, $perPage: Int) {
+  Page(page: 1, perPage: $perPage) {
+    pageInfo { hasNextPage }
+    media(type: ANIME, id_greater: $after, sort: ID) {""" + _MEDIA_FIELDS + """    }
+  }
+}
+""").strip()
+
+# Incremental refresh: newest updates first, stop once we reach known data.
+_REFRESH_QUERY: str = ("""
+query ($page: Int, $perPage: Int) {
+  Page(page: $page, perPage: $perPage) {
+    pageInfo { hasNextPage }
+    media(type: ANIME, sort: UPDATED_AT_DESC) {""" + _MEDIA_FIELDS + """    }
+  }
+}
+""").strip()
+
+# --------------------------------------------------------------------------- #
+#  Record encoding
+# --------------------------------------------------------------------------- #
+
+def _encode(media: Dict[str, Any]) -> list:
+    """Flatten one AniList media object into the compact positional form."""
+    return [
+        media["id"],
+        media["title"].get("romaji"),
+        media["title"].get("english"),
+        media.get("genres") or [],
+        [[t["id"], t["name"], t["rank"], t["isMediaSpoiler"]] for t in media.get("tags") or []],
+        media.get("averageScore"),
+        media.get("episodes"),
+        media.get("format"),
+        media.get("status"),
+        media.get("season"),
+        media.get("seasonYear"),
+        media.get("popularity"),
+        media.get("favourites"),
+        media.get("updatedAt"),
+        (media.get("coverImage") or {}).get("medium"),
+    ]
+
+
+def _load_vocabulary(name: str) -> List[str]:
+    with open(os.path.join(parent_dir, name), encoding="utf-8") as f:
+        return json.load(f)
+
+# --------------------------------------------------------------------------- #
+#  In-memory index
+# --------------------------------------------------------------------------- #
+
+class CatalogIndex:
+    """Inverted genre/tag index and sort columns over a :class:`MediaTable`."""
+
+    def __init__(self, records: List[list]) -> None:
+        self.table = MediaTable.from_records(records)
+        table = self.table
+
+        self.ids = table.ids
+        self.year = table.year
+        self.season = table.season
+        self.score = table.score
+        self.popularity = table.popularity
+        self.favourites = table.favourites
+
+        empty = np.empty(0, dtype=np.int32)
+        self.genre_postings = {g: empty for g in _load_vocabulary("genres.json")}
+        self.genre_postings.update(table.postings("genres"))
+        self.tag_postings = {t: empty for t in _load_vocabulary("tags.json")}
+        self.tag_postings.update(table.postings("tags"))
+
+        self.max_updated_at = int(table.updated_at.max()) if len(table) else 0
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    # ------------------------------------------------------------------ #
+    #  Query
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def supports(variables: Dict[str, Any]) -> bool:
+        """Whether a ``search_anime`` variables dict can be answered locally."""
+        if variables.get("search"):
+            return False
+        for key in variables.get("sort") or []:
+            base = key[:-5] if key.endswith("_DESC") else key
+            if base not in _SORT_COLUMNS:
+                return False
+        return True
+
+    def matching_rows(self, variables: Dict[str, Any]) -> np.ndarray:
+        """Return the (unsorted) row positions matching every filter."""
+        mask = np.ones(len(self.table), dtype=bool)
+
+        required_genres = list(variables.get("genres") or [])
+        if variables.get("genre"):
+            required_genres.append(variables["genre"])
+        for name, postings in (
+            *((g, self.genre_postings) for g in required_genres),
+            *((t, self.tag_postings) for t in variables.get("tags") or []),
+        ):
+            rows = postings.get(name)
+            if rows is None or not len(rows):
+                return np.empty(0, dtype=np.int64)
+            term_mask = np.zeros_like(mask)
+            term_mask[rows] = True
+            mask &= term_mask
+
+        if variables.get("seasonYear"):
+            mask &= self.year == variables["seasonYear"]
+        if variables.get("season"):
+            code = ENUMS.get(variables["season"])
+            mask &= self.season == (-2 if code is None else code)
+
+        return np.flatnonzero(mask)
+
+    def search(self, variables: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Answer a ``search_anime``-style query from memory."""
+        rows = self.matching_rows(variables)
+
+        sort_keys = variables.get("sort") or ["POPULARITY_DESC"]
+        if isinstance(sort_keys, str):
+            sort_keys = [sort_keys]
+        # np.lexsort sorts by the *last* key first; nulls always sort last.
+        columns = []
+        for key in reversed(sort_keys):
+            descending = key.endswith("_DESC")
+            base = key[:-5] if descending else key
+            values = getattr(self, _SORT_COLUMNS[base])[rows].astype(np.float64)
+            if descending:
+                values = -values
+            columns.append(np.where(np.isnan(values), np.inf, values))
+        if columns:
+            rows = rows[np.lexsort(columns)]
+
+        page = int(variables.get("page") or 1)
+        per_page = int(variables.get("perPage") or 20)
+        start = (page - 1) * per_page
+        return self.table.to_dicts(rows[start:start + per_page])
+
+    def hydrate(self, row: int) -> Dict[str, Any]:
+        """Return the ``Anime`` dict stored at row position *row*."""
+        return self.table.to_dict(row)
+
+# --------------------------------------------------------------------------- #
+#  Persistence & sync
+# --------------------------------------------------------------------------- #
+
+def load_records(path: str = _DEFAULT_PATH) -> List[list]:
+    """Read the compact catalog file (header line + one JSON array per media)."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if tuple(header.get("fields", ())) != _FIELDS:
+            raise ValueError(f"Catalog at {path} uses an incompatible format; re-run sync.")
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_records(records: Iterable[list], path: str = _DEFAULT_PATH) -> None:
+    """Atomically write records in the compact catalog format."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"fields": list(_FIELDS), "synced_at": int(time.time())}) + "\n")
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+# Sync traffic yields to interactive searches under the shared rate limit.
+@request_priority(Priority.BACKGROUND)
+def sync(path: str = _DEFAULT_PATH) -> int:
+    """Download the whole anime catalog from AniList; return the media count."""
+    from src.anilist_query_searcher import _post_to_anilist
+
+    records: List[list] = []
+    after = 0
+    while True:
+        payload = _post_to_anilist(
+            _SYNC_QUERY, {"after": after, "perPage": _SYNC_PAGE_SIZE}
+        )
+        page = payload["data"]["Page"]
+        records.extend(_encode(m) for m in page["media"])
+        if not page["media"] or not page["pageInfo"]["hasNextPage"]:
+            break
+        after = page["media"][-1]["id"]
+        logger.info("Catalog sync: %d media so far", len(records))
+
+    save_records(records, path)
+    _reset_shared()
+    return len(records)
+
+
+@request_priority(Priority.BACKGROUND)
+def refresh(path: str = _DEFAULT_PATH) -> int:
+    """Merge media updated on AniList since the last sync; return how many changed."""
+    from src.anilist_query_searcher import _post_to_anilist
+
+    records = load_records(path)
+    since = max((r[_F["updatedAt"]] or 0 for r in records), default=0)
+    by_id = {r[_F["id"]]: i for i, r in enumerate(records)}
+
+    changed = 0
+    page = 1
+    while True:
+        payload = _post_to_anilist(
+            _REFRESH_QUERY, {"page": page, "perPage": _SYNC_PAGE_SIZE}
+        )
+        media = payload["data"]["Page"]["media"]
+        fresh = [m for m in media if (m.get("updatedAt") or 0) > since]
+        for m in fresh:
+            record = _encode(m)
+            if m["id"] in by_id:
+                records[by_id[m["id"]]] = record
+            else:
+                by_id[m["id"]] = len(records)
+                records.append(record)
+        changed += len(fresh)
+        if len(fresh) < len(media) or not payload["data"]["Page"]["pageInfo"]["hasNextPage"]:
+            break
+        page += 1
+
+    if changed:
+        save_records(records, path)
+        _reset_shared()
+    return changed
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_index: Optional[CatalogIndex] = None
+_shared_loaded = False
+_shared_lock = threading.Lock()
+
+
+def get_catalog() -> Optional[CatalogIndex]:
+    """Return the process-wide index, or ``None`` if no catalog has been synced."""
+    global _shared_index, _shared_loaded
+    if _DISABLED:
+        return None
+    if not _shared_loaded:
+        with _shared_lock:
+            if not _shared_loaded:
+                if os.path.exists(_DEFAULT_PATH):
+                    try:
+                        _shared_index = CatalogIndex(load_records(_DEFAULT_PATH))
+                    except (OSError, ValueError) as exc:
+                        logger.warning("Local catalog unavailable: %s", exc)
+                _shared_loaded = True
+    return _shared_index
+
+
+def _reset_shared() -> None:
+    global _shared_index, _shared_loaded
+    with _shared_lock:
+        _shared_index = None
+        _shared_loaded = False
+
+
+def search_local(variables: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Answer ``search_anime`` variables locally, or ``None`` to fall back to AniList."""
+    index = get_catalog()
+    if index is None or not index.supports(variables):
+        return None
+    return index.search(variables)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the local AniList catalog mirror.")
+    parser.add_argument("command", choices=["sync", "refresh", "stats"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "sync":
+        print(json.dumps({"media": sync()}))
+    elif args.command == "refresh":
+        print(json.dumps({"updated": refresh()}))
+    else:
+        index = get_catalog()
+        print(json.dumps({
+            "media": len(index) if index else 0,
+            "genres": len(index.genre_postings) if index else 0,
+            "tags": len(index.tag_postings) if index else 0,
+            "max_updated_at": index.max_updated_at if index else None,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""
+Columnar Media Table
+~~~~~~~~~~~~~~~~~~~~
+A compact, struct-of-arrays form of ``Anime`` results for the local catalog,
+the in-memory tier of the response cache and the re-ranker. ``Anime`` dicts
+are only rebuilt for the rows that leave the table.
+
+Layout
+------
+* One NumPy column per scalar field: ``ids``, ``score``, ``episodes``,
+  ``year``, ``popularity``, ``favourites``, ``updated_at``. Missing values are
+  ``NaN`` for floats, ``-1`` for ``episodes`` and ``0`` for ``year`` and
+  ``updated_at``.
+* ``format``, ``status`` and ``season`` are ``int16`` codes into a shared
+  :class:`Interner` (``-1`` for null).
+* Genres and tags are CSR arrays: ``genre_offsets[i]:genre_offsets[i + 1]``
+  slices ``genre_ids``, and the tag columns (interned name, AniList id, rank,
+  spoiler flag) are sliced the same way by ``tag_offsets``. Names are
+  interned once per process, in :data:`GENRES` and :data:`TAGS`.
+* Titles and cover URLs are :class:`StringColumn` (UTF-8 bytes and offsets),
+  with no Python object per value.
+
+A media costs roughly a tenth of its decoded JSON dict (see
+``benchmarks/columnar.py``).
+
+Round trips are exact. :meth:`MediaTable.to_dicts` emits the fields that were
+present when the table was built, in the same order, so
+``MediaTable.from_media(media).to_dicts() == media`` for anything
+``search_anime`` returns. :func:`pack_page` checks this before it stores a
+page compactly.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Fields a table can hold. ``ANIME_FIELDS`` is the ``Anime`` TypedDict shape
+# both search queries select; the rest only occur in catalog records.
+ANIME_FIELDS: Tuple[str, ...] = (
+    "id", "title", "genres", "tags", "averageScore", "episodes", "format",
+    "status", "seasonYear", "coverImage",
+)
+_KNOWN_FIELDS = frozenset(ANIME_FIELDS) | {"season", "popularity", "favourites", "updatedAt"}
+
+# --------------------------------------------------------------------------- #
+#  Interning
+# --------------------------------------------------------------------------- #
+
+class Interner:
+    """Process-wide ``str`` ↔ dense ``int`` id map; ids are never reused."""
+
+    __slots__ = ("names", "_ids", "_lock")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
+    def intern(self, name: str) -> int:
+        found = self._ids.get(name)
+        if found is None:
+            with self._lock:
+                found = self._ids.get(name)
+                if found is None:
+                    found = len(self.names)
+                    self.names.append(name)
+                    self._ids[name] = found
+        return found
+
+    def codes(self, values: Iterable[Optional[str]]) -> List[int]:
+        """Ids of *values* (``-1`` for ``None``), interning any new ones."""
+        values = list(values)
+        ids = self._ids
+        for name in set(values).difference(ids):
+            if name is not None:
+                self.intern(name)
+        return [-1 if v is None else ids[v] for v in values]
+
+
+GENRES = Interner()
+TAGS = Interner()
+# format, status and season values share one small code space.
+ENUMS = Interner()
+
+# --------------------------------------------------------------------------- #
+#  Strings
+# --------------------------------------------------------------------------- #
+
+class StringColumn:
+    """Nullable strings as one UTF-8 buffer plus ``int32`` byte offsets."""
+
+    __slots__ = ("data", "offsets", "nulls")
+
+    def __init__(self, values: Sequence[Optional[str]]) -> None:
+        encoded = [(v or "").encode("utf-8") for v in values]
+        self.data = b"".join(encoded)
+        self.offsets = np.zeros(len(values) + 1, dtype=np.int32)
+        np.cumsum([len(b) for b in encoded], out=self.offsets[1:])
+        self.nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls[i]:
+            return None
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def take(self, rows: np.ndarray) -> List[Optional[str]]:
+        starts = self.offsets[rows].tolist()
+        ends = self.offsets[rows + 1].tolist()
+        data = self.data
+        return [
+            None if null else data[a:b].decode("utf-8")
+            for a, b, null in zip(starts, ends, self.nulls[rows].tolist())
+        ]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes + self.nulls.nbytes
+
+# --------------------------------------------------------------------------- #
+#  Table
+# --------------------------------------------------------------------------- #
+
+class MediaTable:
+    """Struct-of-arrays over a list of media; see the module docstring."""
+
+    def __init__(self, fields: Tuple[str, ...], columns: Dict[str, Any]) -> None:
+        self.fields = fields
+        self.ids: np.ndarray = columns["ids"]
+        self.score: np.ndarray = columns["score"]
+        self.episodes: np.ndarray = columns["episodes"]
+        self.year: np.ndarray = columns["year"]
+        self.popularity: np.ndarray = columns["popularity"]
+        self.favourites: np.ndarray = columns["favourites"]
+        self.updated_at: np.ndarray = columns["updated_at"]
+        self.format: np.ndarray = columns["format"]
+        self.status: np.ndarray = columns["status"]
+        self.season: np.ndarray = columns["season"]
+        self.romaji: StringColumn = columns["romaji"]
+        self.english: StringColumn = columns["english"]
+        self.cover: StringColumn = columns["cover"]
+        self.genre_offsets: np.ndarray = columns["genre_offsets"]
+        self.genre_ids: np.ndarray = columns["genre_ids"]
+        self.tag_offsets: np.ndarray = columns["tag_offsets"]
+        self.tag_ids: np.ndarray = columns["tag_ids"]
+        self.tag_anilist_ids: np.ndarray = columns["tag_anilist_ids"]
+        self.tag_ranks: np.ndarray = columns["tag_ranks"]
+        self.tag_spoilers: np.ndarray = columns["tag_spoilers"]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------ #
+    #  Construction
+    # ------------------------------------------------------------------ #
+
+    @classmethod
+    def from_media(cls, media: Sequence[Dict[str, Any]]) -> "MediaTable":
+        """Build from ``Anime`` dicts. Raises ``ValueError`` on fields it can't hold."""
+        fields = tuple(media[0]) if media else ANIME_FIELDS
+        if not _KNOWN_FIELDS.issuperset(fields):
+            raise ValueError(f"Unsupported media fields: {sorted(set(fields) - _KNOWN_FIELDS)}")
+        builder = _Builder()
+        try:
+            for m in media:
+                title = m.get("title") or {}
+                builder.add(
+                    m["id"], title.get("romaji"), title.get("english"), m.get("genres") or (),
+                    [(t["id"], t["name"], t["rank"], t["isMediaSpoiler"]) for t in m.get("tags") or ()],
+                    m.get("averageScore"), m.get("episodes"), m.get("format"), m.get("status"),
+                    m.get("season"), m.get("seasonYear"), m.get("popularity"), m.get("favourites"),
+                    m.get("updatedAt"), (m.get("coverImage") or {}).get("medium"),
+                )
+        except (KeyError, TypeError, AttributeError) as exc:
+            raise ValueError(f"Malformed media: {exc!r}") from exc
+        return builder.build(fields)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Sequence[Any]]) -> "MediaTable":
+        """Build from the catalog's positional records (``src.catalog._FIELDS`` order)."""
+        builder = _Builder()
+        for (media_id, romaji, english, genres, tags, score, episodes, fmt, status,
+             season, year, popularity, favourites, updated_at, cover) in records:
+            builder.add(
+                media_id, romaji, english, genres, tags, score, episodes, fmt, status,
+                season, year, popularity, favourites, updated_at, cover,
+            )
+        return builder.build(ANIME_FIELDS)
+
+    def take(self, rows: Sequence[int]) -> "MediaTable":
+        """A new table holding *rows*, in that order."""
+        rows = np.asarray(rows, dtype=np.int64)
+        genre_entries, genre_counts = _gather(self.genre_offsets, rows)
+        tag_entries, tag_counts = _gather(self.tag_offsets, rows)
+        return MediaTable(self.fields, {
+            "ids": self.ids[rows],
+            "score": self.score[rows],
+            "episodes": self.episodes[rows],
+            "year": self.year[rows],
+            "popularity": self.popularity[rows],
+            "favourites": self.favourites[rows],
+            "updated_at": self.updated_at[rows],
+            "format": self.format[rows],
+            "status": self.status[rows],
+            "season": self.season[rows],
+            "romaji": StringColumn(self.romaji.take(rows)),
+            "english": StringColumn(self.english.take(rows)),
+            "cover": StringColumn(self.cover.take(rows)),
+            "genre_offsets": _offsets(genre_counts),
+            "genre_ids": self.genre_ids[genre_entries],
+            "tag_offsets": _offsets(tag_counts),
+            "tag_ids": self.tag_ids[tag_entries],
+            "tag_anilist_ids": self.tag_anilist_ids[tag_entries],
+            "tag_ranks": self.tag_ranks[tag_entries],
+            "tag_spoilers": self.tag_spoilers[tag_entries],
+        })
+
+    # ------------------------------------------------------------------ #
+    #  Access
+    # ------------------------------------------------------------------ #
+
+    def titles(self) -> List[Optional[str]]:
+        """English title, else romaji, per row."""
+        rows = np.arange(len(self))
+        return [e or r for e, r in zip(self.english.take(rows), self.romaji.take(rows))]
+
+    def entry_rows(self, offsets: np.ndarray) -> np.ndarray:
+        """Row of every CSR entry (``genre_offsets`` or ``tag_offsets``)."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(offsets))
+
+    def postings(self, kind: str) -> Dict[str, np.ndarray]:
+        """Sorted ``int32`` rows per genre or tag name (*kind*: ``"genres"``/``"tags"``)."""
+        offsets, ids, interner = (
+            (self.genre_offsets, self.genre_ids, GENRES) if kind == "genres"
+            else (self.tag_offsets, self.tag_ids, TAGS)
+        )
+        rows = self.entry_rows(offsets)
+        order = np.lexsort((rows, ids))
+        ids, rows = ids[order], rows[order].astype(np.int32)
+        unique, starts = np.unique(ids, return_index=True)
+        names = interner.names
+        return {
+            names[i]: np.unique(chunk)
+            for i, chunk in zip(unique.tolist(), np.split(rows, starts[1:]))
+        }
+
+    def to_dict(self, row: int) -> Dict[str, Any]:
+        """The media at *row* in its original dict shape."""
+        return self.to_dicts([row])[0]
+
+    def to_dicts(self, rows: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+        """The media at *rows* (default: all) in their original dict shape."""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return []
+        columns = [self._column(field, rows) for field in self.fields]
+        return [dict(zip(self.fields, values)) for values in zip(*columns)]
+
+    def _column(self, field: str, rows: np.ndarray) -> list:
+        """Python values of one output field for *rows*."""
+        enums = ENUMS.names
+        if field == "id":
+            return self.ids[rows].tolist()
+        if field == "title":
+            return [
+                {"romaji": r, "english": e}
+                for r, e in zip(self.romaji.take(rows), self.english.take(rows))
+            ]
+        if field == "genres":
+            entries, counts = _gather(self.genre_offsets, rows)
+            names = GENRES.names
+            return _split([names[i] for i in self.genre_ids[entries].tolist()], counts)
+        if field == "tags":
+            entries, counts = _gather(self.tag_offsets, rows)
+            names = TAGS.names
+            return _split([
+                {"id": i, "name": names[n], "rank": None if r < 0 else r, "isMediaSpoiler": s}
+                for i, n, r, s in zip(
+                    self.tag_anilist_ids[entries].tolist(),
+                    self.tag_ids[entries].tolist(),
+                    self.tag_ranks[entries].tolist(),
+                    self.tag_spoilers[entries].tolist(),
+                )
+            ], counts)
+        if field == "averageScore":
+            return _nullable_ints(self.score[rows])
+        if field == "episodes":
+            return [None if v < 0 else v for v in self.episodes[rows].tolist()]
+        if field in ("format", "status", "season"):
+            return [None if v < 0 else enums[v] for v in getattr(self, field)[rows].tolist()]
+        if field == "seasonYear":
+            return [v or None for v in self.year[rows].tolist()]
+        if field in ("popularity", "favourites"):
+            return _nullable_ints(getattr(self, field)[rows])
+        if field == "updatedAt":
+            return [v or None for v in self.updated_at[rows].tolist()]
+        if field == "coverImage":
+            return [{"medium": c} for c in self.cover.take(rows)]
+        raise KeyError(field)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns (interned names excluded, they're shared)."""
+        total = self.romaji.nbytes + self.english.nbytes + self.cover.nbytes
+        for value in vars(self).values():
+            if isinstance(value, np.ndarray):
+                total += value.nbytes
+        return total
+
+# --------------------------------------------------------------------------- #
+#  Cache pages
+# --------------------------------------------------------------------------- #
+
+class PackedPage:
+    """A ``{"data": {"Page": ...}}`` payload with its media held as a table."""
+
+    __slots__ = ("table", "page_info")
+
+    def __init__(self, table: MediaTable, page_info: Optional[Dict[str, Any]]) -> None:
+        self.table = table
+        self.page_info = page_info
+
+    def unpack(self) -> Dict[str, Any]:
+        page: Dict[str, Any] = {}
+        if self.page_info is not None:
+            page["pageInfo"] = dict(self.page_info)
+        page["media"] = self.table.to_dicts()
+        return {"data": {"Page": page}}
+
+
+def pack_page(payload: Any) -> Optional[PackedPage]:
+    """Pack a single-``Page`` response, or ``None`` if it wouldn't round-trip exactly."""
+    if not isinstance(payload, dict) or list(payload) != ["data"]:
+        return None
+    data = payload["data"]
+    if not isinstance(data, dict) or list(data) != ["Page"]:
+        return None
+    page = data["Page"]
+    if not isinstance(page, dict) or list(page) not in (["pageInfo", "media"], ["media"]):
+        return None
+    media = page["media"]
+    if not isinstance(media, list) or not media:
+        return None
+    try:
+        table = MediaTable.from_media(media)
+    except ValueError:
+        return None
+    if table.to_dicts() != media:
+        return None
+    return PackedPage(table, page.get("pageInfo"))
+
+# --------------------------------------------------------------------------- #
+#  Helpers
+# --------------------------------------------------------------------------- #
+
+class _Builder:
+    """Collects rows as tuples, then transposes them into columns once."""
+
+    def __init__(self) -> None:
+        self.rows: List[tuple] = []
+        self.genre_counts: List[int] = []
+        self.genres: List[str] = []
+        self.tag_counts: List[int] = []
+        self.tags: List[Sequence[Any]] = []
+
+    def add(self, media_id, romaji, english, genres, tags, score, episodes, fmt, status,
+            season, year, popularity, favourites, updated_at, cover) -> None:
+        self.rows.append((
+            media_id, romaji, english, score, episodes, fmt, status, season, year,
+            popularity, favourites, updated_at, cover,
+        ))
+        self.genre_counts.append(len(genres))
+        self.genres.extend(genres)
+        self.tag_counts.append(len(tags))
+        self.tags.extend(tags)
+
+    def build(self, fields: Tuple[str, ...]) -> MediaTable:
+        n = len(self.rows)
+        (ids, romaji, english, score, episodes, fmt, status, season, year,
+         popularity, favourites, updated_at, cover) = zip(*self.rows) if n else ((),) * 13
+        tag_anilist_ids, tag_names, tag_ranks, tag_spoilers = (
+            zip(*self.tags) if self.tags else ((),) * 4
+        )
+        return MediaTable(fields, {
+            "ids": np.asarray(ids, dtype=np.int64),
+            "score": _floats(score, np.float32),
+            "episodes": np.asarray([-1 if v is None else v for v in episodes], dtype=np.int32),
+            "year": np.asarray([v or 0 for v in year], dtype=np.int16),
+            "popularity": _floats(popularity, np.float64),
+            "favourites": _floats(favourites, np.float64),
+            "updated_at": np.asarray([v or 0 for v in updated_at], dtype=np.int64),
+            "format": np.asarray(ENUMS.codes(fmt), dtype=np.int16),
+            "status": np.asarray(ENUMS.codes(status), dtype=np.int16),
+            "season": np.asarray(ENUMS.codes(season), dtype=np.int16),
+            "romaji": StringColumn(romaji),
+            "english": StringColumn(english),
+            "cover": StringColumn(cover),
+            "genre_offsets": _offsets(self.genre_counts),
+            "genre_ids": np.asarray(GENRES.codes(self.genres), dtype=np.int16),
+            "tag_offsets": _offsets(self.tag_counts),
+            "tag_ids": np.asarray(TAGS.codes(tag_names), dtype=np.int32),
+            "tag_anilist_ids": np.asarray(tag_anilist_ids, dtype=np.int32),
+            "tag_ranks": np.asarray([-1 if v is None else v for v in tag_ranks], dtype=np.int16),
+            "tag_spoilers": np.asarray([bool(v) for v in tag_spoilers], dtype=bool),
+        })
+
+
+def _floats(values: Sequence[Any], dtype) -> np.ndarray:
+    return np.asarray([np.nan if v is None else v for v in values], dtype=dtype)
+
+
+def _offsets(counts: Sequence[int]) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _gather(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+    """Entry indices of *rows* in CSR order, plus the per-row counts."""
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    total = int(counts.sum())
+    # Entry j of row r sits at starts[r] + j: repeat each start, add a ramp.
+    shift = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return np.arange(total, dtype=np.int64) + shift, counts.tolist()
+
+
+def _split(values: list, counts: List[int]) -> List[list]:
+    out, at = [], 0
+    for n in counts:
+        out.append(values[at:at + n])
+        at += n
+    return out
+
+
+def _nullable_ints(column: np.ndarray) -> List[Optional[int]]:
+    return [None if v != v else int(v) for v in column.tolist()]
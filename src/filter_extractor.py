@@ -0,0 +1,555 @@
+"""
+Deterministic Filter Extractor
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Local, LLM-free translation of a free-text request ("a dark fantasy from
+2020", "something like Frieren but funnier") into
+:class:`~src.request_parser.AnimeSearchParams`, used by ``service.py`` to
+skip the ``AniListRequestMapper`` agent whenever the result is trustworthy.
+
+How it works
+------------
+* Requests are split into lower-cased word tokens.
+* "like X" / "similar to X" phrases become ``like_animes`` seed titles.
+* Regexes pick up seasons ("fall 2023", "this season") and years.
+* A word-level Aho–Corasick automaton over ``OFFICIAL_GENRES``,
+  ``genres.json``, ``tags.json`` and a synonym table ("funny" → Comedy,
+  "another world" → Isekai) matches every vocabulary phrase in one pass;
+  overlapping hits resolve leftmost-longest.
+
+The confidence score is the share of content words (stop words excluded)
+that were explained by a match, damped when the request contains
+negations the schema cannot express ("no romance"). Below the caller's
+threshold the LLM mapper should be used instead.
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import bisect
+import datetime
+import json
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from src.request_parser import AnimeSearchParams, OFFICIAL_GENRES
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+# Extractions at least this confident may replace the LLM mapper.
+FAST_PATH_MIN_CONFIDENCE: float = float(os.getenv("OSUSUME_FAST_PATH_MIN_CONFIDENCE", 0.8))
+
+# --------------------------------------------------------------------------- #
+#  Vocabulary
+# --------------------------------------------------------------------------- #
+
+# Phrase → filters it stands for; ("genre", x), ("tag", x) or ("sort", x).
+_SYNONYMS: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "scifi": (("genre", "Sci-Fi"),),
+    "science fiction": (("genre", "Sci-Fi"),),
+    "funny": (("genre", "Comedy"),),
+    "funnier": (("genre", "Comedy"),),
+    "hilarious": (("genre", "Comedy"),),
+    "comedic": (("genre", "Comedy"),),
+    "comedies": (("genre", "Comedy"),),
+    "romantic": (("genre", "Romance"),),
+    "love story": (("genre", "Romance"),),
+    "romcom": (("genre", "Romance"), ("genre", "Comedy")),
+    "rom com": (("genre", "Romance"), ("genre", "Comedy")),
+    "scary": (("genre", "Horror"),),
+    "creepy": (("genre", "Horror"),),
+    "paranormal": (("genre", "Supernatural"),),
+    "suspense": (("genre", "Thriller"),),
+    "suspenseful": (("genre", "Thriller"),),
+    "mysteries": (("genre", "Mystery"),),
+    "adventurous": (("genre", "Adventure"),),
+    "action packed": (("genre", "Action"),),
+    "fighting": (("genre", "Action"),),
+    "emotional": (("genre", "Drama"),),
+    "sad": (("genre", "Drama"), ("tag", "Tragedy")),
+    "tearjerker": (("genre", "Drama"), ("tag", "Tragedy")),
+    "dark fantasy": (("genre", "Fantasy"), ("tag", "Tragedy")),
+    "musical": (("genre", "Music"),),
+    "sport": (("genre", "Sports"),),
+    "magical girl": (("genre", "Mahou Shoujo"),),
+    "giant robot": (("genre", "Mecha"),),
+    "mech": (("genre", "Mecha"),),
+    "sol": (("genre", "Slice of Life"),),
+    "cozy": (("tag", "Iyashikei"),),
+    "comfy": (("tag", "Iyashikei"),),
+    "relaxing": (("tag", "Iyashikei"),),
+    "healing": (("tag", "Iyashikei"),),
+    "wholesome": (("tag", "Iyashikei"),),
+    "school life": (("tag", "School"),),
+    "high school": (("tag", "School"),),
+    "highschool": (("tag", "School"),),
+    "another world": (("tag", "Isekai"),),
+    "other world": (("tag", "Isekai"),),
+    "reincarnated": (("tag", "Reincarnation"),),
+    "harem": (("tag", "Female Harem"),),
+    "reverse harem": (("tag", "Male Harem"),),
+    "lgbt": (("tag", "LGBTQ+ Themes"),),
+    "lgbtq": (("tag", "LGBTQ+ Themes"),),
+    "shoujo ai": (("tag", "Yuri"),),
+    "girls love": (("tag", "Yuri"),),
+    "shounen ai": (("tag", "Boys' Love"),),
+    "bl": (("tag", "Boys' Love"),),
+    "shonen": (("tag", "Shounen"),),
+    "shojo": (("tag", "Shoujo"),),
+    "elves": (("tag", "Elf"),),
+    "witches": (("tag", "Witch"),),
+    "apocalypse": (("tag", "Post-Apocalyptic"),),
+    "apocalyptic": (("tag", "Post-Apocalyptic"),),
+    "time travel": (("tag", "Time Manipulation"),),
+    "superpowers": (("tag", "Super Power"),),
+    "super powers": (("tag", "Super Power"),),
+    "ai": (("tag", "Artificial Intelligence"),),
+    "gaming": (("tag", "Video Games"),),
+    "cooking": (("tag", "Food"),),
+    "cute girls": (("tag", "Cute Girls Doing Cute Things"),),
+    "cgdct": (("tag", "Cute Girls Doing Cute Things"),),
+    "popular": (("sort", "POPULARITY_DESC"),),
+    "most popular": (("sort", "POPULARITY_DESC"),),
+    "top rated": (("sort", "SCORE_DESC"),),
+    "highest rated": (("sort", "SCORE_DESC"),),
+    "highly rated": (("sort", "SCORE_DESC"),),
+    "best": (("sort", "SCORE_DESC"),),
+    "acclaimed": (("sort", "SCORE_DESC"),),
+}
+
+# Tags that are too often plain English to match on their own.
+_AMBIGUOUS_TAGS = frozenset({
+    "Acting", "Band", "Bar", "Feet", "Flash", "Foreign", "Inn", "Kids", "Meta",
+    "POV", "Sweat", "Work",
+})
+
+# Words that carry no filter meaning and don't count against confidence.
+_STOP_WORDS = frozenset("""
+    a about after all also am an and anime animes any anything are as at
+    be been but can could do does doing for from genre genres get give
+    good great has have help i id im in into is it its just kind kinds
+    like lot me might more most much my need new of on one ones or please
+    preferably really recommend recommendation recommendations series set
+    should show shows so some something stuff suggest suggestions tag tags
+    that the them theme themed themes there these thing things this to
+    type vibe vibes wanna want watch we what where which who will with
+    would you your
+""".split())
+
+# Tokens that make a request impossible to express as positive filters.
+_NEGATIONS = frozenset({
+    "avoid", "dislike", "dont", "except", "hate", "isnt", "no", "nothing",
+    "not", "without",
+})
+
+# "like X" introducers, and words before "like" that make it a verb.
+_LIKE_PHRASES: Tuple[Tuple[str, ...], ...] = (
+    ("similar", "to"), ("such", "as"), ("reminiscent", "of"), ("like",),
+)
+_LIKE_VERB_SUBJECTS = frozenset({"i", "id", "we", "you", "they", "would", "really", "also", "dont"})
+# Words that end a seed title, unless the title visibly goes on after them
+# ("Ghost in the Shell", "Made in Abyss").
+_TITLE_STOP_WORDS = frozenset({
+    "but", "with", "without", "from", "in", "that", "which", "except", "only",
+    "set", "released", "during", "aired", "though", "please",
+})
+# Words skipped when checking whether a title goes on past a stop word.
+_TITLE_ARTICLES = frozenset({"the", "a", "an"})
+# Characters (outside tokens) that end a seed title.
+_TITLE_STOP_CHARS = re.compile(r"[.!?;()]")
+
+_NEGATION_PENALTY: float = 0.5
+
+# --------------------------------------------------------------------------- #
+#  Temporal regexes (run over the space-joined token string)
+# --------------------------------------------------------------------------- #
+
+_SEASONS = ("WINTER", "SPRING", "SUMMER", "FALL")
+_SEASON_WORDS = {"winter": "WINTER", "spring": "SPRING", "summer": "SUMMER",
+                 "fall": "FALL", "autumn": "FALL"}
+
+_SEASON_RE = re.compile(
+    r"\b(?:(this|current|last|previous|next)\s+)?"
+    r"(winter|spring|summer|fall|autumn)"
+    r"(?:\s+(?:season\s+)?(?:of\s+)?((?:19[6-9]|20\d)\d))?"
+    r"(\s+(?:season|anime|animes|lineup))?\b"
+)
+_RELATIVE_RE = re.compile(r"\b(this|current|last|previous|next)\s+(season|year)\b")
+_YEAR_RE = re.compile(r"\b(?:19[6-9]|20\d)\d\b")
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:'[A-Za-z]+)?")
+
+# --------------------------------------------------------------------------- #
+#  Result schema
+# --------------------------------------------------------------------------- #
+
+class FilterExtraction(BaseModel):
+    """Extracted filters plus how much of the request they explain."""
+
+    params: AnimeSearchParams
+    confidence: float
+    matched: List[str] = []
+    unmatched: List[str] = []
+
+# --------------------------------------------------------------------------- #
+#  Aho–Corasick over words
+# --------------------------------------------------------------------------- #
+
+class _WordAutomaton:
+    """Aho–Corasick automaton whose alphabet is whole tokens."""
+
+    def __init__(self, phrases: Dict[Tuple[str, ...], Any]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        for tokens, payload in phrases.items():
+            self._add(tokens, payload)
+        self._link()
+
+    def _add(self, tokens: Sequence[str], payload: Any) -> None:
+        node = 0
+        for token in tokens:
+            child = self._goto[node].get(token)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][token] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = child
+        self._out[node].append((len(tokens), payload))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, tokens: Sequence[str]) -> Iterator[Tuple[int, int, Any]]:
+        """Yield ``(start, end, payload)`` for every phrase occurrence."""
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for length, payload in self._out[node]:
+                yield i + 1 - length, i + 1, payload
+
+# --------------------------------------------------------------------------- #
+#  Extractor
+# --------------------------------------------------------------------------- #
+
+def _normalise(text: str) -> List[str]:
+    """Lower-cased tokens with possessives dropped ("spring's" → "spring")."""
+    return [
+        re.sub(r"'s$", "", m.group(0).casefold()).replace("'", "")
+        for m in _TOKEN_RE.finditer(text)
+    ]
+
+
+def _variants(tokens: List[str]) -> Iterator[Tuple[str, ...]]:
+    """The phrase itself plus its naive singular/plural ("robots" ↔ "robot")."""
+    yield tuple(tokens)
+    last = tokens[-1]
+    if last.isdigit():
+        return
+    if last.endswith(("ss", "us")):
+        # "villainess", "succubus": not a plural, and "-es" makes one.
+        yield tuple(tokens[:-1] + [last + "es"])
+    elif last.endswith("s") and len(last) > 3:
+        yield tuple(tokens[:-1] + [last[:-1]])
+    else:
+        yield tuple(tokens[:-1] + [last + "s"])
+
+
+def _season_of(day: datetime.date) -> Tuple[str, int]:
+    """AniList season and seasonYear of a date (December counts as next winter)."""
+    if day.month == 12:
+        return "WINTER", day.year + 1
+    return _SEASONS[(day.month % 12) // 3], day.year
+
+
+def _shift_season(season: str, year: int, steps: int) -> Tuple[str, int]:
+    index = _SEASONS.index(season) + steps
+    return _SEASONS[index % 4], year + index // 4
+
+
+class FilterExtractor:
+    """Turns request text into :class:`AnimeSearchParams` without an LLM."""
+
+    def __init__(
+        self,
+        genres: Sequence[str],
+        tags: Sequence[str],
+        synonyms: Dict[str, Tuple[Tuple[str, str], ...]] = _SYNONYMS,
+    ) -> None:
+        phrases: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
+
+        def add(phrase: str, target: Tuple[str, str]) -> None:
+            tokens = _normalise(phrase)
+            if not tokens:
+                return
+            for variant in _variants(tokens):
+                targets = phrases.setdefault(variant, [])
+                if target not in targets:
+                    targets.append(target)
+
+        for genre in genres:
+            add(genre, ("genre", genre))
+        for tag in tags:
+            if tag not in _AMBIGUOUS_TAGS:
+                add(tag, ("tag", tag))
+        for phrase, targets in synonyms.items():
+            for target in targets:
+                add(phrase, target)
+
+        self._automaton = _WordAutomaton({k: tuple(v) for k, v in phrases.items()})
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def extract(self, text: str, today: Optional[datetime.date] = None) -> FilterExtraction:
+        """Extract filters from *text* and score how completely they cover it."""
+        spans = [(m.start(), m.end()) for m in _TOKEN_RE.finditer(text)]
+        tokens = _normalise(text)
+        covered = [False] * len(tokens)
+        matched: List[str] = []
+        found: Dict[str, Any] = {}
+
+        titles = self._extract_titles(text, tokens, spans, covered)
+        if titles:
+            found["like_animes"] = ", ".join(titles)
+            matched.extend(f"like:{t}" for t in titles)
+
+        self._extract_temporal(tokens, covered, found, matched, today or datetime.date.today())
+        self._extract_vocabulary(tokens, covered, found, matched)
+
+        content = [i for i, tok in enumerate(tokens) if tok not in _STOP_WORDS]
+        unmatched = [tokens[i] for i in content if not covered[i]]
+        confidence = 0.0
+        if found and content:
+            confidence = sum(covered[i] for i in content) / len(content)
+        if any(tok in _NEGATIONS for tok in tokens):
+            confidence *= _NEGATION_PENALTY
+
+        return FilterExtraction(
+            params=AnimeSearchParams(**found),
+            confidence=round(confidence, 3),
+            matched=matched,
+            unmatched=unmatched,
+        )
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers
+    # ------------------------------------------------------------------ #
+
+    def _extract_titles(
+        self, text: str, tokens: List[str], spans: List[Tuple[int, int]], covered: List[bool]
+    ) -> List[str]:
+        """Pull "like X, Y" seed titles out of the original (cased) text."""
+        titles: List[str] = []
+        # "like Frieren with Romance": a genre or tag after a stop word is a filter.
+        vocabulary = {start for start, _, _ in self._automaton.find(tokens)}
+        i = 0
+        while i < len(tokens):
+            intro = next(
+                (p for p in _LIKE_PHRASES if tuple(tokens[i:i + len(p)]) == p), None
+            )
+            if intro is None or covered[i] or (
+                intro == ("like",) and i > 0 and tokens[i - 1] in _LIKE_VERB_SUBJECTS
+            ):
+                i += 1
+                continue
+
+            start = end = i + len(intro)
+            while end < len(tokens):
+                gap = text[spans[end - 1][1]:spans[end][0]] if end > start else ""
+                if _TITLE_STOP_CHARS.search(gap):
+                    break
+                if tokens[end] in _TITLE_STOP_WORDS and (
+                    end == start or not self._title_goes_on(text, tokens, spans, end, vocabulary)
+                ):
+                    break
+                end += 1
+            if end == start:
+                i += 1
+                continue
+
+            raw = text[spans[start][0]:spans[end - 1][1]]
+            titles.extend(t.strip() for t in re.split(r",|\bor\b", raw) if t.strip())
+            for j in range(i, end):
+                covered[j] = True
+            i = end
+        return titles
+
+    @staticmethod
+    def _title_goes_on(
+        text: str, tokens: List[str], spans: List[Tuple[int, int]], stop: int, vocabulary: set
+    ) -> bool:
+        """True when the stop word at *stop* is followed, past any articles,
+        by a capitalised word in the same clause that starts no genre or tag."""
+        j = stop + 1
+        while j < len(tokens) and tokens[j] in _TITLE_ARTICLES:
+            j += 1
+        if j >= len(tokens) or j in vocabulary or _TITLE_STOP_CHARS.search(text[spans[stop][1]:spans[j][0]]):
+            return False
+        return text[spans[j][0]].isupper()
+
+    @staticmethod
+    def _extract_temporal(
+        tokens: List[str],
+        covered: List[bool],
+        found: Dict[str, Any],
+        matched: List[str],
+        today: datetime.date,
+    ) -> None:
+        # Titles are masked so "like Blade Runner 2049" yields no year.
+        masked = [("_" if c else t) for t, c in zip(tokens, covered)]
+        joined = " ".join(masked)
+        starts = []
+        offset = 0
+        for tok in masked:
+            starts.append(offset)
+            offset += len(tok) + 1
+
+        def cover(m: re.Match) -> None:
+            first = bisect.bisect_right(starts, m.start()) - 1
+            last = bisect.bisect_right(starts, m.end() - 1) - 1
+            for j in range(first, last + 1):
+                covered[j] = True
+            matched.append(m.group(0))
+
+        current_season, current_year = _season_of(today)
+        seasons: Dict[Tuple[str, Optional[int]], None] = {}
+        years: Dict[int, None] = {}
+
+        for m in _RELATIVE_RE.finditer(joined):
+            step = {"last": -1, "previous": -1, "next": 1}.get(m.group(1), 0)
+            if m.group(2) == "season":
+                seasons[_shift_season(current_season, current_year, step)] = None
+            else:
+                years[today.year + step] = None
+            cover(m)
+
+        for m in _SEASON_RE.finditer(joined):
+            qualifier, word, year, suffix = m.groups()
+            # "fall" alone is usually the verb ("fall in love").
+            if word == "fall" and not (qualifier or year or suffix):
+                continue
+            season = _SEASON_WORDS[word]
+            if year:
+                seasons[(season, int(year))] = None
+            elif qualifier:
+                # Seasons ahead of now: "this" = nearest, "last" = one cycle back.
+                shift = (_SEASONS.index(season) - _SEASONS.index(current_season)) % 4
+                if qualifier in ("last", "previous"):
+                    shift -= 4
+                elif qualifier == "next" and shift == 0:
+                    shift = 4
+                seasons[_shift_season(current_season, current_year, shift)] = None
+            else:
+                seasons[(season, None)] = None
+            cover(m)
+
+        for m in _YEAR_RE.finditer(joined):
+            if covered[bisect.bisect_right(starts, m.start()) - 1]:
+                continue
+            years[int(m.group(0))] = None
+            cover(m)
+
+        # The schema holds one season and one year; ranges stay unexplained.
+        if len(seasons) == 1:
+            season, season_year = next(iter(seasons))
+            found["season"] = season
+            if season_year is not None:
+                years.setdefault(season_year, None)
+        elif seasons:
+            matched.append("ambiguous-season")
+        if len(years) == 1:
+            found["year"] = next(iter(years))
+        elif years:
+            for j, tok in enumerate(tokens):
+                if _YEAR_RE.fullmatch(tok):
+                    covered[j] = False
+
+    def _extract_vocabulary(
+        self,
+        tokens: List[str],
+        covered: List[bool],
+        found: Dict[str, Any],
+        matched: List[str],
+    ) -> None:
+        # Covered tokens become a sentinel no phrase can contain.
+        masked = [("\0" if c else t) for t, c in zip(tokens, covered)]
+        hits = sorted(self._automaton.find(masked), key=lambda h: (h[0], h[0] - h[1]))
+
+        genres: List[str] = []
+        tags: List[str] = []
+        position = 0
+        for start, end, targets in hits:
+            if start < position:
+                continue
+            position = end
+            for j in range(start, end):
+                covered[j] = True
+            matched.append(" ".join(tokens[start:end]))
+            for kind, value in targets:
+                if kind == "genre" and value not in genres:
+                    genres.append(value)
+                elif kind == "tag" and value not in tags:
+                    tags.append(value)
+                elif kind == "sort":
+                    found.setdefault("sort", value)
+
+        if genres:
+            found["genres"] = genres
+        if tags:
+            found["tags"] = tags
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_extractor: Optional[FilterExtractor] = None
+_shared_lock = threading.Lock()
+
+
+def _load_names(filename: str) -> List[str]:
+    with open(os.path.join(parent_dir, filename), encoding="utf-8") as f:
+        return list(json.load(f))
+
+
+def get_filter_extractor() -> FilterExtractor:
+    """Return the process-wide extractor over the bundled vocabularies."""
+    global _shared_extractor
+    if _shared_extractor is None:
+        with _shared_lock:
+            if _shared_extractor is None:
+                genres = list(dict.fromkeys(OFFICIAL_GENRES + _load_names("genres.json")))
+                _shared_extractor = FilterExtractor(genres, _load_names("tags.json"))
+    return _shared_extractor
+
+
+def extract_filters(text: str) -> FilterExtraction:
+    """Shortcut for ``get_filter_extractor().extract(text)``."""
+    return get_filter_extractor().extract(text)
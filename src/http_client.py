@@ -0,0 +1,346 @@
+"""
+HTTP Client Layer
+~~~~~~~~~~~~~~~~~
+Shared, pooled ``httpx`` clients for all outbound traffic: AniList GraphQL
+and the OpenAI SDK, each sync and async.
+
+Features
+--------
+* Keep-alive connection pools with a bounded size, HTTP/2 when the ``h2``
+  package is installed.
+* Retries with full-jitter exponential backoff on 429 / 5xx and transient
+  network errors, honouring AniList's ``Retry-After`` header.
+* Pool-utilisation counters per client (:func:`pool_stats`).
+* Every AniList attempt first takes a token from the shared
+  :mod:`src.rate_limiter` bucket; a 429 throttles all workers.
+* Request/response body sizes are added to the current
+  :mod:`src.tracing` span.
+
+Async connections belong to the event loop that opened them, so one async
+client is kept per running loop; the sync clients are process-wide.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_ANILIST_URL``            GraphQL endpoint.
+``OSUSUME_HTTP_TIMEOUT_S``         Per-request timeout (10 s).
+``OSUSUME_HTTP_MAX_CONNECTIONS``   Pool size per client (32).
+``OSUSUME_HTTP_MAX_KEEPALIVE``     Idle connections kept open (16).
+``OSUSUME_HTTP_HTTP2``             Set to ``0`` to force HTTP/1.1.
+``OSUSUME_HTTP_RETRIES``           Retries after the first attempt (3).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src.rate_limiter import get_rate_limiter
+from src.tracing import current_span
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+ANILIST_API_URL: str = os.getenv("OSUSUME_ANILIST_URL", "https://graphql.anilist.co")
+_REQUEST_TIMEOUT_S: float = float(os.getenv("OSUSUME_HTTP_TIMEOUT_S", 10))
+_POOL_MAX_CONNECTIONS: int = int(os.getenv("OSUSUME_HTTP_MAX_CONNECTIONS", 32))
+_POOL_MAX_KEEPALIVE: int = int(os.getenv("OSUSUME_HTTP_MAX_KEEPALIVE", 16))
+_HTTP2_WANTED: bool = os.getenv("OSUSUME_HTTP_HTTP2", "1") != "0"
+
+_RETRIES: int = int(os.getenv("OSUSUME_HTTP_RETRIES", 3))
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_BACKOFF_BASE_S: float = 0.5
+_BACKOFF_MAX_S: float = 8.0
+# Give up instead of sleeping when the server asks us to wait longer than this.
+_RETRY_AFTER_MAX_S: float = 60.0
+
+try:  # HTTP/2 needs the optional ``h2`` package
+    import h2  # noqa: F401
+    _HTTP2: bool = _HTTP2_WANTED
+except ImportError:
+    _HTTP2 = False
+
+# --------------------------------------------------------------------------- #
+#  Metrics
+# --------------------------------------------------------------------------- #
+
+class _PoolMetrics:
+    """In-flight / peak / retry counters for one logical client."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def fail(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": _POOL_MAX_CONNECTIONS,
+                "utilisation": self.in_flight / _POOL_MAX_CONNECTIONS,
+            }
+
+
+_metrics: Dict[str, _PoolMetrics] = {
+    "anilist": _PoolMetrics(),
+    "anilist_async": _PoolMetrics(),
+}
+
+
+def _connection_counts(client: Optional[httpx.Client | httpx.AsyncClient]) -> Dict[str, int]:
+    """Open/idle connection counts from the transport pool, when exposed."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    return {
+        "open_connections": len(connections),
+        "idle_connections": sum(1 for c in connections if c.is_idle()),
+    }
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Return request, retry and connection-pool counters for each client."""
+    stats = {name: m.snapshot() for name, m in _metrics.items()}
+    stats["anilist"].update(_connection_counts(_sync_client))
+    stats["anilist"]["http2"] = _HTTP2
+    return stats
+
+# --------------------------------------------------------------------------- #
+#  Client construction
+# --------------------------------------------------------------------------- #
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=_POOL_MAX_KEEPALIVE,
+    )
+
+
+_sync_client: Optional[httpx.Client] = None
+_openai_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """Return the process-wide pooled :class:`httpx.Client` used for AniList."""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(
+                    timeout=_REQUEST_TIMEOUT_S, limits=_limits(), http2=_HTTP2
+                )
+    return _sync_client
+
+
+def get_openai_http_client() -> httpx.Client:
+    """Return a pooled :class:`httpx.Client` to pass to ``OpenAI(http_client=...)``.
+
+    The OpenAI SDK adds its own retries, so this client only contributes the
+    bounded keep-alive pool and HTTP/2.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _sync_lock:
+            if _openai_client is None:
+                _openai_client = httpx.Client(
+                    timeout=httpx.Timeout(60.0, connect=5.0), limits=_limits(), http2=_HTTP2
+                )
+    return _openai_client
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_openai_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_async_lock = threading.Lock()
+
+
+def _loop_client(clients: weakref.WeakKeyDictionary, timeout: httpx.Timeout | float) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None or client.is_closed:
+        with _async_lock:
+            client = clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(timeout=timeout, limits=_limits(), http2=_HTTP2)
+                clients[loop] = client
+    return client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled :class:`httpx.AsyncClient` for the running event loop."""
+    return _loop_client(_async_clients, _REQUEST_TIMEOUT_S)
+
+
+def get_openai_async_http_client() -> httpx.AsyncClient:
+    """Async :func:`get_openai_http_client` for ``AsyncOpenAI``, one per running loop."""
+    return _loop_client(_openai_async_clients, httpx.Timeout(60.0, connect=5.0))
+
+# --------------------------------------------------------------------------- #
+#  Retry policy
+# --------------------------------------------------------------------------- #
+
+def _retry_after_s(resp: httpx.Response) -> Optional[float]:
+    """Parse a ``Retry-After`` header given in seconds or as an HTTP date."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def _backoff_s(attempt: int, resp: Optional[httpx.Response]) -> Optional[float]:
+    """Seconds to wait before retry *attempt* (0-based), or ``None`` to give up."""
+    if attempt >= _RETRIES:
+        return None
+    if resp is not None:
+        retry_after = _retry_after_s(resp)
+        if retry_after is not None:
+            if retry_after > _RETRY_AFTER_MAX_S:
+                return None
+            # Small jitter so waiting workers don't all retry in the same tick.
+            return retry_after + random.uniform(0, _BACKOFF_BASE_S)
+    return random.uniform(0, min(_BACKOFF_MAX_S, _BACKOFF_BASE_S * 2 ** attempt))
+
+
+def _check_payload(resp: httpx.Response, raise_on_errors: bool) -> Dict[str, Any]:
+    if resp.status_code != 200:
+        raise RuntimeError(
+            f"AniList query failed (HTTP {resp.status_code}): {resp.text}"
+        )
+
+    payload = resp.json()
+    if raise_on_errors and "errors" in payload:
+        raise RuntimeError(f"AniList returned errors: {payload['errors']!r}")
+
+    return payload
+
+# --------------------------------------------------------------------------- #
+#  GraphQL helpers
+# --------------------------------------------------------------------------- #
+
+def post_graphql(
+    query: str, variables: Dict[str, Any], raise_on_errors: bool = True
+) -> Dict[str, Any]:
+    """Send a GraphQL request to AniList over the pooled client, with retries."""
+    metrics = _metrics["anilist"]
+    limiter = get_rate_limiter()
+    body = {"query": query, "variables": variables}
+    attempt = 0
+    while True:
+        limiter.acquire()
+        metrics.start()
+        try:
+            resp = get_client().post(ANILIST_API_URL, json=body)
+            current_span().http_bytes(len(resp.request.content), len(resp.content))
+        except httpx.TransportError as exc:
+            delay = _backoff_s(attempt, None)
+            if delay is None:
+                metrics.fail()
+                raise RuntimeError(f"Network error talking to AniList: {exc}") from exc
+        else:
+            delay = _backoff_s(attempt, resp) if resp.status_code in _RETRY_STATUSES else None
+            if resp.status_code == 429:
+                limiter.throttle(_retry_after_s(resp) or delay or _BACKOFF_BASE_S)
+                if delay is not None:
+                    # The drained bucket already holds us back; just de-synchronise.
+                    delay = random.uniform(0, _BACKOFF_BASE_S)
+            if delay is None:
+                if resp.status_code != 200:
+                    metrics.fail()
+                return _check_payload(resp, raise_on_errors)
+        finally:
+            metrics.finish()
+
+        metrics.retry()
+        time.sleep(delay)
+        attempt += 1
+
+
+async def apost_graphql(
+    query: str, variables: Dict[str, Any], raise_on_errors: bool = True
+) -> Dict[str, Any]:
+    """Async :func:`post_graphql` that never blocks the event loop."""
+    metrics = _metrics["anilist_async"]
+    limiter = get_rate_limiter()
+    body = {"query": query, "variables": variables}
+    attempt = 0
+    while True:
+        await limiter.aacquire()
+        metrics.start()
+        try:
+            resp = await get_async_client().post(ANILIST_API_URL, json=body)
+            current_span().http_bytes(len(resp.request.content), len(resp.content))
+        except httpx.TransportError as exc:
+            delay = _backoff_s(attempt, None)
+            if delay is None:
+                metrics.fail()
+                raise RuntimeError(f"Network error talking to AniList: {exc}") from exc
+        else:
+            delay = _backoff_s(attempt, resp) if resp.status_code in _RETRY_STATUSES else None
+            if resp.status_code == 429:
+                await limiter.athrottle(_retry_after_s(resp) or delay or _BACKOFF_BASE_S)
+                if delay is not None:
+                    # The drained bucket already holds us back; just de-synchronise.
+                    delay = random.uniform(0, _BACKOFF_BASE_S)
+            if delay is None:
+                if resp.status_code != 200:
+                    metrics.fail()
+                return _check_payload(resp, raise_on_errors)
+        finally:
+            metrics.finish()
+
+        metrics.retry()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def aclose() -> None:
+    """Close the clients bound to the running loop (e.g. on app shutdown)."""
+    loop = asyncio.get_running_loop()
+    for clients in (_async_clients, _openai_async_clients):
+        client = clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
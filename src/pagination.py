@@ -0,0 +1,135 @@
+"""
+Deep Pagination
+~~~~~~~~~~~~~~~
+Streams AniList ``Page`` results across pages (``pageInfo.hasNextPage``), so
+callers that need a few hundred candidates get them from one call instead of
+one call per page.
+
+Features
+--------
+* Media are yielded as each page arrives; nothing is collected into a list.
+* The next page is requested while the caller consumes the current one, on a
+  one-thread pool (sync) or an asyncio task (async). Both run in a copy of the
+  caller's context, so rate-limit priority and tracing spans carry over.
+* Stops at the caller's *limit*. A page is only requested if the media already
+  in hand can't reach the limit, so no page past the limit is ever fetched.
+* Media seen on an earlier page are skipped. Popularity sorts can shift while
+  we page.
+* Closing the iterator early (``break``, ``aclose()``) cancels the prefetch.
+
+Page fetchers take GraphQL variables and return the ``Page`` object
+(``{"media": [...], "pageInfo": {"hasNextPage": ...}}``). Pages without
+``pageInfo``, such as local catalog answers, are treated as the last page
+once they come back short.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+# AniList's largest page.
+MAX_PER_PAGE: int = 50
+# Hard stop for unbounded walks (50 × 100 = 5000 media).
+MAX_PAGES: int = 100
+
+PageFetcher = Callable[[Dict[str, Any]], Dict[str, Any]]
+AsyncPageFetcher = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# --------------------------------------------------------------------------- #
+#  Iterators
+# --------------------------------------------------------------------------- #
+
+def iter_media(
+    fetch_page: PageFetcher,
+    variables: Dict[str, Any],
+    limit: Optional[int] = None,
+    max_pages: int = MAX_PAGES,
+) -> Iterator[Dict[str, Any]]:
+    """Yield media from ``fetch_page`` page by page, one page ahead of the caller."""
+    if limit is not None and limit <= 0:
+        return
+    first = int(variables.get("page") or 1)
+    walk = _Walk(variables, limit, max_pages)
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="anilist-page")
+    future: Optional[Future] = pool.submit(
+        contextvars.copy_context().run, fetch_page, walk.variables_for(first)
+    )
+    try:
+        while future is not None:
+            fresh, next_page = walk.accept(future.result())
+            future = None
+            if next_page is not None:
+                future = pool.submit(
+                    contextvars.copy_context().run, fetch_page, walk.variables_for(next_page)
+                )
+            yield from fresh
+    finally:
+        if future is not None:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_media(
+    afetch_page: AsyncPageFetcher,
+    variables: Dict[str, Any],
+    limit: Optional[int] = None,
+    max_pages: int = MAX_PAGES,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async :func:`iter_media`; the next page is fetched by a background task."""
+    if limit is not None and limit <= 0:
+        return
+    first = int(variables.get("page") or 1)
+    walk = _Walk(variables, limit, max_pages)
+    task: Optional[asyncio.Task] = asyncio.ensure_future(afetch_page(walk.variables_for(first)))
+    try:
+        while task is not None:
+            fresh, next_page = walk.accept(await task)
+            task = None
+            if next_page is not None:
+                task = asyncio.ensure_future(afetch_page(walk.variables_for(next_page)))
+            for media in fresh:
+                yield media
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+
+# --------------------------------------------------------------------------- #
+#  Bookkeeping shared by both iterators
+# --------------------------------------------------------------------------- #
+
+class _Walk:
+    """Tracks position, seen ids and the remaining budget of one walk."""
+
+    def __init__(self, variables: Dict[str, Any], limit: Optional[int], max_pages: int) -> None:
+        self.base = dict(variables)
+        self.per_page = int(variables.get("perPage") or MAX_PER_PAGE)
+        self.page = int(variables.get("page") or 1)
+        self.last_page = self.page + max_pages - 1
+        self.remaining = limit
+        self.seen: set = set()
+
+    def variables_for(self, page: int) -> Dict[str, Any]:
+        return {**self.base, "page": page}
+
+    def accept(self, page: Dict[str, Any]) -> tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return the unseen media of *page* (capped at the limit) and the next page, if needed."""
+        media = page.get("media") or []
+        fresh = []
+        for item in media:
+            if item["id"] not in self.seen:
+                self.seen.add(item["id"])
+                fresh.append(item)
+        if self.remaining is not None:
+            fresh = fresh[:self.remaining]
+            self.remaining -= len(fresh)
+
+        page_info = page.get("pageInfo")
+        has_next = page_info.get("hasNextPage") if page_info else len(media) >= self.per_page
+        wanted = self.remaining is None or self.remaining > 0
+        if has_next and media and wanted and self.page < self.last_page:
+            self.page += 1
+            return fresh, self.page
+        return fresh, None
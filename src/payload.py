@@ -0,0 +1,296 @@
+"""
+Compact Tool Payloads
+~~~~~~~~~~~~~~~~~~~~~
+What the researcher agent reads back from ``search_anime``. CrewAI passes a
+tool's return value to the model as ``str(result)``. For a page of ``Anime``
+dicts that is the Python repr of every field, including tag ids, ranks,
+spoiler flags, both titles, status and episode counts. A 20-result page costs
+the agent several thousand prompt tokens, once per tool call and again on
+every later turn of the conversation.
+
+Modes
+-----
+``full``     The dict list as before (``str(result)``).
+``json``     Each media projected to the configured fields, as compact JSON.
+``lines``    The same projection, one ``|``-separated line per media under a
+             header row. No key repeated per result, no quoting::
+
+                 id | title | year | format | score | genres | tags | cover
+                 154587 | Frieren: Beyond Journey's End | 2023 | TV | 90 | Adventure, Drama, Fantasy | Travel, Elf, Time Skip | https://...
+
+Fields
+------
+``id``, ``title`` (English, else Romaji), ``romaji``, ``year``, ``season``,
+``format``, ``status``, ``episodes``, ``score``, ``genres``, ``tags`` and
+``cover``. ``tags`` holds the top-N non-spoiler tags by rank; spoiler tags
+and the tag ids, ranks and flags are never shown to the agent.
+
+The projection only changes what the agent sees. Direct callers of
+``SearchAnimeTool._run`` (the direct pipeline, the benchmarks) still get full
+``Anime`` dicts. The same holds for the response cache and the local
+catalog, which keep one copy per query whatever the mode.
+
+Token accounting
+----------------
+:func:`count_tokens` uses ``tiktoken`` when installed and its encoding can
+be loaded, and ~4 characters per token otherwise. While tracing is on,
+:func:`encode_results` counts each call's payload in ``full`` form and in
+the configured form. It puts both counts on its ``payload`` span
+(``payload_tokens_full`` / ``payload_tokens``) and adds them to
+:func:`payload_stats`.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_TOOL_PAYLOAD``    ``full``, ``json`` or ``lines`` (default).
+``OSUSUME_TOOL_FIELDS``     Comma-separated fields, default
+                            ``id,title,year,format,score,genres,tags,cover``.
+``OSUSUME_TOOL_TOP_TAGS``   Tags kept per media (5).
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import functools
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from src.tracing import span
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+MODES = ("full", "json", "lines")
+DEFAULT_FIELDS = ("id", "title", "year", "format", "score", "genres", "tags", "cover")
+
+_MODE: str = os.getenv("OSUSUME_TOOL_PAYLOAD", "lines")
+_FIELDS: str = os.getenv("OSUSUME_TOOL_FIELDS", ",".join(DEFAULT_FIELDS))
+_TOP_TAGS: int = int(os.getenv("OSUSUME_TOOL_TOP_TAGS", 5))
+# Encoding used by count_tokens when the model has no tiktoken mapping.
+_FALLBACK_ENCODING: str = "o200k_base"
+
+_SEPARATOR = " | "
+
+# --------------------------------------------------------------------------- #
+#  Projection
+# --------------------------------------------------------------------------- #
+
+def _title(media: Dict[str, Any]) -> Optional[str]:
+    title = media.get("title") or {}
+    return title.get("english") or title.get("romaji")
+
+
+def top_tags(media: Dict[str, Any], n: int = _TOP_TAGS) -> List[str]:
+    """Names of the *n* highest-ranked non-spoiler tags."""
+    tags = [t for t in media.get("tags") or [] if not t.get("isMediaSpoiler")]
+    # sorted() is stable, so equal ranks keep AniList's order.
+    tags = sorted(tags, key=lambda t: -(t.get("rank") or 0))
+    return [t["name"] for t in tags[:n]]
+
+
+_EXTRACTORS: Dict[str, Callable[[Dict[str, Any], int], Any]] = {
+    "id": lambda m, n: m.get("id"),
+    "title": lambda m, n: _title(m),
+    "romaji": lambda m, n: (m.get("title") or {}).get("romaji"),
+    "year": lambda m, n: m.get("seasonYear"),
+    "season": lambda m, n: m.get("season"),
+    "format": lambda m, n: m.get("format"),
+    "status": lambda m, n: m.get("status"),
+    "episodes": lambda m, n: m.get("episodes"),
+    "score": lambda m, n: m.get("averageScore"),
+    "genres": lambda m, n: list(m.get("genres") or []),
+    "tags": top_tags,
+    "cover": lambda m, n: (m.get("coverImage") or {}).get("medium"),
+}
+FIELDS = tuple(_EXTRACTORS)
+
+
+def parse_fields(spec: str) -> tuple:
+    """``"id,title,tags"`` → a field tuple; raises ``ValueError`` on unknown names."""
+    fields = tuple(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in _EXTRACTORS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown payload fields {unknown or spec!r}; choose from {', '.join(FIELDS)}")
+    return fields
+
+
+def project(
+    media: Dict[str, Any], fields: Sequence[str] = DEFAULT_FIELDS, top_n: int = _TOP_TAGS
+) -> Dict[str, Any]:
+    """The *fields* of one ``Anime`` dict; ``None`` values are left out."""
+    out = {}
+    for name in fields:
+        value = _EXTRACTORS[name](media, top_n)
+        if value is not None:
+            out[name] = value
+    return out
+
+# --------------------------------------------------------------------------- #
+#  Encodings
+# --------------------------------------------------------------------------- #
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(v).replace(",", " ") for v in value)
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def encode_lines(
+    media: Sequence[Dict[str, Any]], fields: Sequence[str] = DEFAULT_FIELDS, top_n: int = _TOP_TAGS
+) -> str:
+    """Header row plus one ``|``-separated line per media."""
+    if not media:
+        return "No anime matched."
+    lines = [_SEPARATOR.join(fields)]
+    for m in media:
+        lines.append(_SEPARATOR.join(_cell(_EXTRACTORS[f](m, top_n)) for f in fields))
+    return "\n".join(lines)
+
+
+def decode_lines(text: str) -> List[Dict[str, str]]:
+    """Inverse of :func:`encode_lines`, as strings (list fields stay joined)."""
+    rows = [line for line in text.strip().splitlines() if _SEPARATOR.strip() in line]
+    if not rows:
+        return []
+    header = [h.strip() for h in rows[0].split("|")]
+    decoded = []
+    for row in rows[1:]:
+        cells = [c.strip() for c in row.split("|")]
+        if len(cells) == len(header):
+            decoded.append({h: c for h, c in zip(header, cells) if c})
+    return decoded
+
+
+def encode_json(
+    media: Sequence[Dict[str, Any]], fields: Sequence[str] = DEFAULT_FIELDS, top_n: int = _TOP_TAGS
+) -> str:
+    return json.dumps([project(m, fields, top_n) for m in media], ensure_ascii=False, separators=(",", ":"))
+
+
+def encode(
+    media: Sequence[Dict[str, Any]],
+    mode: str = _MODE,
+    fields: Sequence[str] = DEFAULT_FIELDS,
+    top_n: int = _TOP_TAGS,
+) -> str:
+    """*media* as the agent reads it in *mode*."""
+    if mode == "lines":
+        return encode_lines(media, fields, top_n)
+    if mode == "json":
+        return encode_json(media, fields, top_n)
+    if mode == "full":
+        return str(list(media))
+    raise ValueError(f"Unknown tool payload mode {mode!r}; choose from {', '.join(MODES)}")
+
+
+def result_format(mode: str = _MODE, fields: Sequence[str] = DEFAULT_FIELDS) -> str:
+    """One sentence for the tool description saying what the agent gets back."""
+    if mode == "lines":
+        return (
+            "Returns one line per anime under a header row "
+            f"({_SEPARATOR.join(fields)}); `cover` is the cover image URL."
+        )
+    if mode == "json":
+        return f"Returns a JSON array of anime with the keys {', '.join(fields)}."
+    return "Returns a JSON array of matching anime."
+
+# --------------------------------------------------------------------------- #
+#  Token accounting
+# --------------------------------------------------------------------------- #
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: Optional[str]):
+    """The tiktoken encoding for *model*, or ``None`` when it can't be loaded."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding(_FALLBACK_ENCODING)
+    except KeyError:
+        return _encoding(None) if model else None
+    except Exception:  # noqa: BLE001 - e.g. no network to fetch the BPE file
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Tokens in *text* for *model* (tiktoken), else a ~4 chars/token estimate."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._full = 0
+        self._sent = 0
+
+    def add(self, full: int, sent: int) -> None:
+        with self._lock:
+            self._calls += 1
+            self._full += full
+            self._sent += sent
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, full, sent = self._calls, self._full, self._sent
+        return {
+            "mode": _MODE,
+            "calls": calls,
+            "tokens_full": full,
+            "tokens_sent": sent,
+            "saved_ratio": round(1 - sent / full, 3) if full else 0.0,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls = self._full = self._sent = 0
+
+
+_stats = _Stats()
+
+
+def payload_stats() -> Dict[str, Any]:
+    """Tool calls measured (while tracing was on) and their token totals."""
+    return _stats.snapshot()
+
+
+def reset_payload_stats() -> None:
+    _stats.reset()
+
+# --------------------------------------------------------------------------- #
+#  Tool output
+# --------------------------------------------------------------------------- #
+
+_fields = parse_fields(_FIELDS)
+
+
+def encode_results(media: Sequence[Dict[str, Any]]) -> str:
+    """Encode a ``search_anime`` result for the agent with the configured mode and fields."""
+    with span("payload", mode=_MODE) as s:
+        text = encode(media, _MODE, _fields, _TOP_TAGS)
+        if s.recording:
+            full = count_tokens(str(list(media)))
+            sent = full if _MODE == "full" else count_tokens(text)
+            s.set("payload_tokens_full", full)
+            s.set("payload_tokens", sent)
+            _stats.add(full, sent)
+    return text
+
+
+def describe_results() -> str:
+    """:func:`result_format` for the configured mode and fields."""
+    return result_format(_MODE, _fields)
@@ -0,0 +1,319 @@
+"""
+Background Prefetcher
+~~~~~~~~~~~~~~~~~~~~~
+Keeps the AniList response cache warm for the searches users make all the
+time, so the first request after a cache entry expires doesn't pay the full
+AniList latency.
+
+Targets, in order of importance
+-------------------------------
+* The current and the previous season (``season`` + ``seasonYear``).
+* The most frequent ``search_anime`` queries among recent ones
+  (:func:`note_search`, keyed like the response cache).
+* Every entry of ``OFFICIAL_GENRES``.
+
+Each target is built exactly like the tool's own variables, so it shares the
+tool's cache entry.
+
+Behaviour
+---------
+* Refresh-ahead: every cycle re-fetches the targets that are missing or that
+  expire within ``OSUSUME_PREFETCH_REFRESH_AHEAD_S``. Fresh entries and
+  searches the local catalog answers are skipped.
+* Budget: at most ``OSUSUME_PREFETCH_BUDGET`` AniList requests per cycle,
+  spaced out and sent at ``Priority.BACKGROUND``. The cycle stops spending
+  as soon as an interactive or taste-profile request waits for a rate-limit
+  slot; whatever is left waits for the next cycle.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_PREFETCH``                   Set to ``1`` to run it in the API and UI.
+``OSUSUME_PREFETCH_INTERVAL_S``        Time between cycles (10 min).
+``OSUSUME_PREFETCH_REFRESH_AHEAD_S``   Refresh entries expiring within this (1 h).
+``OSUSUME_PREFETCH_BUDGET``            AniList requests per cycle (20).
+``OSUSUME_PREFETCH_TOP_QUERIES``       Frequent queries kept warm (20).
+``OSUSUME_PREFETCH_WINDOW``            Recent searches counted for frequency (1000).
+
+Usage::
+
+    python src/prefetch.py          # run one cycle and print its stats
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import argparse
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from src.cache import _DISABLED as _CACHE_DISABLED, make_key, refresh_query, remaining_ttl
+from src.catalog import search_local
+from src.filter_extractor import _season_of, _shift_season
+from src.rate_limiter import Priority, get_rate_limiter, request_priority
+from src.request_parser import OFFICIAL_GENRES
+from src.tracing import span
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_ENABLED: bool = os.getenv("OSUSUME_PREFETCH", "") == "1"
+_INTERVAL_S: float = float(os.getenv("OSUSUME_PREFETCH_INTERVAL_S", 10 * 60))
+_REFRESH_AHEAD_S: float = float(os.getenv("OSUSUME_PREFETCH_REFRESH_AHEAD_S", 60 * 60))
+_BUDGET: int = int(os.getenv("OSUSUME_PREFETCH_BUDGET", 20))
+_TOP_QUERIES: int = int(os.getenv("OSUSUME_PREFETCH_TOP_QUERIES", 20))
+_WINDOW: int = int(os.getenv("OSUSUME_PREFETCH_WINDOW", 1000))
+# Gap between two prefetch requests, so the shared bucket refills in between.
+_PACE_S: float = 1.0
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------- #
+#  Recent searches
+# --------------------------------------------------------------------------- #
+
+class QueryLog:
+    """Sliding window of recent ``search_anime`` variables, counted by cache key."""
+
+    def __init__(self, window: int = _WINDOW) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._recent: deque = deque()
+        self._counts: Counter = Counter()
+        self._variables: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, query: str, variables: Dict[str, Any]) -> None:
+        key = make_key(query, variables)
+        with self._lock:
+            self._recent.append(key)
+            self._counts[key] += 1
+            self._variables[key] = variables
+            while len(self._recent) > self.window:
+                old = self._recent.popleft()
+                self._counts[old] -= 1
+                if self._counts[old] <= 0:
+                    del self._counts[old]
+                    del self._variables[old]
+
+    def most_common(self, n: int) -> List[Dict[str, Any]]:
+        """Variables of the *n* most frequent recent searches (ties: most recent first)."""
+        with self._lock:
+            last_seen = {key: i for i, key in enumerate(self._recent)}
+            keys = sorted(self._counts, key=lambda k: (-self._counts[k], -last_seen[k]))
+            return [dict(self._variables[k]) for k in keys[:n]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self._counts.clear()
+            self._variables.clear()
+
+
+_query_log = QueryLog()
+
+
+def note_search(query: str, variables: Dict[str, Any]) -> None:
+    """Count a search that went to AniList towards the frequent-query targets."""
+    _query_log.record(query, variables)
+
+# --------------------------------------------------------------------------- #
+#  Scheduler
+# --------------------------------------------------------------------------- #
+
+class Prefetcher:
+    """Periodically refreshes popular ``search_anime`` responses ahead of expiry."""
+
+    def __init__(
+        self,
+        interval_s: float = _INTERVAL_S,
+        refresh_ahead_s: float = _REFRESH_AHEAD_S,
+        budget: int = _BUDGET,
+        top_queries: int = _TOP_QUERIES,
+        log: QueryLog = _query_log,
+    ) -> None:
+        self.interval_s = interval_s
+        self.refresh_ahead_s = refresh_ahead_s
+        self.budget = budget
+        self.top_queries = top_queries
+        self.log = log
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Any] = {
+            "cycles": 0,
+            "refreshed": 0,
+            "fresh": 0,
+            "local": 0,
+            "deferred": 0,
+            "failed": 0,
+            "last_cycle_s": None,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def targets(self, today: Optional[datetime.date] = None) -> List[Dict[str, Any]]:
+        """Variables to keep warm, most important first, without duplicates."""
+        season, year = _season_of(today or datetime.date.today())
+        previous = _shift_season(season, year, -1)
+
+        wanted = [
+            self._tool_variables(season=season, year=year),
+            self._tool_variables(season=previous[0], year=previous[1]),
+            *self.log.most_common(self.top_queries),
+            *(self._tool_variables(genres=[genre]) for genre in OFFICIAL_GENRES),
+        ]
+        query = self._query()
+        unique: Dict[str, Dict[str, Any]] = {}
+        for variables in wanted:
+            unique.setdefault(make_key(query, variables), variables)
+        return list(unique.values())
+
+    def run_once(self, today: Optional[datetime.date] = None) -> Dict[str, int]:
+        """Run one refresh cycle; return what happened to each target."""
+        from src.recommender import _post_to_anilist
+
+        query = self._query()
+        limiter = get_rate_limiter()
+        cycle = {"refreshed": 0, "fresh": 0, "local": 0, "deferred": 0, "failed": 0}
+        started = time.monotonic()
+
+        with span("prefetch"), request_priority(Priority.BACKGROUND):
+            for variables in self.targets(today):
+                if search_local(variables) is not None:
+                    cycle["local"] += 1
+                    continue
+                remaining = remaining_ttl(query, variables)
+                if remaining is not None and remaining > self.refresh_ahead_s:
+                    cycle["fresh"] += 1
+                    continue
+                spent = cycle["refreshed"] + cycle["failed"]
+                if spent >= self.budget or self._stop.is_set() or self._others_waiting(limiter):
+                    cycle["deferred"] += 1
+                    continue
+                if spent and self._stop.wait(_PACE_S):
+                    cycle["deferred"] += 1
+                    continue
+                try:
+                    refresh_query(_post_to_anilist, query, variables)
+                    cycle["refreshed"] += 1
+                except Exception as exc:  # noqa: BLE001 - one bad target must not stop the cycle
+                    logger.warning("Prefetch of %r failed: %s", variables, exc)
+                    cycle["failed"] += 1
+
+        with self._lock:
+            self._stats["cycles"] += 1
+            for name, count in cycle.items():
+                self._stats[name] += count
+            self._stats["last_cycle_s"] = round(time.monotonic() - started, 3)
+        return cycle
+
+    def start(self) -> None:
+        """Start the background thread (no-op if running or the cache is off)."""
+        if _CACHE_DISABLED or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="osusume-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout_s: float = 5.0) -> None:
+        """Ask the background thread to stop and wait up to *timeout_s* for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["running"] = self._thread is not None and self._thread.is_alive()
+        return snapshot
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers
+    # ------------------------------------------------------------------ #
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:  # noqa: BLE001 - keep the scheduler alive
+                logger.exception("Prefetch cycle failed")
+            self._stop.wait(self.interval_s)
+
+    @staticmethod
+    def _others_waiting(limiter) -> bool:
+        """True while interactive or taste-profile requests queue for a slot."""
+        depth = limiter.stats()["queue_depth"]
+        return any(n for name, n in depth.items() if name != Priority.BACKGROUND.name)
+
+    @staticmethod
+    def _query() -> str:
+        from src.recommender import _GRAPHQL_QUERY
+
+        return _GRAPHQL_QUERY
+
+    @staticmethod
+    def _tool_variables(**kwargs: Any) -> Dict[str, Any]:
+        # Same defaults and shaping as a search_anime tool call.
+        from src.recommender import SearchAnimeTool, SearchAnimeToolInput
+
+        return SearchAnimeTool._build_variables(SearchAnimeToolInput(**kwargs))
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_prefetcher: Optional[Prefetcher] = None
+_shared_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Return the process-wide :class:`Prefetcher`."""
+    global _shared_prefetcher
+    if _shared_prefetcher is None:
+        with _shared_lock:
+            if _shared_prefetcher is None:
+                _shared_prefetcher = Prefetcher()
+    return _shared_prefetcher
+
+
+def start_prefetcher() -> bool:
+    """Start the shared prefetcher if ``OSUSUME_PREFETCH=1``; return whether it runs."""
+    if not _ENABLED:
+        return False
+    prefetcher = get_prefetcher()
+    prefetcher.start()
+    return prefetcher.stats()["running"]
+
+
+def stop_prefetcher() -> None:
+    if _shared_prefetcher is not None:
+        _shared_prefetcher.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run one prefetch cycle.")
+    parser.add_argument("--budget", type=int, default=_BUDGET)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    print(json.dumps(Prefetcher(budget=args.budget).run_once()))
+
+
+if __name__ == "__main__":
+    main()
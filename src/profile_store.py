@@ -0,0 +1,289 @@
+"""
+Profile Store
+~~~~~~~~~~~~~
+Persistent memo of the analyzer's ``title → (genres, tags)`` answers, keyed
+by AniList media id plus a fingerprint of the prompt and model. A seed title
+that has been analysed once never reaches the LLM again until its entry is
+invalidated.
+
+Invalidation
+------------
+* Changing the analyzer prompt or model changes the fingerprint, so old
+  entries are simply never read again.
+* ``OSUSUME_PROFILE_MAX_AGE_S`` expires entries by age (``0`` = never).
+* :meth:`ProfileStore.invalidate` drops one media id or everything.
+
+Metrics
+-------
+Hits, misses, stores and expiries are counted per process and also added to
+a ``counters`` table in the same SQLite file. That table keeps the lifetime
+totals of every process using the store. Counts are flushed to it in
+batches (every 100 events or 10 s, on :meth:`ProfileStore.stats` and on
+:meth:`ProfileStore.flush`/``close``, which runs at exit), so a lookup
+stays a read. :meth:`ProfileStore.stats` returns both; ``llm_calls_saved`` is the lifetime hit count, which is what
+``python src/profile_store.py stats`` prints. The API reports them under
+``"profiles"`` in ``/healthz``. It also exports the per-process counts at
+``/metrics`` (:meth:`ProfileStore.metrics_text`), so Prometheus can sum
+them across processes.
+
+Warm-up
+-------
+Pre-compute profiles for the most popular titles::
+
+    python src/profile_store.py warm --top 500
+    python src/profile_store.py stats
+"""
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import argparse
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.rate_limiter import Priority, request_priority
+
+_DEFAULT_PATH: str = os.getenv(
+    "OSUSUME_PROFILE_STORE_PATH",
+    os.path.join(parent_dir, ".cache", "profiles.sqlite3"),
+)
+_DEFAULT_MAX_AGE_S: float = float(os.getenv("OSUSUME_PROFILE_MAX_AGE_S", 30 * 24 * 60 * 60))
+# Unflushed counter events, or seconds since the last flush, that trigger one.
+_COUNTER_FLUSH_EVERY: int = 100
+_COUNTER_FLUSH_S: float = 10.0
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileStore:
+    """SQLite-backed ``(media_id, fingerprint) → (genres, tags)`` store."""
+
+    def __init__(self, path: str = _DEFAULT_PATH, max_age_s: float = _DEFAULT_MAX_AGE_S):
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"hits": 0, "misses": 0, "stored": 0, "expired": 0}
+        self._pending: Counter = Counter()
+        self._flushed_at = time.monotonic()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A crash may lose the last commits, never corrupt the file; fine for a memo.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "  media_id INTEGER NOT NULL,"
+            "  fingerprint TEXT NOT NULL,"
+            "  genres TEXT NOT NULL,"
+            "  tags TEXT NOT NULL,"
+            "  created_at REAL NOT NULL,"
+            "  PRIMARY KEY (media_id, fingerprint)"
+            ")"
+        )
+
+    def get(self, media_id: int, fingerprint: str) -> Optional[Tuple[List[str], List[str]]]:
+        """Return the stored ``(genres, tags)`` or ``None`` if absent/expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT genres, tags, created_at FROM profiles "
+                "WHERE media_id = ? AND fingerprint = ?",
+                (media_id, fingerprint),
+            ).fetchone()
+            if row is not None and self.max_age_s and time.time() - row[2] > self.max_age_s:
+                self._db.execute(
+                    "DELETE FROM profiles WHERE media_id = ? AND fingerprint = ?",
+                    (media_id, fingerprint),
+                )
+                self._count("expired")
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+            self._count("hits")
+            return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, media_id: int, fingerprint: str, genres: List[str], tags: List[str]) -> None:
+        """Store the analyzer answer for *media_id*."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO profiles (media_id, fingerprint, genres, tags, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (media_id, fingerprint, json.dumps(list(genres)), json.dumps(list(tags)), time.time()),
+            )
+            self._count("stored")
+
+    def contains(self, media_id: int, fingerprint: str) -> bool:
+        """Return whether a profile exists, without touching the counters."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM profiles WHERE media_id = ? AND fingerprint = ?",
+                (media_id, fingerprint),
+            ).fetchone() is not None
+
+    def invalidate(self, media_id: Optional[int] = None) -> int:
+        """Drop one media id (every fingerprint) or, with no argument, everything."""
+        with self._lock:
+            if media_id is None:
+                cur = self._db.execute("DELETE FROM profiles")
+            else:
+                cur = self._db.execute("DELETE FROM profiles WHERE media_id = ?", (media_id,))
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters since process start, plus ``lifetime`` totals from the store
+        file; ``llm_calls_saved`` is the lifetime hit count.
+        """
+        with self._lock:
+            self._flush()
+            snapshot: Dict[str, Any] = dict(self._stats)
+            snapshot["entries"] = self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+            lifetime = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        snapshot["lifetime"] = {name: lifetime.get(name, 0) for name in self._stats}
+        snapshot["llm_calls_saved"] = snapshot["lifetime"]["hits"]
+        return snapshot
+
+    def metrics_text(self) -> str:
+        """This process's counters in Prometheus text format."""
+        with self._lock:
+            stats = dict(self._stats)
+        lines = [
+            "# HELP osusume_profile_store_lookups_total Profile store lookups, by result.",
+            "# TYPE osusume_profile_store_lookups_total counter",
+            f'osusume_profile_store_lookups_total{{result="hit"}} {stats["hits"]}',
+            f'osusume_profile_store_lookups_total{{result="miss"}} {stats["misses"]}',
+            "# HELP osusume_profile_store_llm_calls_saved_total Analyzer LLM calls answered from the store.",
+            "# TYPE osusume_profile_store_llm_calls_saved_total counter",
+            f"osusume_profile_store_llm_calls_saved_total {stats['hits']}",
+            "# HELP osusume_profile_store_writes_total Profiles stored or expired.",
+            "# TYPE osusume_profile_store_writes_total counter",
+            f'osusume_profile_store_writes_total{{kind="stored"}} {stats["stored"]}',
+            f'osusume_profile_store_writes_total{{kind="expired"}} {stats["expired"]}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        """Add counter events not yet written to the lifetime totals."""
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        """Flush the counters and close the database."""
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def _count(self, name: str) -> None:
+        # Caller holds self._lock.
+        self._stats[name] += 1
+        self._pending[name] += 1
+        if (
+            sum(self._pending.values()) >= _COUNTER_FLUSH_EVERY
+            or time.monotonic() - self._flushed_at >= _COUNTER_FLUSH_S
+        ):
+            self._flush()
+
+    def _flush(self) -> None:
+        # Caller holds self._lock.
+        self._flushed_at = time.monotonic()
+        if not self._pending:
+            return
+        try:
+            # One transaction (one commit) for the whole batch.
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(self._pending.items()),
+            )
+            self._db.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if self._db.in_transaction:
+                self._db.execute("ROLLBACK")
+            # Keep the events and retry with the next flush.
+            logger.warning("Profile store counter flush failed: %s", exc)
+            return
+        self._pending.clear()
+
+
+_shared_store: Optional[ProfileStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Return the process-wide :class:`ProfileStore`, creating it on first use."""
+    global _shared_store
+    if _shared_store is None:
+        with _shared_lock:
+            if _shared_store is None:
+                _shared_store = ProfileStore()
+                atexit.register(_shared_store.flush)
+    return _shared_store
+
+
+@request_priority(Priority.BACKGROUND)
+def warm_up(top: int, per_page: int = 50) -> Dict[str, int]:
+    """Analyse the *top* most popular AniList titles that are not stored yet."""
+    from src.analyzer import PROMPT_FINGERPRINT, get_relevant_tags_and_genres
+    from src.anilist_query_searcher import search_anime
+
+    store = get_profile_store()
+    analysed = skipped = failed = 0
+    page = 1
+    while analysed + skipped + failed < top:
+        media = search_anime(sort="POPULARITY_DESC", page=page, per_page=per_page)
+        if not media:
+            break
+        for item in media[: top - (analysed + skipped + failed)]:
+            if store.contains(item["id"], PROMPT_FINGERPRINT):
+                skipped += 1
+                continue
+            try:
+                get_relevant_tags_and_genres(
+                    item["title"].get("english") or item["title"].get("romaji"),
+                    item["genres"],
+                    [tag["name"] for tag in item["tags"]],
+                    media_id=item["id"],
+                )
+                analysed += 1
+            except Exception as exc:  # noqa: BLE001 - keep warming the rest
+                logger.warning("Warm-up failed for media %s: %s", item["id"], exc)
+                failed += 1
+        page += 1
+    return {"analysed": analysed, "already_stored": skipped, "failed": failed}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Manage the analyzer profile store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warm", help="pre-compute profiles for the top-N popular titles")
+    warm.add_argument("--top", type=int, default=200)
+    inv = sub.add_parser("invalidate", help="drop stored profiles")
+    inv.add_argument("--media-id", type=int, default=None)
+    sub.add_parser("stats", help="print store statistics")
+    args = parser.parse_args(argv)
+
+    if args.command == "warm":
+        print(json.dumps(warm_up(args.top)))
+    elif args.command == "invalidate":
+        print(json.dumps({"deleted": get_profile_store().invalidate(args.media_id)}))
+    else:
+        print(json.dumps(get_profile_store().stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Local Re-Ranking
+~~~~~~~~~~~~~~~~
+Picks the top-k of a candidate pool (a few hundred ``Anime`` dicts from
+``search_anime``) without an LLM, for the direct pipeline in ``service.py``.
+
+Every candidate gets a row of five features, each scaled to 0–1:
+
+``tags``      Rank-weighted share of the requested tags it carries (non-spoiler).
+``genres``    Share of the requested genres it carries.
+``score``     ``averageScore`` / 100; unscored titles get the pool's mean.
+``recency``   ``exp(-|seasonYear - year| / 3)`` against the requested year
+              (0 for every candidate when no year was requested).
+``spoiler``   Like ``tags`` but for requested tags only present as spoilers.
+              Weighted negatively, since such a match isn't what the show is
+              about on screen.
+
+Relevance is the feature matrix times a :class:`RankingWeights` vector. The
+picks are then chosen greedily by maximal marginal relevance (MMR), which
+trades relevance against cosine similarity (genres + rank-weighted tags) to
+the titles already picked. Titles without a cover image, or repeating a
+title already picked, are skipped.
+
+Features are computed from a :class:`~src.columnar.MediaTable`.
+:meth:`Ranker.rank_table` skips the conversion from dicts for callers that
+already hold one.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_RANK_WEIGHTS``   Overrides, e.g. ``"tags=1.5,recency=0,diversity=0.5"``.
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import dataclasses
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.columnar import GENRES, TAGS, MediaTable
+from src.request_parser import AnimeSearchParams, OFFICIAL_GENRES
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+_WEIGHTS_SPEC: str = os.getenv("OSUSUME_RANK_WEIGHTS", "")
+# Years over which the recency feature falls to 1/e.
+_RECENCY_SCALE_Y: float = 3.0
+
+FEATURES = ("tags", "genres", "score", "recency", "spoiler")
+
+# --------------------------------------------------------------------------- #
+#  Weights
+# --------------------------------------------------------------------------- #
+
+@dataclass(frozen=True)
+class RankingWeights:
+    """Feature weights plus the MMR diversity trade-off (0 = pure relevance)."""
+
+    tags: float = 1.0
+    genres: float = 1.0
+    score: float = 0.5
+    recency: float = 0.5
+    spoiler: float = 0.5
+    diversity: float = 0.3
+
+    @classmethod
+    def parse(cls, spec: str, base: Optional["RankingWeights"] = None) -> "RankingWeights":
+        """Apply ``"name=value,..."`` overrides to *base* (default weights)."""
+        overrides: Dict[str, float] = {}
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            name, sep, value = part.partition("=")
+            name = name.strip()
+            if not sep or name not in cls.__dataclass_fields__:
+                raise ValueError(f"Unknown ranking weight {part!r}")
+            overrides[name] = float(value)
+        return dataclasses.replace(base or cls(), **overrides)
+
+    def vector(self) -> np.ndarray:
+        """Weights in :data:`FEATURES` order; the spoiler feature counts against."""
+        return np.array(
+            [self.tags, self.genres, self.score, self.recency, -self.spoiler], dtype=np.float32
+        )
+
+# --------------------------------------------------------------------------- #
+#  Ranker
+# --------------------------------------------------------------------------- #
+
+class Ranker:
+    """Vectorised feature scoring plus MMR selection over a candidate pool."""
+
+    def __init__(self, weights: Optional[RankingWeights] = None) -> None:
+        self.weights = weights or RankingWeights()
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def rank(
+        self,
+        candidates: Sequence[Dict[str, Any]],
+        params: AnimeSearchParams,
+        k: int = 5,
+        weights: Optional[RankingWeights] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return up to *k* candidates, best first."""
+        if not candidates or k <= 0:
+            return []
+        order = self.rank_table(MediaTable.from_media(candidates), params, k, weights)
+        return [candidates[i] for i in order]
+
+    def rank_table(
+        self,
+        table: MediaTable,
+        params: AnimeSearchParams,
+        k: int = 5,
+        weights: Optional[RankingWeights] = None,
+    ) -> List[int]:
+        """Like :meth:`rank`, over a :class:`MediaTable`; returns row positions."""
+        if not len(table) or k <= 0:
+            return []
+        weights = weights or self.weights
+        pool = _Pool(table)
+        relevance = pool.features(params) @ weights.vector()
+        return self._mmr(pool, relevance, k, weights.diversity)
+
+    def features(self, candidates: Sequence[Dict[str, Any]], params: AnimeSearchParams) -> np.ndarray:
+        """The ``len(candidates) × len(FEATURES)`` matrix, for inspection and tuning."""
+        return _Pool(MediaTable.from_media(candidates)).features(params)
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _mmr(pool: "_Pool", relevance: np.ndarray, k: int, diversity: float) -> List[int]:
+        eligible = pool.eligible.copy()
+        if not eligible.any():
+            return []
+        # Scale relevance to 0–1 so the diversity weight means the same for any pool.
+        low, high = relevance[eligible].min(), relevance[eligible].max()
+        relevance = (relevance - low) / (high - low) if high > low else np.zeros_like(relevance)
+
+        vectors = pool.profile_vectors() if diversity > 0 else None
+        max_similarity = np.zeros(len(relevance), dtype=np.float32)
+        picks: List[int] = []
+        while len(picks) < k and eligible.any():
+            gain = (1.0 - diversity) * relevance - diversity * max_similarity
+            # Ties keep AniList's order (argmax returns the first).
+            best = int(np.argmax(np.where(eligible, gain, -np.inf)))
+            picks.append(best)
+            eligible &= pool.title_ids != pool.title_ids[best]
+            if vectors is not None:
+                np.maximum(max_similarity, vectors @ vectors[best], out=max_similarity)
+        return picks
+
+
+class _Pool:
+    """One candidate pool as ranking arrays, read off a :class:`MediaTable`."""
+
+    def __init__(self, table: MediaTable) -> None:
+        n = len(table)
+        self.size = n
+
+        # Tags: one entry per (media, tag) pair, columns local to this pool.
+        self.tag_rows = table.entry_rows(table.tag_offsets)
+        present, self.tag_cols = np.unique(table.tag_ids, return_inverse=True)
+        self.tag_cols = self.tag_cols.reshape(-1)
+        self.tag_columns: Dict[str, int] = {TAGS.names[t]: i for i, t in enumerate(present.tolist())}
+        self.tag_ranks = np.maximum(table.tag_ranks, 0).astype(np.float32) / 100.0
+        self.tag_spoilers = table.tag_spoilers
+
+        self.genres = np.zeros((n, len(OFFICIAL_GENRES)), dtype=np.float32)
+        genre_cols = _genre_lookup()[table.genre_ids]
+        known = genre_cols >= 0
+        self.genres[table.entry_rows(table.genre_offsets)[known], genre_cols[known]] = 1.0
+
+        self.score = table.score / np.float32(100.0)
+        self.year = np.where(table.year > 0, table.year, np.nan).astype(np.float32)
+
+        titles = table.titles()
+        title_ids: Dict[Optional[str], int] = {}
+        self.title_ids = np.fromiter(
+            (title_ids.setdefault(t or f"\0{i}", len(title_ids)) for i, t in enumerate(titles)),
+            dtype=np.int64, count=n,
+        )
+        has_cover = np.diff(table.cover.offsets) > 0
+        self.eligible = np.fromiter((bool(t) for t in titles), dtype=bool, count=n) & has_cover
+
+    def features(self, params: AnimeSearchParams) -> np.ndarray:
+        out = np.zeros((self.size, len(FEATURES)), dtype=np.float32)
+
+        wanted_tags = [self.tag_columns[t] for t in dict.fromkeys(params.tags or []) if t in self.tag_columns]
+        if params.tags and wanted_tags:
+            hit = np.isin(self.tag_cols, wanted_tags)
+            for column, mask in ((0, hit & ~self.tag_spoilers), (4, hit & self.tag_spoilers)):
+                np.add.at(out[:, column], self.tag_rows[mask], self.tag_ranks[mask])
+            out[:, [0, 4]] /= len(set(params.tags))
+
+        wanted_genres = [_GENRE_COLUMNS[g] for g in dict.fromkeys(params.genres or []) if g in _GENRE_COLUMNS]
+        if wanted_genres:
+            out[:, 1] = self.genres[:, wanted_genres].sum(axis=1) / len(wanted_genres)
+
+        scored = ~np.isnan(self.score)
+        out[:, 2] = np.where(scored, self.score, self.score[scored].mean() if scored.any() else 0.5)
+
+        if params.year:
+            distance = np.abs(self.year - params.year)
+            out[:, 3] = np.where(np.isnan(distance), 0.0, np.exp(-distance / _RECENCY_SCALE_Y))
+        return out
+
+    def profile_vectors(self) -> np.ndarray:
+        """L2-normalised genre + rank-weighted tag vectors, for MMR similarity."""
+        tags = np.zeros((self.size, len(self.tag_columns)), dtype=np.float32)
+        tags[self.tag_rows, self.tag_cols] = self.tag_ranks
+        vectors = np.hstack([self.genres, tags])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+_GENRE_COLUMNS: Dict[str, int] = {g: i for i, g in enumerate(OFFICIAL_GENRES)}
+
+
+def _genre_lookup() -> np.ndarray:
+    """Interned genre id → column of ``OFFICIAL_GENRES`` (``-1`` for others)."""
+    return np.array([_GENRE_COLUMNS.get(name, -1) for name in list(GENRES.names)], dtype=np.int64)
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_ranker: Optional[Ranker] = None
+_shared_lock = threading.Lock()
+
+
+def get_ranker() -> Ranker:
+    """Return the process-wide :class:`Ranker` with weights from the environment."""
+    global _shared_ranker
+    if _shared_ranker is None:
+        with _shared_lock:
+            if _shared_ranker is None:
+                _shared_ranker = Ranker(RankingWeights.parse(_WEIGHTS_SPEC))
+    return _shared_ranker
+
+
+def rank_candidates(
+    candidates: Sequence[Dict[str, Any]], params: AnimeSearchParams, k: int = 5
+) -> List[Dict[str, Any]]:
+    """Shortcut for ``get_ranker().rank(candidates, params, k)``."""
+    return get_ranker().rank(candidates, params, k)
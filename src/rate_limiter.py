@@ -0,0 +1,355 @@
+"""
+AniList Rate Limiter
+~~~~~~~~~~~~~~~~~~~~
+Client-side token bucket and priority scheduler that keeps every worker of
+this host under AniList's per-IP budget (90 requests/minute).
+
+Features
+--------
+* Token bucket shared across threads, and across processes through a small
+  SQLite file (``BEGIN IMMEDIATE`` serialises concurrent takers).
+* Priority queue: interactive UI searches are served before taste-profile
+  lookups, which are served before warm-up / sync traffic. Only the head
+  of the queue may take a token, so lower priorities wait while higher ones
+  are pending.
+* A 429 from AniList drains the shared bucket for the ``Retry-After``
+  period, so *all* workers back off instead of each discovering the limit.
+* Queue-depth and wait-time statistics via :meth:`RateLimiter.stats`.
+
+Priorities follow the current context (:func:`request_priority`); asyncio
+tasks inherit it, worker threads must set it themselves.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_ANILIST_RATE_PER_MIN``   Sustained rate (90).
+``OSUSUME_ANILIST_BURST``          Bucket capacity (10).
+``OSUSUME_RATE_LIMIT_BACKEND``     ``sqlite`` (default, cross-process) or ``memory``.
+``OSUSUME_RATE_LIMIT_PATH``        SQLite file for the shared bucket.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import enum
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_RATE_PER_MIN: float = float(os.getenv("OSUSUME_ANILIST_RATE_PER_MIN", 90))
+_BURST: float = float(os.getenv("OSUSUME_ANILIST_BURST", 10))
+_BACKEND: str = os.getenv("OSUSUME_RATE_LIMIT_BACKEND", "sqlite")
+_PATH: str = os.getenv(
+    "OSUSUME_RATE_LIMIT_PATH", os.path.join(_PARENT_DIR, ".cache", "ratelimit.sqlite3")
+)
+# How often a queued waiter re-checks whether it has reached the head.
+_POLL_S: float = 0.05
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------- #
+#  Priorities
+# --------------------------------------------------------------------------- #
+
+class Priority(enum.IntEnum):
+    """Lower value = served first."""
+
+    INTERACTIVE = 0
+    TASTE_PROFILE = 1
+    BACKGROUND = 2
+
+
+# Longest a caller of each priority will queue before giving up (None = forever).
+_MAX_WAIT_S: Dict[Priority, Optional[float]] = {
+    Priority.INTERACTIVE: 30.0,
+    Priority.TASTE_PROFILE: 30.0,
+    Priority.BACKGROUND: None,
+}
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "osusume_request_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """Run AniList calls in this block at *priority*."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class RateLimitTimeout(RuntimeError):
+    """Raised when a request waited longer than its priority allows."""
+
+# --------------------------------------------------------------------------- #
+#  Token bucket backends
+# --------------------------------------------------------------------------- #
+
+class _MemoryBucket:
+    """Process-local token bucket."""
+
+    # Whether take()/drain() may block on I/O (async callers then use a thread).
+    blocking = False
+
+    def __init__(self, rate_per_s: float, capacity: float) -> None:
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """Take one token; return 0.0 on success or the seconds until one is due."""
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._refill(self._tokens, self._updated, now)
+            if tokens >= 1.0:
+                self._tokens, self._updated = tokens - 1.0, updated
+                return 0.0
+            self._tokens, self._updated = tokens, updated
+            return max(updated - now, 0.0) + (1.0 - tokens) / self.rate_per_s
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket and pause refills for *seconds*."""
+        with self._lock:
+            self._tokens, self._updated = 0.0, max(self._updated, time.time() + seconds)
+
+    def _refill(self, tokens: float, updated: float, now: float) -> Tuple[float, float]:
+        if now <= updated:  # paused by drain()
+            return tokens, updated
+        return min(self.capacity, tokens + (now - updated) * self.rate_per_s), now
+
+
+class _SqliteBucket(_MemoryBucket):
+    """Token bucket whose state lives in SQLite, shared by every local process."""
+
+    # BEGIN IMMEDIATE can wait up to the 5 s busy timeout on another process.
+    blocking = True
+
+    def __init__(self, rate_per_s: float, capacity: float, path: str, name: str = "anilist") -> None:
+        super().__init__(rate_per_s, capacity)
+        self.name = name
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "  name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            (name, capacity, time.time()),
+        )
+
+    def take(self) -> float:
+        with self._lock, self._transaction():
+            now = time.time()
+            tokens, updated = self._refill(*self._load(), now)
+            if tokens >= 1.0:
+                self._store(tokens - 1.0, updated)
+                return 0.0
+            self._store(tokens, updated)
+            return max(updated - now, 0.0) + (1.0 - tokens) / self.rate_per_s
+
+    def drain(self, seconds: float) -> None:
+        with self._lock, self._transaction():
+            _, updated = self._load()
+            self._store(0.0, max(updated, time.time() + seconds))
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _load(self) -> Tuple[float, float]:
+        return self._db.execute(
+            "SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+
+    def _store(self, tokens: float, updated: float) -> None:
+        self._db.execute(
+            "UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+            (tokens, updated, self.name),
+        )
+
+# --------------------------------------------------------------------------- #
+#  Scheduler
+# --------------------------------------------------------------------------- #
+
+class RateLimiter:
+    """Priority-ordered admission in front of a token bucket."""
+
+    def __init__(self, bucket: _MemoryBucket) -> None:
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue: list = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._stats = {
+            "acquired": {p.name: 0 for p in Priority},
+            "timeouts": {p.name: 0 for p in Priority},
+            "wait_s_total": 0.0,
+            "wait_s_max": 0.0,
+            "throttle_events": 0,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def acquire(self, priority: Optional[Priority] = None) -> float:
+        """Block until a token is available; return the seconds spent waiting."""
+        priority = _current_priority.get() if priority is None else priority
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            with self._cond:
+                while True:
+                    delay = self._try_take(ticket, priority, started)
+                    if delay == 0.0:
+                        break
+                    self._cond.wait(delay)
+        finally:
+            self._dequeue(ticket)
+        return self._record(priority, started)
+
+    async def aacquire(self, priority: Optional[Priority] = None) -> float:
+        """Async :meth:`acquire`; waits with ``asyncio.sleep`` instead of blocking.
+
+        A blocking bucket is read on a worker thread, never on the event loop.
+        """
+        priority = _current_priority.get() if priority is None else priority
+        started = time.monotonic()
+        ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._lock:
+                    turn = self._is_turn(ticket, priority, started)
+                if not turn:
+                    delay = _POLL_S
+                elif self.bucket.blocking:
+                    delay = await asyncio.to_thread(self.bucket.take)
+                else:
+                    delay = self.bucket.take()
+                if delay == 0.0:
+                    return self._record(priority, started)
+                await asyncio.sleep(delay)
+        finally:
+            self._dequeue(ticket)
+
+    def throttle(self, seconds: float) -> None:
+        """Tell every worker to back off, e.g. after AniList answered 429."""
+        self.bucket.drain(seconds)
+        with self._lock:
+            self._stats["throttle_events"] += 1
+
+    async def athrottle(self, seconds: float) -> None:
+        """Async :meth:`throttle`."""
+        if self.bucket.blocking:
+            await asyncio.to_thread(self.throttle, seconds)
+        else:
+            self.throttle(seconds)
+
+    def stats(self) -> Dict[str, object]:
+        """Queue depth per priority plus acquisition and wait-time counters."""
+        with self._lock:
+            depth = {p.name: 0 for p in Priority}
+            for prio, _ in self._queue:
+                depth[Priority(prio).name] += 1
+            acquired = sum(self._stats["acquired"].values())
+            return {
+                "queue_depth": depth,
+                "acquired": dict(self._stats["acquired"]),
+                "timeouts": dict(self._stats["timeouts"]),
+                "wait_s_total": self._stats["wait_s_total"],
+                "wait_s_max": self._stats["wait_s_max"],
+                "wait_s_mean": self._stats["wait_s_total"] / acquired if acquired else 0.0,
+                "throttle_events": self._stats["throttle_events"],
+            }
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers
+    # ------------------------------------------------------------------ #
+
+    def _enqueue(self, priority: Priority) -> Tuple[int, int]:
+        ticket = (int(priority), next(self._seq))
+        with self._lock:
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]) -> None:
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _try_take(self, ticket: Tuple[int, int], priority: Priority, started: float) -> float:
+        """Caller holds ``self._lock``. Return 0.0 once a token was taken."""
+        if not self._is_turn(ticket, priority, started):
+            return _POLL_S
+        return self.bucket.take()
+
+    def _is_turn(self, ticket: Tuple[int, int], priority: Priority, started: float) -> bool:
+        """Caller holds ``self._lock``. Whether *ticket* heads the queue; raises once it waited too long."""
+        max_wait = _MAX_WAIT_S[priority]
+        if max_wait is not None and time.monotonic() - started > max_wait:
+            self._stats["timeouts"][priority.name] += 1
+            raise RateLimitTimeout(
+                f"Waited more than {max_wait:.0f}s for an AniList request slot"
+            )
+        return self._queue[0] == ticket
+
+    def _record(self, priority: Priority, started: float) -> float:
+        waited = time.monotonic() - started
+        with self._lock:
+            self._stats["acquired"][priority.name] += 1
+            self._stats["wait_s_total"] += waited
+            self._stats["wait_s_max"] = max(self._stats["wait_s_max"], waited)
+        return waited
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide AniList :class:`RateLimiter`."""
+    global _shared_limiter
+    if _shared_limiter is None:
+        with _shared_lock:
+            if _shared_limiter is None:
+                rate_per_s = _RATE_PER_MIN / 60.0
+                bucket: _MemoryBucket
+                if _BACKEND == "sqlite":
+                    try:
+                        bucket = _SqliteBucket(rate_per_s, _BURST, _PATH)
+                    except sqlite3.Error as exc:
+                        logger.warning("Shared rate-limit bucket unavailable (%s); using memory", exc)
+                        bucket = _MemoryBucket(rate_per_s, _BURST)
+                else:
+                    bucket = _MemoryBucket(rate_per_s, _BURST)
+                _shared_limiter = RateLimiter(bucket)
+    return _shared_limiter
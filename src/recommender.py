@@ -7,9 +7,26 @@ Features
 --------
 * Search by keyword, season, year, genres, tags, and sort order.
 * Optional "like_animes" boost: infer genres/tags from a seed list of
-  anime titles to build a taste profile.
+  anime titles to build a taste profile, or (``taste_engine="similarity"``)
+  rank the local catalog by tag affinity to the seeds without any LLM call.
+* Native async path (``_arun``) on a pooled ``httpx`` client.
+* Deep pagination: with ``limit`` the tool collects results across pages in
+  one call; :meth:`SearchAnimeTool.iter_results` streams them instead
+  (:mod:`src.pagination`).
 * Strict Pydantic **v2** schema for LLM‑friendly argument validation.
-* Graceful HTTP error handling and sensible time‑outs.
+* Genre/tag names are snapped to real AniList values before querying
+  (:mod:`src.vocabulary`), so near misses like "Iseka" still find results.
+* Graceful HTTP error handling, sensible time‑outs and jittered retries on
+  a shared keep‑alive pool (:mod:`src.http_client`).
+* Responses served from the shared LRU + SQLite cache (:mod:`src.cache`).
+* Tool runs, taste-profile building and AniList lookups are timed as
+  :mod:`src.tracing` spans.
+* Filter-only searches answered from the local catalog (:mod:`src.catalog`).
+* Searches that reach AniList are counted so the background prefetcher
+  (:mod:`src.prefetch`) can keep the most frequent ones warm.
+* The agent reads results as compact lines (top non-spoiler tags, one title,
+  the cover URL) instead of the full dicts (:mod:`src.payload`); ``_run``
+  callers still get ``Anime`` dicts.
 * Zero side‑effect logging (debug statements removed).
 """
 
@@ -23,20 +40,39 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 import sys
 sys.path.append(parent_dir)
 
+import asyncio
+import contextvars
 import logging
-from typing import Any, Dict, List, Optional, Type, TypedDict
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Type, TypedDict
 
-import requests
 from pydantic import BaseModel, Field, field_validator
 from crewai.tools import BaseTool
-from src.anilist_query_searcher import search_anime
-from src.analyzer import get_relevant_tags_and_genres
+from crewai.tools.structured_tool import CrewStructuredTool
+from src.anilist_query_searcher import asearch_anime_batch, search_anime_batch
+from src.cache import acached_query, cached_query
+from src.http_client import apost_graphql, post_graphql
+from src.catalog import get_catalog, search_local
+from src.payload import describe_results, encode_results
+from src.pagination import MAX_PAGES, MAX_PER_PAGE, aiter_media, iter_media
+from src.prefetch import note_search
+from src.rate_limiter import Priority, request_priority
+from src.similarity import get_similarity_engine
+from src.tracing import span, traced
+from src.vocabulary import get_vocabulary
+from src.analyzer import aget_relevant_tags_and_genres, get_relevant_tags_and_genres
 # --------------------------------------------------------------------------- #
 #  Configuration & logging
 # --------------------------------------------------------------------------- #
 
-_ANILIST_API_URL: str = "https://graphql.anilist.co"
-_REQUEST_TIMEOUT_S: int = 10
+_TASTE_PROFILE_WORKERS: int = int(os.getenv("OSUSUME_TASTE_PROFILE_WORKERS", 4))
+_TASTE_PROFILE_TIMEOUT_S: float = float(os.getenv("OSUSUME_TASTE_PROFILE_TIMEOUT_S", 30))
+# "llm" expands like_animes into genre/tag filters via the analyzer;
+# "similarity" ranks the local catalog by tag affinity to the seeds.
+_TASTE_ENGINE: str = os.getenv("OSUSUME_TASTE_ENGINE", "llm")
 
 logger = logging.getLogger(__name__)
 
@@ -66,27 +102,25 @@ class Anime(TypedDict):
 #  Low‑level helper
 # --------------------------------------------------------------------------- #
 
-def _fetch_from_anilist(query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
-    """Send a GraphQL request to the AniList public API and return the JSON body."""
-    try:
-        resp = requests.post(
-            _ANILIST_API_URL,
-            json={"query": query, "variables": variables},
-            timeout=_REQUEST_TIMEOUT_S,
-        )
-    except requests.exceptions.RequestException as exc:
-        raise RuntimeError(f"Network error talking to AniList: {exc}") from exc
+def _fetch_from_anilist(
+    query: str, variables: Dict[str, Any], ttl_s: Optional[float] = None
+) -> Dict[str, Any]:
+    """Return the AniList JSON body for a query, via the shared response cache."""
+    with span("anilist"):
+        return cached_query(_post_to_anilist, query, variables, ttl_s)
 
-    if resp.status_code != 200:
-        raise RuntimeError(
-            f"AniList query failed (HTTP {resp.status_code}): {resp.text}"
-        )
 
-    payload = resp.json()
-    if "errors" in payload:
-        raise RuntimeError(f"AniList returned errors: {payload['errors']!r}")
+async def _afetch_from_anilist(
+    query: str, variables: Dict[str, Any], ttl_s: Optional[float] = None
+) -> Dict[str, Any]:
+    """Async :func:`_fetch_from_anilist` over the pooled ``httpx`` client."""
+    with span("anilist"):
+        return await acached_query(apost_graphql, query, variables, ttl_s)
 
-    return payload
+
+def _post_to_anilist(query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Send a GraphQL request to the AniList public API and return the JSON body."""
+    return post_graphql(query, variables)
 
 # --------------------------------------------------------------------------- #
 #  Pydantic v2 input schema
@@ -122,6 +156,15 @@ class SearchAnimeToolInput(BaseModel):
         None,
         description="Comma‑separated seed anime titles to build a taste profile.",
     )
+    limit: Optional[int] = Field(
+        None,
+        ge=1,
+        le=500,
+        description=(
+            "Collect up to this many results across pages in one call. "
+            "Pages of 50 are read starting at `page`; `per_page` is ignored."
+        ),
+    )
 
     # Normalise blank strings to None so CrewAI can do `is not None`
     @field_validator("search_term", "season", "genre", "like_animes", mode="before")
@@ -140,12 +183,178 @@ class SearchAnimeTool(BaseTool):
     name: str = "search_anime"
     description: str = (
         "Search AniList for anime using free‑text title keywords, season/year, "
-        "genres, tags, and sort order. Returns a JSON array of matching anime."
+        "genres, tags, and sort order. " + describe_results()
     )
     args_schema: Type[BaseModel] = SearchAnimeToolInput
+    taste_engine: str = _TASTE_ENGINE
 
+    @traced("tool")
     def _run(self, **kwargs) -> List[Anime]:  # noqa: N802
-        params = SearchAnimeToolInput(**kwargs)
+        params, snapped = self._snap(SearchAnimeToolInput(**kwargs))
+        results = list(self._iter_params(params)) if params.limit else self._search(params)
+        if snapped:
+            get_vocabulary().record_outcome(bool(results))
+        return results
+
+    @traced("tool")
+    async def _arun(self, **kwargs) -> List[Anime]:  # noqa: D401
+        params, snapped = self._snap(SearchAnimeToolInput(**kwargs))
+        if params.limit:
+            results = [media async for media in self._aiter_params(params)]
+        else:
+            results = await self._asearch(params)
+        if snapped:
+            get_vocabulary().record_outcome(bool(results))
+        return results
+
+    def to_structured_tool(self) -> CrewStructuredTool:
+        """CrewAI's handle on the tool: same schema, results encoded for the agent."""
+        tool = super().to_structured_tool()
+        tool.func = self._run_for_agent
+        return tool
+
+    def _run_for_agent(self, **kwargs) -> str:
+        return encode_results(self._run(**kwargs))
+
+    def iter_results(self, **kwargs) -> Iterator[Anime]:
+        """Stream results across pages; same arguments as the tool.
+
+        Stops after ``limit`` media (default: every page, up to
+        ``MAX_PAGES``). The next page is fetched while the caller consumes
+        the current one.
+        """
+        params, _ = self._snap(SearchAnimeToolInput(**kwargs))
+        return self._iter_params(params)
+
+    def aiter_results(self, **kwargs) -> AsyncIterator[Anime]:
+        """Async :meth:`iter_results`."""
+        params, _ = self._snap(SearchAnimeToolInput(**kwargs))
+        return self._aiter_params(params)
+
+    # --------------------------------------------------------------------- #
+    #  Private helpers
+    # --------------------------------------------------------------------- #
+
+    def _search(self, params: SearchAnimeToolInput) -> List[Anime]:
+        """One page of results for validated, snapped arguments."""
+        variables = self._build_variables(params)
+
+        if params.like_animes and self.taste_engine == "similarity":
+            seeds = self._resolve_seeds(params.like_animes)
+            similar = self._rank_similar(params, variables, seeds)
+            if similar is not None:
+                return similar
+
+        # Taste profile expansion
+        if params.like_animes:
+            taste_genres, taste_tags = self._build_taste_profile(params.like_animes)
+            self._apply_taste_profile(variables, taste_genres, taste_tags)
+
+        return self._fetch_page(variables)["media"]
+
+    async def _asearch(self, params: SearchAnimeToolInput) -> List[Anime]:
+        """Async :meth:`_search`."""
+        variables = self._build_variables(params)
+
+        if params.like_animes and self.taste_engine == "similarity":
+            seeds = await self._aresolve_seeds(params.like_animes)
+            similar = self._rank_similar(params, variables, seeds)
+            if similar is not None:
+                return similar
+
+        if params.like_animes:
+            taste_genres, taste_tags = await self._abuild_taste_profile(params.like_animes)
+            self._apply_taste_profile(variables, taste_genres, taste_tags)
+
+        return (await self._afetch_page(variables))["media"]
+
+    def _iter_params(self, params: SearchAnimeToolInput) -> Iterator[Anime]:
+        variables = self._build_variables(params)
+        variables["perPage"] = MAX_PER_PAGE
+
+        if params.like_animes and self.taste_engine == "similarity":
+            seeds = self._resolve_seeds(params.like_animes)
+            similar = self._rank_similar(params, variables, seeds, deep=True)
+            if similar is not None:
+                yield from similar
+                return
+
+        if params.like_animes:
+            taste_genres, taste_tags = self._build_taste_profile(params.like_animes)
+            self._apply_taste_profile(variables, taste_genres, taste_tags)
+
+        yield from iter_media(self._fetch_page, variables, params.limit)
+
+    async def _aiter_params(self, params: SearchAnimeToolInput) -> AsyncIterator[Anime]:
+        variables = self._build_variables(params)
+        variables["perPage"] = MAX_PER_PAGE
+
+        if params.like_animes and self.taste_engine == "similarity":
+            seeds = await self._aresolve_seeds(params.like_animes)
+            similar = self._rank_similar(params, variables, seeds, deep=True)
+            if similar is not None:
+                for media in similar:
+                    yield media
+                return
+
+        if params.like_animes:
+            taste_genres, taste_tags = await self._abuild_taste_profile(params.like_animes)
+            self._apply_taste_profile(variables, taste_genres, taste_tags)
+
+        async for media in aiter_media(self._afetch_page, variables, params.limit):
+            yield media
+
+    @staticmethod
+    def _fetch_page(variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Return one ``Page`` object, from the local catalog when it can answer."""
+        local = search_local(variables)
+        if local is not None:
+            return {"media": local}
+        note_search(_GRAPHQL_QUERY, variables)
+        return _fetch_from_anilist(_GRAPHQL_QUERY, variables)["data"]["Page"]
+
+    @staticmethod
+    async def _afetch_page(variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Async :meth:`_fetch_page`."""
+        local = search_local(variables)
+        if local is not None:
+            return {"media": local}
+        note_search(_GRAPHQL_QUERY, variables)
+        return (await _afetch_from_anilist(_GRAPHQL_QUERY, variables))["data"]["Page"]
+
+    @staticmethod
+    def _snap(params: SearchAnimeToolInput) -> tuple[SearchAnimeToolInput, bool]:
+        """Snap genre/tag names to AniList values; report whether any changed.
+
+        ``genre`` (every result has it) is snapped in place rather than
+        merged into ``genres`` (any of them), which would widen the search.
+        """
+
+        vocabulary = get_vocabulary()
+        snap = vocabulary.snap_filters(params.genres or [], params.tags or [])
+        genre, genres, tags = params.genre, snap.genres, snap.tags
+        corrections, dropped = dict(snap.corrections), list(snap.dropped)
+        if params.genre:
+            single = vocabulary.snap_filters([params.genre], [])
+            corrections.update(single.corrections)
+            dropped += single.dropped
+            # "romcom" → Romance + Comedy: the first genre stays required,
+            # anything else it stood for joins genres/tags.
+            genre = single.genres[0] if single.genres else None
+            genres = genres + [g for g in single.genres[1:] if g not in genres]
+            tags = tags + [t for t in single.tags if t not in tags]
+        if not corrections and not dropped:
+            return params, False
+        logger.info("Snapped filters %s, dropped %s", corrections, dropped)
+        return params.model_copy(update={
+            "genre": genre,
+            "genres": genres or None,
+            "tags": tags or None,
+        }), True
+
+    @staticmethod
+    def _build_variables(params: SearchAnimeToolInput) -> Dict[str, Any]:
+        """Translate validated tool arguments into GraphQL variables."""
 
         variables: Dict[str, Any] = {
             "page": params.page,
@@ -166,52 +375,219 @@ class SearchAnimeTool(BaseTool):
         if params.tags:
             variables["tags"] = params.tags
 
-        # Taste profile expansion
-        if params.like_animes:
-            taste_genres, taste_tags = self._build_taste_profile(params.like_animes)
-            if taste_genres:
-                variables["genres"] = sorted(
-                    set(variables.get("genres", [])) | taste_genres
-                )
-            if taste_tags:
-                variables["tags"] = sorted(
-                    set(variables.get("tags", [])) | taste_tags
-                )
-
-        data = _fetch_from_anilist(_GRAPHQL_QUERY, variables)
-        return data["data"]["Page"]["media"]
+        return variables
 
-    async def _arun(self, **kwargs) -> Any:  # noqa: D401
-        return self._run(**kwargs)
+    @staticmethod
+    def _apply_taste_profile(
+        variables: Dict[str, Any], taste_genres: set[str], taste_tags: set[str]
+    ) -> None:
+        """Merge taste-profile genres/tags into *variables* in place."""
 
-    # --------------------------------------------------------------------- #
-    #  Private helpers
-    # --------------------------------------------------------------------- #
+        if taste_genres:
+            variables["genres"] = sorted(
+                set(variables.get("genres", [])) | taste_genres
+            )
+        if taste_tags:
+            variables["tags"] = sorted(
+                set(variables.get("tags", [])) | taste_tags
+            )
 
+    @traced("taste_profile")
     def _build_taste_profile(self, like_animes: str) -> tuple[set[str], set[str]]:
         """Aggregate genres & tags from a comma‑separated list of anime titles."""
 
         genres_acc: set[str] = set()
         tags_acc: set[str] = set()
 
-        for raw in like_animes.split(","):
-            title = raw.strip()
-            if not title:
-                continue
-            hits = search_anime(title)
-            if not hits:
-                continue
-            first = hits[0]
-            g, t = get_relevant_tags_and_genres(
-                first["title"].get("english") or first["title"].get("romaji"),
-                first["genres"],
-                [tag["name"] for tag in first["tags"]],
-            )
+        seeds = self._resolve_seeds(like_animes)
+        for g, t in self._map_seeds(seeds, self._profile_for_media):
             genres_acc.update(g)
             tags_acc.update(t)
 
         return genres_acc, tags_acc
 
+    @traced("taste_profile")
+    async def _abuild_taste_profile(self, like_animes: str) -> tuple[set[str], set[str]]:
+        """Async :meth:`_build_taste_profile`."""
+
+        genres_acc: set[str] = set()
+        tags_acc: set[str] = set()
+
+        seeds = await self._aresolve_seeds(like_animes)
+        for g, t in await self._amap_seeds(seeds, self._aprofile_for_media):
+            genres_acc.update(g)
+            tags_acc.update(t)
+
+        return genres_acc, tags_acc
+
+    @staticmethod
+    def _rank_similar(
+        params: SearchAnimeToolInput,
+        variables: Dict[str, Any],
+        seeds: List[Anime],
+        deep: bool = False,
+    ) -> Optional[List[Anime]]:
+        """Rank the local catalog by similarity to *seeds*, or ``None`` if unavailable.
+
+        With *deep*, return up to ``limit`` media from pages of ``MAX_PER_PAGE``.
+        """
+
+        engine = get_similarity_engine()
+        if engine is None or not seeds:
+            return None
+
+        filters = {k: v for k, v in variables.items() if k not in ("search", "sort", "page", "perPage")}
+        candidate_rows = get_catalog().matching_rows(filters) if filters else None
+        per_page = MAX_PER_PAGE if deep else params.per_page
+        k = (params.limit or MAX_PER_PAGE * MAX_PAGES) if deep else params.per_page
+        return engine.similar_to(
+            seeds,
+            k=k,
+            offset=(params.page - 1) * per_page,
+            candidate_rows=candidate_rows,
+        )
+
+    @staticmethod
+    def _split_titles(like_animes: str) -> List[str]:
+        """Split the comma‑separated seed list, dropping blanks and duplicates."""
+        return list(dict.fromkeys(
+            title for title in (raw.strip() for raw in like_animes.split(",")) if title
+        ))
+
+    @classmethod
+    @traced("seed_lookup")
+    def _resolve_seeds(cls, like_animes: str) -> List[Anime]:
+        """Resolve every seed title to its best AniList match in one batched lookup."""
+
+        titles = cls._split_titles(like_animes)
+        try:
+            with request_priority(Priority.TASTE_PROFILE):
+                hits = search_anime_batch(titles, per_page=1)
+        except Exception as exc:  # noqa: BLE001 - taste profile is best effort
+            logger.warning("Seed title lookup for %r failed: %s", titles, exc)
+            return []
+        return [h[0] for h in hits if h]
+
+    @classmethod
+    @traced("seed_lookup")
+    async def _aresolve_seeds(cls, like_animes: str) -> List[Anime]:
+        """Async :meth:`_resolve_seeds`."""
+
+        titles = cls._split_titles(like_animes)
+        try:
+            with request_priority(Priority.TASTE_PROFILE):
+                hits = await asearch_anime_batch(titles, per_page=1)
+        except Exception as exc:  # noqa: BLE001 - taste profile is best effort
+            logger.warning("Seed title lookup for %r failed: %s", titles, exc)
+            return []
+        return [h[0] for h in hits if h]
+
+    @staticmethod
+    def _map_seeds(seeds: List[Anime], lookup) -> list:
+        """Apply *lookup* to each seed concurrently; keep input order.
+
+        Seeds are processed on a bounded thread pool. Each seed gets
+        ``_TASTE_PROFILE_TIMEOUT_S`` seconds of wall time from the moment a
+        worker starts it, however long it queued; seeds that fail, time out
+        or yield ``None`` are skipped. A timed-out lookup can't be stopped and
+        keeps its worker, so as a backstop the whole call still ends after
+        ``_TASTE_PROFILE_TIMEOUT_S * ceil(len(seeds) / workers)`` seconds and
+        seeds that never got a worker by then are skipped too.
+        """
+
+        if not seeds:
+            return []
+
+        workers = max(1, min(_TASTE_PROFILE_WORKERS, len(seeds)))
+        deadline = time.monotonic() + _TASTE_PROFILE_TIMEOUT_S * math.ceil(
+            len(seeds) / workers
+        )
+        started = [threading.Event() for _ in seeds]
+        started_at = [0.0] * len(seeds)
+
+        @request_priority(Priority.TASTE_PROFILE)
+        def run(i: int, seed: Anime):
+            started_at[i] = time.monotonic()
+            started[i].set()
+            return lookup(seed)
+
+        results = []
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="taste-profile")
+        try:
+            # Seed lookups queue behind interactive searches for AniList slots;
+            # each runs in a copy of the caller's context so its spans nest.
+            futures = [
+                pool.submit(contextvars.copy_context().run, run, i, seed)
+                for i, seed in enumerate(seeds)
+            ]
+            for i, (seed, future) in enumerate(zip(seeds, futures)):
+                try:
+                    if not started[i].wait(max(0.0, deadline - time.monotonic())):
+                        raise FutureTimeoutError()
+                    until = min(deadline, started_at[i] + _TASTE_PROFILE_TIMEOUT_S)
+                    result = future.result(timeout=max(0.0, until - time.monotonic()))
+                except FutureTimeoutError:
+                    logger.warning("Taste profile for %r timed out", _display_title(seed))
+                    continue
+                except Exception as exc:  # noqa: BLE001 - isolate per-seed failures
+                    logger.warning("Taste profile for %r failed: %s", _display_title(seed), exc)
+                    continue
+                if result is not None:
+                    results.append(result)
+        finally:
+            # Don't block the request on stragglers that already timed out.
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        return results
+
+    @staticmethod
+    async def _amap_seeds(seeds: List[Anime], alookup) -> list:
+        """Async :meth:`_map_seeds` bounded by a semaphore instead of a pool."""
+
+        slots = asyncio.Semaphore(_TASTE_PROFILE_WORKERS)
+
+        async def one(seed: Anime):
+            async with slots:
+                with request_priority(Priority.TASTE_PROFILE):
+                    return await asyncio.wait_for(alookup(seed), _TASTE_PROFILE_TIMEOUT_S)
+
+        outcomes = await asyncio.gather(*(one(s) for s in seeds), return_exceptions=True)
+
+        results = []
+        for seed, outcome in zip(seeds, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                logger.warning("Taste profile for %r timed out", _display_title(seed))
+            elif isinstance(outcome, BaseException):
+                # Includes CancelledError, which gather hands back as a value.
+                logger.warning("Taste profile for %r failed: %r", _display_title(seed), outcome)
+            elif outcome is not None:
+                results.append(outcome)
+        return results
+
+    @staticmethod
+    def _profile_for_media(media: Anime) -> tuple[list, list]:
+        """Resolve one seed to its (genres, tags) via the analyzer."""
+        return get_relevant_tags_and_genres(
+            _display_title(media),
+            media["genres"],
+            [tag["name"] for tag in media["tags"]],
+            media_id=media["id"],
+        )
+
+    @staticmethod
+    async def _aprofile_for_media(media: Anime) -> tuple[list, list]:
+        """Async :meth:`_profile_for_media`."""
+        return await aget_relevant_tags_and_genres(
+            _display_title(media),
+            media["genres"],
+            [tag["name"] for tag in media["tags"]],
+            media_id=media["id"],
+        )
+
+
+def _display_title(media: Anime) -> Optional[str]:
+    return media["title"].get("english") or media["title"].get("romaji")
+
 # --------------------------------------------------------------------------- #
 #  Static GraphQL query
 # --------------------------------------------------------------------------- #
@@ -223,6 +599,7 @@ query (
   $page: Int, $perPage: Int, $sort: [MediaSort]
 ) {
   Page(page: $page, perPage: $perPage) {
+    pageInfo { hasNextPage }
     media(
       search: $search, type: ANIME, season: $season,
       seasonYear: $seasonYear, genre: $genre, genre_in: $genres,
@@ -0,0 +1,262 @@
+"""
+Semantic Recommendation Cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Caches whole recommendation lists so that paraphrases of an earlier request
+("funny isekai", "isekai with comedy", "comedy isekai anime") are answered
+without running the crew or any LLM.
+
+Requests are fingerprinted in one of two ways:
+
+* When the local extractor (:mod:`src.filter_extractor`) is confident, by
+  the canonical form of the extracted ``AnimeSearchParams``. Paraphrases with
+  the same filters hit exactly.
+* Otherwise by a hashed bag of words and character trigrams, a CPU-only
+  embedding that needs no model download. It is compared by cosine
+  similarity against every stored request in one NumPy matrix-vector
+  product.
+
+A guard must match exactly on top of the similarity threshold: the numbers
+in the request and every negated word ("isekai from 2020" never serves
+"... 2021", "no romance" never serves "romance"). Entries expire after a TTL
+and the least recently used one is evicted when the cache is full.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_SEMANTIC_CACHE_THRESHOLD``     Minimum cosine similarity for a hit (0.9).
+``OSUSUME_SEMANTIC_CACHE_TTL_S``         Entry lifetime in seconds (1 h).
+``OSUSUME_SEMANTIC_CACHE_MAX_ENTRIES``   Capacity (1024).
+``OSUSUME_SEMANTIC_CACHE_DISABLED``      Set to ``1`` to bypass it.
+
+Cached values are shared between callers and must be treated as read-only.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.filter_extractor import (
+    FAST_PATH_MIN_CONFIDENCE, _NEGATIONS, _STOP_WORDS, _normalise, extract_filters,
+)
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+_THRESHOLD: float = float(os.getenv("OSUSUME_SEMANTIC_CACHE_THRESHOLD", 0.9))
+_TTL_S: float = float(os.getenv("OSUSUME_SEMANTIC_CACHE_TTL_S", 60 * 60))
+_MAX_ENTRIES: int = int(os.getenv("OSUSUME_SEMANTIC_CACHE_MAX_ENTRIES", 1024))
+_DISABLED: bool = os.getenv("OSUSUME_SEMANTIC_CACHE_DISABLED", "") == "1"
+
+# Embedding width; hashed features collide rarely at this size for short requests.
+_DIM: int = 1024
+_TRIGRAM_WEIGHT: float = 0.5
+
+# --------------------------------------------------------------------------- #
+#  Fingerprints & embedding
+# --------------------------------------------------------------------------- #
+
+def fingerprint(text: str) -> Tuple[str, str]:
+    """Return ``(embedding text, guard)`` for a user request."""
+    extraction = extract_filters(text)
+    if extraction.confidence >= FAST_PATH_MIN_CONFIDENCE:
+        params = extraction.params.model_dump(exclude_none=True)
+        for name in ("genres", "tags"):
+            if name in params:
+                params[name] = sorted(params[name])
+        canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return canonical, "params:" + canonical
+
+    tokens = _normalise(text)
+    negated = sorted({
+        nxt for tok, nxt in zip(tokens, tokens[1:] + [""])
+        if tok in _NEGATIONS and nxt
+    })
+    content = [t for t in tokens if t not in _STOP_WORDS]
+    numbers = sorted({t for t in content if any(c.isdigit() for c in t)})
+    return " ".join(content), "text:" + " ".join(numbers) + "|" + " ".join(negated)
+
+
+def embed(text: str, dim: int = _DIM) -> np.ndarray:
+    """Unit-length hashed bag of words + character trigrams of *text*."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in text.split():
+        _add_feature(vec, token, 1.0)
+        padded = f"<{token}>"
+        for i in range(len(padded) - 2):
+            _add_feature(vec, padded[i:i + 3], _TRIGRAM_WEIGHT)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _add_feature(vec: np.ndarray, feature: str, weight: float) -> None:
+    h = zlib.crc32(feature.encode("utf-8"))
+    # The top bit picks the sign so collisions cancel out instead of piling up.
+    vec[h % vec.shape[0]] += weight if h & 0x80000000 else -weight
+
+
+def _guard_hash(guard: str) -> int:
+    return int.from_bytes(hashlib.blake2b(guard.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+# --------------------------------------------------------------------------- #
+#  Cache implementation
+# --------------------------------------------------------------------------- #
+
+class SemanticCache:
+    """Thread-safe nearest-neighbour cache with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        threshold: float = _THRESHOLD,
+        ttl_s: float = _TTL_S,
+        max_entries: int = _MAX_ENTRIES,
+        dim: int = _DIM,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.dim = dim
+
+        self._lock = threading.Lock()
+        # One row per slot; a slot is live while expires_at > now.
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._guards = np.zeros(max_entries, dtype=np.int64)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._values: List[Any] = [None] * max_entries
+        self._keys: List[Optional[Tuple[str, str]]] = [None] * max_entries
+        self._slot_of: Dict[Tuple[str, str], int] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self._stats: Dict[str, Any] = {
+            "hits": 0,
+            "exact_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "expired": 0,
+            "evictions": 0,
+            "hit_similarity_total": 0.0,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def get(self, text: str) -> Optional[Any]:
+        """Return the value cached for *text* or a close paraphrase, else ``None``."""
+        key = fingerprint(text)
+        vec = embed(key[0], self.dim)
+        guard = _guard_hash(key[1])
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            slot = self._slot_of.get(key)
+            if slot is not None:
+                self._stats["exact_hits"] += 1
+                return self._hit(slot, 1.0)
+
+            live = np.flatnonzero((self._expires > now) & (self._guards == guard))
+            if live.size:
+                scores = self._vectors[live] @ vec
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    return self._hit(int(live[best]), float(scores[best]))
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, text: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        """Cache *value* as the answer to *text* for *ttl_s* seconds."""
+        key = fingerprint(text)
+        vec = embed(key[0], self.dim)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            slot = self._slot_of.get(key)
+            if slot is None:
+                slot = self._allocate()
+                self._slot_of[key] = slot
+                self._keys[slot] = key
+            self._vectors[slot] = vec
+            self._guards[slot] = _guard_hash(key[1])
+            self._expires[slot] = now + (self.ttl_s if ttl_s is None else ttl_s)
+            self._values[slot] = value
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+            self._stats["sets"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, entry count and the mean similarity of hits."""
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._stats)
+            snapshot["entries"] = len(self._lru)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_ratio"] = snapshot["hits"] / lookups if lookups else 0.0
+        snapshot["hit_similarity_mean"] = (
+            snapshot.pop("hit_similarity_total") / snapshot["hits"] if snapshot["hits"] else 0.0
+        )
+        return snapshot
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            for slot in list(self._lru):
+                self._release(slot)
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers (caller holds ``self._lock``)
+    # ------------------------------------------------------------------ #
+
+    def _hit(self, slot: int, similarity: float) -> Any:
+        self._lru.move_to_end(slot)
+        self._stats["hits"] += 1
+        self._stats["hit_similarity_total"] += similarity
+        return self._values[slot]
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        slot = next(iter(self._lru))
+        self._release(slot)
+        self._stats["evictions"] += 1
+        return self._free.pop()
+
+    def _release(self, slot: int) -> None:
+        del self._lru[slot]
+        del self._slot_of[self._keys[slot]]
+        self._keys[slot] = None
+        self._values[slot] = None
+        self._expires[slot] = 0.0
+        self._free.append(slot)
+
+    def _expire(self, now: float) -> None:
+        stale = np.flatnonzero((self._expires > 0) & (self._expires <= now))
+        for slot in stale:
+            self._release(int(slot))
+        self._stats["expired"] += int(stale.size)
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_cache: Optional[SemanticCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[SemanticCache]:
+    """Return the process-wide :class:`SemanticCache`, or ``None`` if disabled."""
+    global _shared_cache
+    if _DISABLED:
+        return None
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = SemanticCache()
+    return _shared_cache
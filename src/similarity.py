@@ -0,0 +1,183 @@
+"""
+Tag-Affinity Similarity Engine
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Vectorised "more like X" over the local catalog (:mod:`src.catalog`), as an
+LLM-free alternative to :meth:`SearchAnimeTool._build_taste_profile`.
+
+Every media becomes a row of a dense ``float32`` matrix: one column per
+AniList tag weighted by the tag's ``rank`` (0–1), spoiler tags damped, plus
+one column per entry of ``OFFICIAL_GENRES``. Rows are L2-normalised, so a
+single matrix product gives the cosine similarity of every media against a
+batch of seed profiles, and ``np.argpartition`` picks the top-k without a
+full sort.
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import json
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.catalog import CatalogIndex, get_catalog
+from src.columnar import GENRES, TAGS
+from src.request_parser import OFFICIAL_GENRES
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+_GENRE_WEIGHT: float = float(os.getenv("OSUSUME_SIMILARITY_GENRE_WEIGHT", 0.5))
+_SPOILER_WEIGHT: float = float(os.getenv("OSUSUME_SIMILARITY_SPOILER_WEIGHT", 0.5))
+
+# --------------------------------------------------------------------------- #
+#  Engine
+# --------------------------------------------------------------------------- #
+
+class SimilarityEngine:
+    """Cosine similarity over a media × (tags + genres) matrix."""
+
+    def __init__(self, index: CatalogIndex) -> None:
+        self.index = index
+
+        table = index.table
+        with open(os.path.join(parent_dir, "tags.json"), encoding="utf-8") as f:
+            tag_names: List[str] = list(json.load(f))
+        known = set(tag_names)
+        for name in (TAGS.names[i] for i in np.unique(table.tag_ids).tolist()):
+            if name not in known:
+                known.add(name)
+                tag_names.append(name)
+
+        self.columns: List[str] = tag_names + [f"genre:{g}" for g in OFFICIAL_GENRES]
+        self._tag_col = {name: i for i, name in enumerate(tag_names)}
+        self._genre_col = {g: len(tag_names) + i for i, g in enumerate(OFFICIAL_GENRES)}
+
+        # Straight from the table's CSR columns: interned id → matrix column.
+        matrix = np.zeros((len(table), len(self.columns)), dtype=np.float32)
+        tag_lut = np.array([self._tag_col.get(name, -1) for name in list(TAGS.names)], dtype=np.int64)
+        weights = np.maximum(table.tag_ranks, 0) / 100.0
+        weights = np.where(table.tag_spoilers, weights * _SPOILER_WEIGHT, weights)
+        matrix[table.entry_rows(table.tag_offsets), tag_lut[table.tag_ids]] = weights
+
+        genre_lut = np.array([self._genre_col.get(name, -1) for name in list(GENRES.names)], dtype=np.int64)
+        genre_cols = genre_lut[table.genre_ids]
+        official = genre_cols >= 0
+        matrix[table.entry_rows(table.genre_offsets)[official], genre_cols[official]] = _GENRE_WEIGHT
+        self.matrix = self._normalise(matrix)
+        self._row_of_id = {int(media_id): row for row, media_id in enumerate(index.ids)}
+
+    # ------------------------------------------------------------------ #
+    #  Vectorisation
+    # ------------------------------------------------------------------ #
+
+    def _fill(self, out: np.ndarray, genres, tags) -> None:
+        for name, rank, spoiler in tags:
+            col = self._tag_col.get(name)
+            if col is not None:
+                out[col] = (rank or 0) / 100.0 * (_SPOILER_WEIGHT if spoiler else 1.0)
+        for genre in genres:
+            col = self._genre_col.get(genre)
+            if col is not None:
+                out[col] = _GENRE_WEIGHT
+
+    @staticmethod
+    def _normalise(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def vectorize(self, media: Dict[str, Any]) -> np.ndarray:
+        """Return the unit profile vector of an ``Anime`` dict.
+
+        Media present in the catalog reuse their stored row; anything else
+        (e.g. a brand-new title from a live search) is vectorised on the fly.
+        """
+        row = self._row_of_id.get(media.get("id"))
+        if row is not None:
+            return self.matrix[row]
+        vec = np.zeros(len(self.columns), dtype=np.float32)
+        self._fill(
+            vec,
+            media.get("genres") or [],
+            ((t["name"], t.get("rank"), t.get("isMediaSpoiler")) for t in media.get("tags") or []),
+        )
+        return self._normalise(vec)
+
+    # ------------------------------------------------------------------ #
+    #  Scoring
+    # ------------------------------------------------------------------ #
+
+    def score(self, profiles: np.ndarray) -> np.ndarray:
+        """Cosine scores of every catalog media against ``(n_profiles, d)`` seeds."""
+        profiles = self._normalise(np.atleast_2d(profiles).astype(np.float32))
+        return profiles @ self.matrix.T
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Row indices of the *k* best scores in descending order (1-D input)."""
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def similar_to(
+        self,
+        seeds: Sequence[Dict[str, Any]],
+        k: int = 20,
+        offset: int = 0,
+        candidate_rows: Optional[np.ndarray] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the catalog media closest to the mean profile of *seeds*.
+
+        The seeds themselves are excluded. *candidate_rows* restricts the
+        result to rows matching other filters (see
+        :meth:`CatalogIndex.matching_rows`).
+        """
+        if not seeds:
+            return []
+        profile = np.mean([self.vectorize(s) for s in seeds], axis=0)
+        scores = self.score(profile)[0]
+
+        if candidate_rows is not None:
+            masked = np.full_like(scores, -np.inf)
+            masked[candidate_rows] = scores[candidate_rows]
+            scores = masked
+        for seed in seeds:
+            row = self._row_of_id.get(seed.get("id"))
+            if row is not None:
+                scores[row] = -np.inf
+
+        rows = self.top_k(scores, offset + k)[offset:]
+        rows = rows[np.isfinite(scores[rows])]
+        return [self.index.hydrate(int(r)) for r in rows]
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_engine: Optional[SimilarityEngine] = None
+_shared_lock = threading.Lock()
+
+
+def get_similarity_engine() -> Optional[SimilarityEngine]:
+    """Return an engine over the current catalog, or ``None`` if none is synced."""
+    global _shared_engine
+    index = get_catalog()
+    if index is None:
+        return None
+    if _shared_engine is None or _shared_engine.index is not index:
+        with _shared_lock:
+            if _shared_engine is None or _shared_engine.index is not index:
+                _shared_engine = SimilarityEngine(index)
+    return _shared_engine
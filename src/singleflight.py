@@ -0,0 +1,133 @@
+"""
+Single-Flight Request Coalescing
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Deduplicate identical in-flight calls: the first caller for a key (the
+leader) does the work, every concurrent caller with the same key waits for
+and shares the leader's result or exception. Nothing is remembered once the
+call finishes; persistence is the caches' job.
+
+A cancelled leader cancels only itself. Its waiting followers get
+:class:`LeaderCancelled`, which :meth:`SingleFlight.ado` answers by running
+the call again, so one of them becomes the new leader.
+
+Each :class:`SingleFlight` group registers itself by name so
+:func:`flight_stats` can report per-group coalescing ratios
+(``coalesced / calls``).
+
+Results are shared objects and must be treated as read-only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+_groups: Dict[str, "SingleFlight"] = {}
+
+
+class LeaderCancelled(RuntimeError):
+    """The caller running a shared call was cancelled; the call can be retried."""
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """A named group of coalesced calls, for threads and asyncio alike."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._futures: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0}
+        _groups[name] = self
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run ``fn()`` unless a call for *key* is already in flight; share its outcome."""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def ado(self, key: Hashable, afn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async :meth:`do`; coalesces within the running event loop."""
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._futures.get(slot)
+            leader = future is None
+            if leader:
+                future = self._futures[slot] = loop.create_future()
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            try:
+                # Shield so one impatient follower can't cancel everyone's result.
+                return await asyncio.shield(future)
+            except LeaderCancelled:
+                # Someone else's timeout, not ours: run the call again.
+                return await self.ado(key, afn)
+
+        try:
+            result = await afn()
+        except asyncio.CancelledError:
+            future.set_exception(LeaderCancelled(f"{self.name}: leader cancelled"))
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # mark retrieved when nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[slot]
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls, leader executions, coalesced followers and their ratio."""
+        with self._lock:
+            snapshot: Dict[str, Any] = dict(self._stats)
+        snapshot["coalescing_ratio"] = (
+            snapshot["coalesced"] / snapshot["calls"] if snapshot["calls"] else 0.0
+        )
+        return snapshot
+
+
+def flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Return :meth:`SingleFlight.stats` for every registered group."""
+    return {name: group.stats() for name, group in _groups.items()}
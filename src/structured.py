@@ -0,0 +1,354 @@
+"""
+Structured Output Parsing
+~~~~~~~~~~~~~~~~~~~~~~~~~
+Turns model text into validated Pydantic objects without giving up on the
+first stray character. Models wrap JSON in code fences, put a sentence
+before it ("Here are five picks: [...]"), answer with a Python literal
+(single quotes, ``None``) or get one field wrong. A single bad field used to
+cost the whole answer.
+
+Steps
+-----
+1. **Request structure where the call allows it.** :func:`json_schema_format`
+   (Chat Completions ``response_format``) and :func:`text_format` (Responses
+   API ``text.format``) ask the model for output matching a JSON schema. The
+   crew's ReAct agents need free text for their Thought/Action protocol, so
+   their answers start at step 2.
+2. **Extract.** :func:`extract_json` returns the whole text if it is JSON,
+   otherwise the first JSON (or Python-literal) array/object inside fenced
+   or chatty text. :func:`parse_list` and :func:`parse_object` skip values
+   that hold no fields of their model, so brackets in the prose ("my top
+   [5] picks") don't win.
+3. **Validate** each record against its model. Errors are kept per field.
+4. **Repair** only the broken fields. Unknown keys are dropped locally;
+   :func:`repair_fields` asks the model for just the invalid fields (with a
+   schema), and callers can plug in their own fixers. Records that still
+   fail are dropped. If records were sent but none validates,
+   :class:`StructuredOutputError` is raised.
+
+Each parse is counted by stage and outcome through
+:func:`src.tracing.record_parse` (Prometheus ``osusume_parse_outcomes_total``).
+Outcomes are ``clean`` (valid as sent), ``extracted`` (valid once pulled out
+of the text), ``repaired``, ``dropped`` (some records or fields discarded)
+and ``failed``.
+
+Usage::
+
+    items = parse_list(raw, RecommendationItem, stage="researcher", repair=fix)
+    params = parse_object(raw, AnimeSearchParams, stage="mapper")
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import ast
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from src.tracing import record_parse, span
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+# Set to 0 to skip model repair calls (local fixes and dropping still apply).
+_REPAIR: bool = os.getenv("OSUSUME_PARSE_REPAIR", "1") != "0"
+# Characters of the original answer sent along with a repair request.
+_REPAIR_CONTEXT_CHARS: int = 4000
+
+_FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*\s*\n?(.*?)```", re.S)
+_CLOSERS = {"[": "]", "{": "}"}
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+# (record, {field: error}) -> replacement values for some of those fields.
+Fixer = Callable[[Dict[str, Any], Dict[str, str]], Dict[str, Any]]
+
+
+class StructuredOutputError(ValueError):
+    """No usable structured value could be recovered from a model's output."""
+
+# --------------------------------------------------------------------------- #
+#  Schema requests
+# --------------------------------------------------------------------------- #
+
+def _schema(model: Type[BaseModel] | Dict[str, Any]) -> Dict[str, Any]:
+    return model if isinstance(model, dict) else model.model_json_schema()
+
+
+def json_schema_format(model: Type[BaseModel] | Dict[str, Any], name: str) -> Dict[str, Any]:
+    """``response_format`` for a Chat Completions call returning *model*."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": _schema(model)}}
+
+
+def text_format(model: Type[BaseModel] | Dict[str, Any], name: str, strict: bool = False) -> Dict[str, Any]:
+    """``text`` argument for a Responses API call returning *model*."""
+    return {"format": {"type": "json_schema", "name": name, "schema": _schema(model), "strict": strict}}
+
+# --------------------------------------------------------------------------- #
+#  Extraction
+# --------------------------------------------------------------------------- #
+
+def _balanced_end(text: str, start: int) -> int:
+    """Index just past the bracket closing ``text[start]``, or -1."""
+    stack = [_CLOSERS[text[start]]]
+    quote = None
+    i = start + 1
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "]}":
+            if ch != stack.pop():
+                return -1
+            if not stack:
+                return i + 1
+        i += 1
+    return -1
+
+
+def _literal(candidate: str) -> Any:
+    """*candidate* as JSON, else as a Python literal; raises ``ValueError``."""
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError) as e:
+        raise ValueError(str(e)) from None
+
+
+def _wanted(value: Any, expect: Optional[type]) -> bool:
+    return isinstance(value, (list, dict)) if expect is None else isinstance(value, expect)
+
+
+def iter_json(text: str, expect: Optional[type] = None) -> Iterator[Tuple[Any, bool]]:
+    """
+    Yield ``(value, clean)`` for every array/object in *text* (of type
+    *expect* if given), fenced blocks first; ``clean`` means *text* was
+    exactly that JSON.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return
+    try:
+        value = json.loads(text)
+        if _wanted(value, expect):
+            yield value, True
+            return
+    except json.JSONDecodeError:
+        pass
+
+    openers = "[" if expect is list else "{" if expect is dict else "[{"
+    # Fenced blocks first: the text around them is usually prose.
+    for candidate in [m.group(1) for m in _FENCE_RE.finditer(text)] + [text]:
+        for start, ch in enumerate(candidate):
+            if ch not in openers:
+                continue
+            end = _balanced_end(candidate, start)
+            if end < 0:
+                continue
+            try:
+                value = _literal(candidate[start:end])
+            except ValueError:
+                continue
+            if _wanted(value, expect):
+                yield value, False
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Tuple[Any, bool]:
+    """The first of :func:`iter_json`; raises :class:`StructuredOutputError` if none."""
+    for found in iter_json(text, expect):
+        return found
+    if not isinstance(text, str) or not text.strip():
+        raise StructuredOutputError("empty model output")
+    raise StructuredOutputError(f"no JSON {'array' if expect is list else 'object'} in model output")
+
+
+def _matching(model: Type[BaseModel], text: str, expect: type) -> Tuple[Any, bool]:
+    """
+    The value in *text* that holds *model* data: the first object (or array
+    with an object) sharing a key with *model*, else the first of *expect*.
+    Brackets in the prose around it ("my top [5] picks") are skipped.
+    """
+    fields = model.model_fields.keys()
+    first = None
+    for value, clean in iter_json(text, expect):
+        records = value if isinstance(value, list) else [value]
+        if any(isinstance(r, dict) and r.keys() & fields for r in records):
+            return value, clean
+        if first is None:
+            first = (value, clean)
+    return first if first is not None else extract_json(text, expect)
+
+
+# --------------------------------------------------------------------------- #
+#  Validation & repair
+# --------------------------------------------------------------------------- #
+
+def field_errors(exc: ValidationError) -> Dict[str, str]:
+    """``{top-level field: message}`` for a validation error."""
+    errors: Dict[str, str] = {}
+    for error in exc.errors():
+        field = str(error["loc"][0]) if error["loc"] else "__root__"
+        errors.setdefault(field, error["msg"])
+    return errors
+
+
+def _validate(model: Type[M], record: Any) -> Tuple[Optional[M], Dict[str, str]]:
+    if not isinstance(record, dict):
+        return None, {"__root__": f"expected an object, got {type(record).__name__}"}
+    try:
+        return model.model_validate(record), {}
+    except ValidationError as e:
+        return None, field_errors(e)
+
+
+def repair_fields(
+    record: Dict[str, Any],
+    errors: Dict[str, str],
+    model: Type[BaseModel],
+    llm: Dict[str, Any],
+    context: str = "",
+) -> Dict[str, Any]:
+    """
+    Ask the model (``litellm.completion(**llm, ...)``) for corrected values
+    of just the fields in *errors*. Returns ``{}`` when the call fails.
+    """
+    schema = model.model_json_schema()
+    fields = [f for f in errors if f in schema.get("properties", {})]
+    if not fields or not _REPAIR:
+        return {}
+    partial = {
+        "type": "object",
+        "properties": {f: schema["properties"][f] for f in fields},
+        "required": fields,
+        "additionalProperties": False,
+    }
+    if "$defs" in schema:
+        partial["$defs"] = schema["$defs"]
+    prompt = (
+        f"This {model.__name__} record has invalid fields:\n"
+        f"{json.dumps(record, ensure_ascii=False, default=str)}\n\n"
+        "Errors:\n" + "\n".join(f"- {f}: {errors[f]}" for f in fields) + "\n\n"
+        + (f"Original answer:\n{context[:_REPAIR_CONTEXT_CHARS]}\n\n" if context else "")
+        + f"Return only a JSON object with corrected values for: {', '.join(fields)}."
+    )
+
+    import litellm
+
+    with span("repair") as s:
+        try:
+            response = litellm.completion(
+                **llm,
+                messages=[{"role": "user", "content": prompt}],
+                response_format=json_schema_format(partial, f"{model.__name__}Repair"),
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                s.tokens(usage.prompt_tokens, usage.completion_tokens)
+            fixed, _ = extract_json(response.choices[0].message.content or "", dict)
+        except Exception as e:  # noqa: BLE001 - a failed repair just leaves the record broken
+            logger.debug("Repair call failed: %s", e)
+            return {}
+    return {f: fixed[f] for f in fields if f in fixed}
+
+
+def _fix(
+    model: Type[M], record: Dict[str, Any], errors: Dict[str, str], repairs: List[Fixer]
+) -> Tuple[Optional[M], str]:
+    """Try local drops then each fixer; returns ``(object, outcome)``."""
+    record = dict(record)
+    outcome = "dropped"
+    # Keys the model doesn't know (extra="forbid") are simply left out.
+    unknown = [f for f in errors if f in record and f not in model.model_fields]
+    for f in unknown:
+        del record[f]
+    obj, errors = _validate(model, record)
+    for fixer in repairs:
+        if obj is not None or "__root__" in errors:
+            break
+        patch = fixer(record, errors)
+        if patch:
+            record.update(patch)
+            outcome = "repaired"
+            obj, errors = _validate(model, record)
+    if obj is None:
+        # Optional fields that are still broken go back to their defaults.
+        optional = [f for f in errors if f in record and not model.model_fields[f].is_required()]
+        if optional and len(optional) == len(errors):
+            for f in optional:
+                del record[f]
+            obj, errors = _validate(model, record)
+            outcome = "dropped"
+    return obj, outcome if obj is not None else "failed"
+
+
+def parse_list(
+    text: str, model: Type[M], *, stage: str, repair: Optional[List[Fixer]] = None
+) -> List[M]:
+    """
+    Valid *model* items from a model's JSON array answer; broken ones are
+    repaired or dropped. An empty array is a valid (empty) answer.
+    """
+    try:
+        data, clean = _matching(model, text, list)
+    except StructuredOutputError:
+        record_parse(stage, "failed")
+        raise
+    items: List[M] = []
+    repaired = dropped = False
+    for record in data:
+        obj, errors = _validate(model, record)
+        if obj is None and isinstance(record, dict):
+            obj, fixed = _fix(model, record, errors, repair or [])
+            repaired |= fixed == "repaired"
+            dropped |= fixed == "dropped"
+        if obj is None:
+            logger.debug("Dropping %s item %r: %s", stage, record, errors)
+            dropped = True
+            continue
+        items.append(obj)
+    if data and not items:
+        record_parse(stage, "failed")
+        raise StructuredOutputError(f"no valid {model.__name__} in model output")
+    record_parse(stage, "dropped" if dropped else "repaired" if repaired else "clean" if clean else "extracted")
+    return items
+
+
+def parse_object(
+    value: str | Dict[str, Any], model: Type[M], *, stage: str, repair: Optional[List[Fixer]] = None
+) -> M:
+    """A *model* from a model's answer (text or an already-decoded dict)."""
+    try:
+        data, clean = (value, True) if isinstance(value, dict) else _matching(model, value, dict)
+    except StructuredOutputError:
+        record_parse(stage, "failed")
+        raise
+    obj, errors = _validate(model, data)
+    outcome = "clean" if clean else "extracted"
+    if obj is None:
+        obj, outcome = _fix(model, data, errors, repair or [])
+    record_parse(stage, outcome)
+    if obj is None:
+        raise StructuredOutputError(f"invalid {model.__name__}: {errors}")
+    return obj
@@ -0,0 +1,450 @@
+"""
+Pipeline Tracing
+~~~~~~~~~~~~~~~~
+Lightweight spans around each stage of a recommendation (mapper, researcher,
+``search_anime`` tool, taste-profile analyzer calls, AniList queries,
+parsing) so a slow request can be attributed to the stage that caused it.
+
+A span records its duration and, where the stage knows them, LLM token
+counts, HTTP bytes and whether it was answered from a cache::
+
+    with span("analyzer") as s:
+        response = client.responses.create(...)
+        s.tokens(response.usage.input_tokens, response.usage.output_tokens)
+
+or, for a whole function, ``@traced("tool")``. Code further down the stack
+annotates the innermost open span through :func:`current_span` (e.g. the
+HTTP layer adds the bytes it moved).
+
+Finished spans feed per-stage Prometheus metrics (:func:`metrics_text`,
+served by ``GET /metrics`` in :mod:`api`) and, optionally, OpenTelemetry
+spans with the same parent/child structure. :func:`record_parse` adds a
+counter of how each structured model output was parsed (clean, extracted
+from chatty text, repaired, dropped, failed); unlike spans it is always on.
+
+When tracing is disabled (the default) :func:`span` and
+:func:`current_span` return a shared no-op object after a single flag check,
+and :func:`traced` functions call straight through.
+
+Configuration (environment)
+---------------------------
+``OSUSUME_TRACING``        Set to ``1`` to record spans.
+``OSUSUME_TRACING_OTEL``   Set to ``1`` to also emit OpenTelemetry spans. They
+                           go to the globally configured tracer provider, or to
+                           an OTLP/HTTP exporter when ``OTEL_EXPORTER_OTLP_ENDPOINT``
+                           is set and none is configured.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# --------------------------------------------------------------------------- #
+#  Configuration & logging
+# --------------------------------------------------------------------------- #
+
+_ENABLED: bool = os.getenv("OSUSUME_TRACING", "") == "1"
+_OTEL_WANTED: bool = os.getenv("OSUSUME_TRACING_OTEL", "") == "1"
+
+# Upper bounds (seconds) of the stage-duration histogram buckets.
+_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "osusume_current_span", default=None
+)
+
+# --------------------------------------------------------------------------- #
+#  Spans
+# --------------------------------------------------------------------------- #
+
+class Span:
+    """One timed stage. Use as a context manager; nests through a ContextVar."""
+
+    __slots__ = (
+        "name", "attributes", "parent", "started", "wall_started",
+        "prompt_tokens", "completion_tokens", "bytes_sent", "bytes_received",
+        "http_requests", "cache", "error", "_token", "_otel",
+    )
+    recording = True
+
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.name = name
+        self.attributes = attributes or {}
+        self.parent: Optional[Span] = None
+        self.started = 0.0
+        self.wall_started = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.http_requests = 0
+        self.cache: Optional[bool] = None
+        self.error: Optional[str] = None
+        self._token: Optional[contextvars.Token] = None
+        self._otel = None
+
+    def __enter__(self) -> "Span":
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        self.wall_started = time.time()
+        self.started = time.perf_counter()
+        if _otel_tracer is not None:
+            self._otel = _otel_start(self.name, self.parent, self.wall_started)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration_s = time.perf_counter() - self.started
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.error = exc_type.__name__
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Closed from another context (e.g. a generator finished by another thread).
+            _current.set(self.parent)
+        _registry.observe(self, duration_s)
+        if self._otel is not None:
+            _otel_finish(self._otel, self, exc, self.wall_started + duration_s)
+
+    def set(self, key: str, value: Any) -> None:
+        """Attach an attribute (exported to OpenTelemetry only)."""
+        self.attributes[key] = value
+
+    def tokens(self, prompt: Optional[int], completion: Optional[int]) -> None:
+        """Add LLM token usage."""
+        self.prompt_tokens += prompt or 0
+        self.completion_tokens += completion or 0
+
+    def http_bytes(self, sent: int, received: int) -> None:
+        """Add one HTTP exchange of *sent* / *received* body bytes."""
+        self.http_requests += 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+    def cache_hit(self, hit: bool) -> None:
+        """Mark whether this stage was served from a cache."""
+        self.cache = hit
+
+
+class _NoopSpan:
+    """Shared stand-in returned while tracing is disabled."""
+
+    __slots__ = ()
+    recording = False
+    http_requests = 0
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def tokens(self, prompt: Optional[int], completion: Optional[int]) -> None:
+        pass
+
+    def http_bytes(self, sent: int, received: int) -> None:
+        pass
+
+    def cache_hit(self, hit: bool) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, **attributes: Any) -> Span | _NoopSpan:
+    """Return a context manager timing the stage *name*."""
+    if not _ENABLED:
+        return _NOOP
+    return Span(name, attributes)
+
+
+def current_span() -> Span | _NoopSpan:
+    """The innermost open span, or a no-op span."""
+    if not _ENABLED:
+        return _NOOP
+    return _current.get() or _NOOP
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running the (sync or async) function inside ``span(name)``."""
+
+    def decorate(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                if not _ENABLED:
+                    return await fn(*args, **kwargs)
+                with Span(name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def record_span(name: str, started: float, ended: float, **attributes: Any) -> None:
+    """Record a stage that already happened (wall-clock *started*/*ended*),
+    as a child of the current span."""
+    if not _ENABLED:
+        return
+    finished = Span(name, attributes)
+    finished.parent = _current.get()
+    finished.wall_started = started
+    _registry.observe(finished, max(0.0, ended - started))
+    if _otel_tracer is not None:
+        _otel_finish(_otel_start(name, finished.parent, started), finished, None, ended)
+
+
+def record_parse(stage: str, outcome: str) -> None:
+    """Count one structured model output of *stage* parsed with *outcome*
+    (see :mod:`src.structured`). Always counted, tracing or not: it is one
+    locked increment per model call."""
+    _registry.count_parse(stage, outcome)
+
+
+def enable(otel: bool = False) -> None:
+    """Turn tracing on at runtime (e.g. from a benchmark)."""
+    global _ENABLED
+    _ENABLED = True
+    if otel:
+        _init_otel()
+
+
+def disable() -> None:
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+# --------------------------------------------------------------------------- #
+#  Metrics
+# --------------------------------------------------------------------------- #
+
+class _Registry:
+    """Per-stage histograms and counters behind :func:`metrics_text`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[int]] = {}
+        self._sums: Counter = Counter()
+        self._counts: Counter = Counter()
+        self._errors: Counter = Counter()
+        self._tokens: Counter = Counter()
+        self._bytes: Counter = Counter()
+        self._cache: Counter = Counter()
+        self._parses: Counter = Counter()
+
+    def observe(self, s: Span, duration_s: float) -> None:
+        with self._lock:
+            buckets = self._buckets.get(s.name)
+            if buckets is None:
+                buckets = self._buckets[s.name] = [0] * len(_BUCKETS)
+            for i, bound in enumerate(_BUCKETS):
+                if duration_s <= bound:
+                    buckets[i] += 1
+                    break
+            self._sums[s.name] += duration_s
+            self._counts[s.name] += 1
+            if s.error:
+                self._errors[s.name] += 1
+            if s.prompt_tokens or s.completion_tokens:
+                self._tokens[(s.name, "prompt")] += s.prompt_tokens
+                self._tokens[(s.name, "completion")] += s.completion_tokens
+            if s.http_requests:
+                self._bytes[(s.name, "sent")] += s.bytes_sent
+                self._bytes[(s.name, "received")] += s.bytes_received
+            if s.cache is not None:
+                self._cache[(s.name, "hit" if s.cache else "miss")] += 1
+
+    def count_parse(self, stage: str, outcome: str) -> None:
+        with self._lock:
+            self._parses[(stage, outcome)] += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            lines = [
+                "# HELP osusume_stage_duration_seconds Time spent in each pipeline stage.",
+                "# TYPE osusume_stage_duration_seconds histogram",
+            ]
+            for stage in sorted(self._buckets):
+                cumulative = 0
+                for bound, count in zip(_BUCKETS, self._buckets[stage]):
+                    cumulative += count
+                    lines.append(
+                        f'osusume_stage_duration_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'osusume_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {self._counts[stage]}'
+                )
+                lines.append(f'osusume_stage_duration_seconds_sum{{stage="{stage}"}} {self._sums[stage]:.6f}')
+                lines.append(f'osusume_stage_duration_seconds_count{{stage="{stage}"}} {self._counts[stage]}')
+
+            lines += _counter_lines(
+                "osusume_stage_errors_total", "Stage runs that raised.",
+                {(stage,): n for stage, n in self._errors.items()}, ("stage",),
+            )
+            lines += _counter_lines(
+                "osusume_llm_tokens_total", "LLM tokens used, by stage and kind.",
+                self._tokens, ("stage", "kind"),
+            )
+            lines += _counter_lines(
+                "osusume_http_bytes_total", "HTTP body bytes, by stage and direction.",
+                self._bytes, ("stage", "direction"),
+            )
+            lines += _counter_lines(
+                "osusume_cache_lookups_total", "Cache lookups, by stage and result.",
+                self._cache, ("stage", "result"),
+            )
+            lines += _counter_lines(
+                "osusume_parse_outcomes_total", "Structured model outputs parsed, by stage and outcome.",
+                self._parses, ("stage", "outcome"),
+            )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats: Dict[str, Dict[str, Any]] = {}
+            for stage, count in self._counts.items():
+                stats[stage] = {
+                    "count": count,
+                    "total_s": self._sums[stage],
+                    "mean_s": self._sums[stage] / count,
+                    "errors": self._errors[stage],
+                    "prompt_tokens": self._tokens[(stage, "prompt")],
+                    "completion_tokens": self._tokens[(stage, "completion")],
+                    "bytes_sent": self._bytes[(stage, "sent")],
+                    "bytes_received": self._bytes[(stage, "received")],
+                    "cache_hits": self._cache[(stage, "hit")],
+                    "cache_misses": self._cache[(stage, "miss")],
+                }
+            for (stage, outcome), n in self._parses.items():
+                stats.setdefault(stage, {}).setdefault("parse_outcomes", {})[outcome] = n
+            return stats
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            for counter in (
+                self._sums, self._counts, self._errors, self._tokens, self._bytes, self._cache, self._parses,
+            ):
+                counter.clear()
+
+
+def _counter_lines(name: str, help_text: str, values: Dict[tuple, int], labels: Tuple[str, ...]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for key in sorted(values):
+        label_text = ",".join(f'{label}="{value}"' for label, value in zip(labels, key))
+        lines.append(f"{name}{{{label_text}}} {values[key]}")
+    return lines
+
+
+_registry = _Registry()
+
+
+def metrics_text() -> str:
+    """All stage metrics in Prometheus text format."""
+    return _registry.render()
+
+
+def trace_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-stage count, time, tokens, bytes and cache hits since start/reset."""
+    return _registry.snapshot()
+
+
+def reset_metrics() -> None:
+    _registry.reset()
+
+# --------------------------------------------------------------------------- #
+#  OpenTelemetry bridge (optional)
+# --------------------------------------------------------------------------- #
+
+_otel_tracer = None
+_otel_lock = threading.Lock()
+
+
+def _init_otel() -> None:
+    """Set up :data:`_otel_tracer`; tracing keeps working without it."""
+    global _otel_tracer
+    with _otel_lock:
+        if _otel_tracer is not None:
+            return
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logger.warning("OSUSUME_TRACING_OTEL is set but opentelemetry-api is not installed")
+            return
+        if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") and isinstance(
+            trace.get_tracer_provider(), trace.ProxyTracerProvider
+        ):
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            except ImportError as exc:
+                logger.warning("OTLP exporter unavailable (%s); using the global tracer provider", exc)
+            else:
+                provider = TracerProvider(resource=Resource.create({"service.name": "osusume"}))
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(provider)
+        _otel_tracer = trace.get_tracer("osusume")
+
+
+def _otel_start(name: str, parent: Optional[Span], started: float):
+    from opentelemetry import trace
+
+    context = None
+    if parent is not None and parent._otel is not None:
+        context = trace.set_span_in_context(parent._otel)
+    return _otel_tracer.start_span(name, context=context, start_time=int(started * 1e9))
+
+
+def _otel_finish(otel_span, s: Span, exc: Optional[BaseException], ended: float) -> None:
+    from opentelemetry.trace import Status, StatusCode
+
+    for key, value in s.attributes.items():
+        if isinstance(value, (str, bool, int, float)):
+            otel_span.set_attribute(key, value)
+    if s.prompt_tokens or s.completion_tokens:
+        otel_span.set_attribute("llm.usage.prompt_tokens", s.prompt_tokens)
+        otel_span.set_attribute("llm.usage.completion_tokens", s.completion_tokens)
+    if s.http_requests:
+        otel_span.set_attribute("http.requests", s.http_requests)
+        otel_span.set_attribute("http.request.body.size", s.bytes_sent)
+        otel_span.set_attribute("http.response.body.size", s.bytes_received)
+    if s.cache is not None:
+        otel_span.set_attribute("cache.hit", s.cache)
+    if s.error:
+        if exc is not None:
+            otel_span.record_exception(exc)
+        otel_span.set_status(Status(StatusCode.ERROR, s.error))
+    otel_span.end(end_time=int(ended * 1e9))
+
+
+if _ENABLED and _OTEL_WANTED:
+    _init_otel()
@@ -0,0 +1,344 @@
+"""
+Tag & Genre Normalization Index
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+Snaps genre and tag names coming from the LLM ("School Life", "Iseka",
+"sci fi", "Comedy" listed as a tag) to real AniList values before a query is
+sent. An unknown ``tag_in`` value makes AniList return nothing, and the
+researcher then retries with more tool calls.
+
+Lookup, cheapest first
+----------------------
+1. Exact hash of the ~400 names in ``genres.json`` and ``tags.json``.
+2. Folded alias table: lower-cased tokens without punctuation, singular and
+   plural forms, plus the extractor's synonyms ("school life" → School,
+   "romcom" → Romance + Comedy).
+3. Character-trigram index over both tables to find candidates, confirmed
+   by a Damerau–Levenshtein similarity ratio (1 - distance / length) of at
+   least 0.8 against both names. Names under six characters are never
+   guessed at ("Cats" is not a typo of "Scat"), and sexual-content tags and
+   the extractor's ambiguous tags ("Bar", "Work") are only reachable by
+   exact or alias match.
+
+Names resolve to whatever they really are: a genre the mapper put under
+``tags`` moves to ``genres`` and vice versa. Names that can't be resolved are
+dropped. Results are memoised per name, so repeat lookups are a dict hit.
+
+:meth:`VocabularyIndex.stats` counts lookups per method and how often a
+snapped query came back non-empty (a rescued query).
+"""
+
+from __future__ import annotations
+
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.append(parent_dir)
+
+import argparse
+import heapq
+import json
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.filter_extractor import _AMBIGUOUS_TAGS, _SYNONYMS, _load_names, _normalise, _variants
+from src.request_parser import AnimeSearchParams, OFFICIAL_GENRES
+
+# --------------------------------------------------------------------------- #
+#  Configuration
+# --------------------------------------------------------------------------- #
+
+# Trigram candidates checked with the (slower) edit distance.
+_FUZZY_CANDIDATES: int = 8
+# Shortest folded name, and lowest 1 - distance / length, a fuzzy match accepts.
+_FUZZY_MIN_LENGTH: int = 6
+_FUZZY_MIN_SIMILARITY: float = 0.8
+# Memoised lookups kept before the memo is reset.
+_MEMO_SIZE: int = 4096
+
+# AniList's "Sexual Content" tags. A misspelt ordinary word must never land
+# on one of these, so they take part in exact and alias lookup only.
+_ADULT_TAGS = frozenset({
+    "Ahegao", "Anal Sex", "Armpits", "Ashikoki", "Asphyxiation", "Bondage", "Boobjob",
+    "Cumflation", "Cunnilingus", "Deepthroat", "Defloration", "DILF",
+    "Double Penetration", "Exhibitionism", "Facial", "Feet", "Fellatio", "Femdom",
+    "Flat Chest", "Futanari", "Group Sex", "Handjob", "Human Pet", "Hypersexuality",
+    "Incest", "Inseki", "Irrumatio", "Lactation", "Large Breasts", "Masochism",
+    "Masturbation", "MILF", "Nakadashi", "Netorare", "Netorase", "Netori", "Nudity",
+    "Pet Play", "Prostitution", "Psychosexual", "Public Sex", "Rape", "Rimjob",
+    "Sadism", "Scat", "Scissoring", "Sex Toys", "Squirting", "Sumata", "Sweat",
+    "Tanned Skin", "Tentacles", "Threesome", "Virginity", "Vore", "Voyeur",
+    "Watersports",
+})
+# Tags fuzzy matching never proposes.
+_NO_FUZZY_TAGS = _ADULT_TAGS | _AMBIGUOUS_TAGS
+
+# A target is ("genre" | "tag", canonical name).
+Target = Tuple[str, str]
+
+# --------------------------------------------------------------------------- #
+#  String helpers
+# --------------------------------------------------------------------------- #
+
+def _fold(name: str) -> str:
+    return " ".join(_normalise(name))
+
+
+def _trigrams(folded: str) -> set:
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_distance(folded: str) -> int:
+    """Edits :data:`_FUZZY_MIN_SIMILARITY` allows on *folded* (0: don't guess)."""
+    if len(folded) < _FUZZY_MIN_LENGTH:
+        return 0
+    return int(len(folded) * (1 - _FUZZY_MIN_SIMILARITY) + 1e-9)
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau–Levenshtein (optimal string alignment), or ``limit + 1`` once exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+# --------------------------------------------------------------------------- #
+#  Results
+# --------------------------------------------------------------------------- #
+
+@dataclass
+class FilterSnap:
+    """Outcome of :meth:`VocabularyIndex.snap_filters`."""
+
+    genres: List[str]
+    tags: List[str]
+    corrections: Dict[str, List[str]] = field(default_factory=dict)
+    dropped: List[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.corrections or self.dropped)
+
+# --------------------------------------------------------------------------- #
+#  Index
+# --------------------------------------------------------------------------- #
+
+class VocabularyIndex:
+    """Exact, alias and trigram/edit-distance lookup over AniList genres and tags."""
+
+    def __init__(
+        self,
+        genres: Sequence[str],
+        tags: Sequence[str],
+        synonyms: Dict[str, Tuple[Tuple[str, str], ...]] = _SYNONYMS,
+    ) -> None:
+        self._exact: Dict[str, Target] = {}
+        for tag in tags:
+            self._exact[tag] = ("tag", tag)
+        # Genres win when a name is both.
+        for genre in genres:
+            self._exact[genre] = ("genre", genre)
+
+        self._aliases: Dict[str, Tuple[Target, ...]] = {}
+        for name, target in self._exact.items():
+            self._add_alias(name, (target,))
+        for phrase, targets in synonyms.items():
+            self._add_alias(phrase, tuple(t for t in targets if t[0] in ("genre", "tag")))
+
+        # Fuzzy index over every folded name and alias that may be guessed at.
+        fuzzy = {
+            folded: targets for folded, targets in self._aliases.items()
+            if not any(kind == "tag" and value in _NO_FUZZY_TAGS for kind, value in targets)
+        }
+        self._folded_names: List[str] = list(fuzzy)
+        self._folded_targets: List[Tuple[Target, ...]] = list(fuzzy.values())
+        self._gram_counts: List[int] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for index, folded in enumerate(self._folded_names):
+            grams = _trigrams(folded)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(index)
+
+        self._memo: Dict[str, Tuple[Tuple[Target, ...], str]] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "exact": 0, "alias": 0, "fuzzy": 0, "unknown": 0,
+            "snapped_queries": 0, "rescued": 0, "still_empty": 0,
+        }
+
+    # ------------------------------------------------------------------ #
+    #  Public API
+    # ------------------------------------------------------------------ #
+
+    def lookup(self, name: str) -> Tuple[Tuple[Target, ...], str]:
+        """Return ``(targets, method)``; method is exact, alias, fuzzy or unknown."""
+        found = self._exact.get(name)
+        if found is not None:
+            return (found,), "exact"
+        memo = self._memo.get(name)
+        if memo is None:
+            memo = self._resolve(name)
+            if len(self._memo) >= _MEMO_SIZE:
+                self._memo.clear()
+            self._memo[name] = memo
+        return memo
+
+    def snap_filters(self, genres: Sequence[str], tags: Sequence[str]) -> FilterSnap:
+        """Resolve *genres* and *tags* to AniList values, regrouped by their real kind."""
+        snap = FilterSnap(genres=[], tags=[])
+        counts: Dict[str, int] = defaultdict(int)
+        for name in list(genres) + list(tags):
+            targets, method = self.lookup(name)
+            counts[method] += 1
+            if not targets:
+                snap.dropped.append(name)
+                continue
+            if method != "exact" or (targets[0][0] == "genre") != (name in genres):
+                snap.corrections[name] = [value for _, value in targets]
+            for kind, value in targets:
+                bucket = snap.genres if kind == "genre" else snap.tags
+                if value not in bucket:
+                    bucket.append(value)
+        with self._lock:
+            for method, n in counts.items():
+                self._stats[method] += n
+            if snap.changed:
+                self._stats["snapped_queries"] += 1
+        return snap
+
+    def snap_params(self, params: AnimeSearchParams) -> AnimeSearchParams:
+        """Return *params* with ``genres``/``tags`` snapped (the same object if unchanged)."""
+        snap = self.snap_filters(params.genres or [], params.tags or [])
+        if not snap.changed:
+            return params
+        return params.model_copy(update={"genres": snap.genres or None, "tags": snap.tags or None})
+
+    def record_outcome(self, found: bool) -> None:
+        """Record whether a query whose filters were snapped returned anything."""
+        with self._lock:
+            self._stats["rescued" if found else "still_empty"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            snapshot: Dict[str, float] = dict(self._stats)
+        outcomes = snapshot["rescued"] + snapshot["still_empty"]
+        snapshot["rescue_rate"] = snapshot["rescued"] / outcomes if outcomes else 0.0
+        return snapshot
+
+    # ------------------------------------------------------------------ #
+    #  Private helpers
+    # ------------------------------------------------------------------ #
+
+    def _add_alias(self, phrase: str, targets: Tuple[Target, ...]) -> None:
+        tokens = _normalise(phrase)
+        if not tokens or not targets:
+            return
+        for variant in _variants(tokens):
+            self._aliases.setdefault(" ".join(variant), targets)
+
+    def _resolve(self, name: str) -> Tuple[Tuple[Target, ...], str]:
+        folded = _fold(name)
+        if not folded:
+            return (), "unknown"
+        targets = self._aliases.get(folded)
+        if targets is not None:
+            return targets, "alias"
+        targets = self._fuzzy(folded)
+        if targets is not None:
+            return targets, "fuzzy"
+        return (), "unknown"
+
+    def _fuzzy(self, folded: str) -> Optional[Tuple[Target, ...]]:
+        limit = _max_distance(folded)
+        if not limit:
+            return None
+        grams = _trigrams(folded)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for index in self._postings.get(gram, ()):
+                shared[index] += 1
+        if not shared:
+            return None
+
+        # Dice coefficient picks the candidates; edit distance decides.
+        dice = {i: 2 * n / (len(grams) + self._gram_counts[i]) for i, n in shared.items()}
+        candidates = heapq.nlargest(_FUZZY_CANDIDATES, dice, key=dice.__getitem__)
+        best: Optional[Tuple[int, float, int]] = None
+        for index in candidates:
+            name = self._folded_names[index]
+            distance = _edit_distance(folded, name, limit)
+            # Both names must keep the ratio, so a long query can't match a
+            # shorter name by trailing junk.
+            if distance <= min(limit, _max_distance(name)):
+                key = (distance, -dice[index], index)
+                if best is None or key < best:
+                    best = key
+        return None if best is None else self._folded_targets[best[2]]
+
+# --------------------------------------------------------------------------- #
+#  Shared instance
+# --------------------------------------------------------------------------- #
+
+_shared_index: Optional[VocabularyIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_vocabulary() -> VocabularyIndex:
+    """Return the process-wide index over the bundled vocabularies."""
+    global _shared_index
+    if _shared_index is None:
+        with _shared_lock:
+            if _shared_index is None:
+                genres = list(dict.fromkeys(OFFICIAL_GENRES + _load_names("genres.json")))
+                _shared_index = VocabularyIndex(genres, _load_names("tags.json"))
+    return _shared_index
+
+
+def snap_filters(genres: Sequence[str], tags: Sequence[str]) -> FilterSnap:
+    """Shortcut for ``get_vocabulary().snap_filters(genres, tags)``."""
+    return get_vocabulary().snap_filters(genres, tags)
+
+
+def snap_params(params: AnimeSearchParams) -> AnimeSearchParams:
+    """Shortcut for ``get_vocabulary().snap_params(params)``."""
+    return get_vocabulary().snap_params(params)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Resolve genre/tag names against AniList's vocabulary.")
+    parser.add_argument("names", nargs="+")
+    args = parser.parse_args(argv)
+
+    index = get_vocabulary()
+    for name in args.names:
+        started = time.perf_counter()
+        targets, method = index.lookup(name)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(json.dumps({
+            "name": name,
+            "method": method,
+            "targets": [list(t) for t in targets],
+            "us": round(elapsed_us, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# get parent directory
+import os
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# add parent directory to sys.path
+import sys
+sys.path.insert(0, parent_dir)
+
+# Tests never talk to CrewAI's telemetry endpoint (as in benchmarks/load_test.py).
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
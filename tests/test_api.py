@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_healthz_reports_operational_stats(client):
+    health = client.get("/healthz").json()
+    assert health["status"] == "ok"
+    assert {"pool", "cache", "profiles", "rate_limiter", "singleflight", "http", "streams", "prefetch"} <= set(health)
+    assert "coalescing_ratio" in health["singleflight"]["anilist"]
+    assert set(health["rate_limiter"]["queue_depth"]) == {"INTERACTIVE", "TASTE_PROFILE", "BACKGROUND"}
+
+
+def test_metrics_exports_operational_stats(client):
+    text = client.get("/metrics").text
+    for family in (
+        "osusume_response_cache_lookups_total",
+        "osusume_rate_limit_queue_depth",
+        "osusume_singleflight_calls_total",
+        "osusume_http_requests_total",
+        "osusume_stream_first_card_seconds",
+        "osusume_profile_store_llm_calls_saved_total",
+        "osusume_api_requests",
+    ):
+        assert f"# TYPE {family} " in text
+    assert 'osusume_rate_limit_queue_depth{priority="INTERACTIVE"} 0' in text
+
+
+def test_metric_lines_skip_missing_values_and_keep_integers():
+    lines = api._metric(
+        "x_total", "counter", "X.", {("a",): 1234567, ("b",): None, ("c",): 0.1234567}, ("k",)
+    )
+    assert lines[2:] == ['x_total{k="a"} 1234567', 'x_total{k="c"} 0.123457']
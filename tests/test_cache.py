@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from src import cache, tracing
+from src.cache import ResponseCache, cached_query
+from src.singleflight import SingleFlight
+from src.tracing import span
+
+
+@pytest.fixture
+def marks(monkeypatch):
+    """Cache flags of the ``anilist`` spans recorded during the test, as {"hit"/"miss": n}."""
+    monkeypatch.setattr(cache, "_shared_cache", ResponseCache(path=None))
+    was_enabled = tracing.is_enabled()
+    tracing.enable()
+    tracing.reset_metrics()
+    yield lambda: {k[1]: n for k, n in tracing._registry._cache.items() if k[0] == "anilist"}
+    tracing.reset_metrics()
+    if not was_enabled:
+        tracing.disable()
+
+
+def test_hit_and_miss_are_flagged(marks):
+    def fetch(query, variables):
+        return {"data": {"n": variables["n"]}}
+
+    for _ in range(2):
+        with span("anilist"):
+            assert cached_query(fetch, "q", {"n": 1}) == {"data": {"n": 1}}
+    assert marks() == {"miss": 1, "hit": 1}
+
+
+def test_single_flight_followers_are_misses(marks, monkeypatch):
+    flights = SingleFlight("test-cache")
+    monkeypatch.setattr(cache, "_flights", flights)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch(query, variables):
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"data": {}}
+
+    def lookup():
+        with span("anilist"):
+            cached_query(fetch, "q", {})
+
+    leader = threading.Thread(target=lookup)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lookup) for _ in range(3)]
+    for t in followers:
+        t.start()
+    deadline = time.monotonic() + 5
+    while flights.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    # One network call, but nobody was answered from a cache tier.
+    assert len(calls) == 1
+    assert marks() == {"miss": 4}
@@ -0,0 +1,70 @@
+import copy
+
+import pytest
+
+from benchmarks.stub_server import SyntheticCatalog
+from src.columnar import Interner, MediaTable, PackedPage, pack_page
+
+
+@pytest.fixture(scope="module")
+def media():
+    return SyntheticCatalog(seed=7).media[:200]
+
+
+def test_from_media_round_trips(media):
+    table = MediaTable.from_media(media)
+    assert len(table) == len(media)
+    assert table.to_dicts() == media
+    assert table.to_dicts([5, 0]) == [media[5], media[0]]
+    assert table.take([3, 1]).to_dicts() == [media[3], media[1]]
+
+
+def test_round_trip_keeps_nulls_and_field_order():
+    sparse = {
+        "id": 9, "title": {"romaji": "R", "english": None}, "genres": [], "tags": [
+            {"id": 1, "name": "Isekai", "rank": None, "isMediaSpoiler": False},
+        ],
+        "averageScore": None, "episodes": None, "format": None, "status": "RELEASING",
+        "seasonYear": None, "coverImage": {"medium": None},
+    }
+    reordered = {k: sparse[k] for k in reversed(list(sparse))}
+    for m in (sparse, reordered):
+        out = MediaTable.from_media([m]).to_dicts()
+        assert out == [m]
+        assert list(out[0]) == list(m)
+
+
+def test_unknown_fields_and_malformed_media_raise():
+    with pytest.raises(ValueError):
+        MediaTable.from_media([{"id": 1, "bogus": 2}])
+    with pytest.raises(ValueError):
+        MediaTable.from_media([{"id": 1, "tags": [{"name": "x"}]}])
+
+
+def test_pack_page_round_trips(media):
+    payload = {"data": {"Page": {"pageInfo": {"hasNextPage": True}, "media": media[:50]}}}
+    packed = pack_page(copy.deepcopy(payload))
+    assert isinstance(packed, PackedPage)
+    assert packed.unpack() == payload
+    assert packed.table.nbytes < len(repr(payload))
+
+
+@pytest.mark.parametrize("payload", [
+    None,
+    {"data": {"Page": {"media": []}}},
+    {"errors": [{"message": "x"}], "data": None},
+    {"data": {"Media": {"id": 1}}},
+    {"data": {"Page": {"media": [{"id": 1, "extra": True}]}}},
+])
+def test_pack_page_declines_what_would_not_round_trip(payload):
+    assert pack_page(payload) is None
+
+
+def test_interner():
+    names = Interner()
+    b, null, a, b_again = names.codes(["b", None, "a", "b"])
+    assert (null, b_again) == (-1, b)
+    assert sorted([a, b]) == [0, 1]
+    assert names.intern("a") == a and names.names[b] == "b"
+    assert names.get("c") is None
+    assert names.intern("c") == 2 and len(names) == 3
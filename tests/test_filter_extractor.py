@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+
+from src.filter_extractor import FAST_PATH_MIN_CONFIDENCE, FilterExtractor, get_filter_extractor
+
+TODAY = datetime.date(2024, 5, 10)
+
+
+@pytest.fixture
+def extract():
+    extractor = get_filter_extractor()
+    return lambda text: extractor.extract(text, today=TODAY)
+
+# --------------------------------------------------------------------------- #
+#  Seed titles
+# --------------------------------------------------------------------------- #
+
+def test_readme_title_prompt_takes_the_fast_path(extract):
+    # Regression: "in" used to end the title at "Ghost" with confidence 0.5.
+    result = extract("Give me something like Ghost in the Shell")
+    assert result.params.like_animes == "Ghost in the Shell"
+    assert result.confidence >= FAST_PATH_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize("text, titles", [
+    ("anime like Made in Abyss but darker", "Made in Abyss"),
+    ("like Tales from the Earthsea", "Tales from the Earthsea"),
+    ("like Attack on Titan from 2013", "Attack on Titan"),
+    ("like Naruto released in Spring 2020", "Naruto"),
+    ("like Naruto. In Spring", "Naruto"),
+    ("like ghost in the shell", "ghost"),
+    ("similar to Naruto, Bleach or One Piece", "Naruto, Bleach, One Piece"),
+])
+def test_title_spans(extract, text, titles):
+    assert extract(text).params.like_animes == titles
+
+
+def test_capitalised_genre_after_a_stop_word_is_a_filter(extract):
+    params = extract("shows like Frieren with Romance").params
+    assert (params.like_animes, params.genres) == ("Frieren", ["Romance"])
+
+
+def test_like_as_a_verb_is_not_a_seed(extract):
+    assert extract("I like Isekai").params.like_animes is None
+
+
+def test_title_years_are_not_filters(extract):
+    params = extract("like Blade Runner 2049 but anime").params
+    assert (params.like_animes, params.year) == ("Blade Runner 2049", None)
+
+# --------------------------------------------------------------------------- #
+#  Vocabulary and time
+# --------------------------------------------------------------------------- #
+
+def test_genres_and_tags(extract):
+    result = extract("I want an isekai anime with some comedy")
+    assert (result.params.genres, result.params.tags) == (["Comedy"], ["Isekai"])
+    assert result.confidence == 1.0
+
+
+@pytest.mark.parametrize("text, season, year", [
+    ("anime from this season", "SPRING", 2024),
+    ("fall 2023 anime", "FALL", 2023),
+    ("a mecha from last year", None, 2023),
+    ("a dark fantasy from 2020", None, 2020),
+])
+def test_temporal_filters(extract, text, season, year):
+    params = extract(text).params
+    assert (params.season, params.year) == (season, year)
+
+
+def test_december_is_next_years_winter():
+    result = get_filter_extractor().extract("anime from this season", today=datetime.date(2024, 12, 2))
+    assert (result.params.season, result.params.year) == ("WINTER", 2025)
+
+
+def test_sort_words(extract):
+    assert extract("most popular mecha").params.sort == "POPULARITY_DESC"
+
+# --------------------------------------------------------------------------- #
+#  Confidence
+# --------------------------------------------------------------------------- #
+
+def test_unexplained_words_lower_confidence(extract):
+    result = extract("A volleyball anime with good character development")
+    assert result.params.tags == ["Volleyball"]
+    assert result.unmatched == ["character", "development"]
+    assert result.confidence < FAST_PATH_MIN_CONFIDENCE
+
+
+def test_negation_is_penalised(extract):
+    assert extract("romance anime without harem").confidence < extract("romance anime with harem").confidence
+
+
+def test_nothing_found_has_zero_confidence(extract):
+    result = extract("surprise me")
+    assert result.confidence == 0.0
+    assert result.params.model_dump(exclude_none=True) == {}
+
+
+def test_custom_vocabulary():
+    extractor = FilterExtractor(["Action"], ["Giant Robots"], synonyms={"mecha": (("tag", "Giant Robots"),)})
+    params = extractor.extract("action mecha", today=TODAY).params
+    assert (params.genres, params.tags) == (["Action"], ["Giant Robots"])
@@ -0,0 +1,121 @@
+import asyncio
+import email.utils
+import time
+
+import httpx
+import pytest
+
+from src import http_client
+from src.rate_limiter import RateLimiter, _MemoryBucket
+
+OK = {"data": {"Page": {"media": []}}}
+
+
+@pytest.fixture
+def anilist(monkeypatch):
+    """Serve AniList from a list of responses; return (requests seen, sleeps, limiter)."""
+    replies, seen, sleeps = [], [], []
+    limiter = RateLimiter(_MemoryBucket(rate_per_s=1000, capacity=100))
+
+    def handler(request):
+        seen.append(request)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(http_client, "_sync_client", httpx.Client(transport=transport))
+    monkeypatch.setattr(http_client, "get_async_client", lambda: httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(http_client, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    return replies, seen, sleeps, limiter
+
+
+def test_retry_after_seconds_and_http_date():
+    assert http_client._retry_after_s(httpx.Response(429, headers={"Retry-After": "7"})) == 7.0
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= http_client._retry_after_s(httpx.Response(429, headers={"Retry-After": date})) <= 30
+    assert http_client._retry_after_s(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    assert http_client._retry_after_s(httpx.Response(503)) is None
+
+
+def test_backoff_honours_retry_after_and_gives_up(monkeypatch):
+    monkeypatch.setattr(http_client, "_RETRIES", 2)
+    wait = http_client._backoff_s(0, httpx.Response(429, headers={"Retry-After": "3"}))
+    assert 3 <= wait <= 3 + http_client._BACKOFF_BASE_S
+    assert http_client._backoff_s(0, httpx.Response(429, headers={"Retry-After": "3600"})) is None
+    assert 0 <= http_client._backoff_s(1, None) <= 2 * http_client._BACKOFF_BASE_S
+    assert http_client._backoff_s(2, None) is None
+
+
+def test_server_errors_are_retried(anilist):
+    replies, seen, sleeps, _ = anilist
+    replies += [httpx.Response(503), httpx.ConnectError("reset"), httpx.Response(200, json=OK)]
+    assert http_client.post_graphql("query", {"page": 1}) == OK
+    assert len(seen) == 3
+    assert len(sleeps) == 2
+
+
+def test_429_throttles_every_worker(anilist):
+    replies, seen, sleeps, limiter = anilist
+    replies += [httpx.Response(429, headers={"Retry-After": "0.05"}), httpx.Response(200, json=OK)]
+    assert http_client.post_graphql("query", {}) == OK
+    assert limiter.stats()["throttle_events"] == 1
+    # The drained bucket does the waiting; the sleep only de-synchronises.
+    assert sleeps[0] <= http_client._BACKOFF_BASE_S
+
+
+def test_gives_up_after_the_retry_budget(anilist, monkeypatch):
+    monkeypatch.setattr(http_client, "_RETRIES", 1)
+    replies, seen, _, _ = anilist
+    replies += [httpx.Response(502), httpx.Response(502)]
+    with pytest.raises(RuntimeError, match="HTTP 502"):
+        http_client.post_graphql("query", {})
+    assert len(seen) == 2
+
+
+def test_client_errors_and_graphql_errors_are_not_retried(anilist):
+    replies, seen, sleeps, _ = anilist
+    replies += [httpx.Response(400, text="bad"), httpx.Response(200, json={"errors": [{"message": "x"}]})]
+    with pytest.raises(RuntimeError, match="HTTP 400"):
+        http_client.post_graphql("query", {})
+    assert http_client.post_graphql("query", {}, raise_on_errors=False) == {"errors": [{"message": "x"}]}
+    assert (len(seen), sleeps) == (2, [])
+
+
+def test_async_path_retries_and_throttles(anilist, monkeypatch):
+    monkeypatch.setattr(http_client, "_BACKOFF_BASE_S", 0.001)
+    replies, seen, _, limiter = anilist
+    replies += [
+        httpx.Response(429, headers={"Retry-After": "0.05"}),
+        httpx.Response(500),
+        httpx.Response(200, json=OK),
+    ]
+    assert asyncio.run(http_client.apost_graphql("query", {})) == OK
+    assert len(seen) == 3
+    assert limiter.stats()["throttle_events"] == 1
+
+
+def test_async_openai_client_is_pooled_per_loop():
+    async def clients():
+        first = http_client.get_openai_async_http_client()
+        assert http_client.get_openai_async_http_client() is first
+        await http_client.aclose()
+        assert first.is_closed
+        return first
+
+    assert asyncio.run(clients()) is not asyncio.run(clients())
+
+
+def test_analyzer_async_client_uses_the_pool(monkeypatch):
+    from src import analyzer
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def main():
+        client = analyzer.get_async_client()
+        assert analyzer.get_async_client() is client
+        return client._client is http_client.get_openai_async_http_client()
+
+    assert asyncio.run(main())
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from src.pagination import aiter_media, iter_media
+
+request_tag = contextvars.ContextVar("request_tag", default=None)
+
+
+def catalogue(total, per_page=3, page_info=True):
+    """A page fetcher over media ids 1..*total*, recording the pages asked for."""
+    requested = []
+
+    def fetch(variables):
+        page, size = variables["page"], variables.get("perPage", per_page)
+        requested.append((page, request_tag.get()))
+        ids = range((page - 1) * size + 1, min(page * size, total) + 1)
+        result = {"media": [{"id": i} for i in ids]}
+        if page_info:
+            result["pageInfo"] = {"hasNextPage": page * size < total}
+        return result
+
+    return fetch, requested
+
+
+def ids(media):
+    return [m["id"] for m in media]
+
+# --------------------------------------------------------------------------- #
+#  Sync
+# --------------------------------------------------------------------------- #
+
+def test_walks_every_page():
+    fetch, requested = catalogue(7)
+    assert ids(iter_media(fetch, {"perPage": 3})) == list(range(1, 8))
+    assert [page for page, _ in requested] == [1, 2, 3]
+
+
+def test_stops_at_the_limit_without_fetching_past_it():
+    fetch, requested = catalogue(20)
+    assert ids(iter_media(fetch, {"perPage": 3}, limit=6)) == list(range(1, 7))
+    assert [page for page, _ in requested] == [1, 2]
+
+
+def test_starts_at_the_requested_page_and_honours_max_pages():
+    fetch, requested = catalogue(30)
+    assert ids(iter_media(fetch, {"perPage": 3, "page": 2}, max_pages=2)) == list(range(4, 10))
+    assert [page for page, _ in requested] == [2, 3]
+
+
+def test_media_seen_on_an_earlier_page_are_skipped():
+    pages = {
+        1: {"media": [{"id": 1}, {"id": 2}], "pageInfo": {"hasNextPage": True}},
+        2: {"media": [{"id": 2}, {"id": 3}], "pageInfo": {"hasNextPage": False}},
+    }
+    assert ids(iter_media(lambda v: pages[v["page"]], {"perPage": 2})) == [1, 2, 3]
+
+
+def test_short_page_without_page_info_is_the_last():
+    fetch, requested = catalogue(5, page_info=False)
+    assert ids(iter_media(fetch, {"perPage": 3})) == [1, 2, 3, 4, 5]
+    assert [page for page, _ in requested] == [1, 2]
+
+
+def test_non_positive_limit_fetches_nothing():
+    fetch, requested = catalogue(5)
+    assert list(iter_media(fetch, {}, limit=0)) == []
+    assert requested == []
+
+
+def test_next_page_is_fetched_while_the_caller_consumes():
+    asked_for_page_2 = threading.Event()
+    fetch, _ = catalogue(6)
+
+    def watched(variables):
+        if variables["page"] == 2:
+            asked_for_page_2.set()
+        return fetch(variables)
+
+    media = iter_media(watched, {"perPage": 3})
+    assert next(media)["id"] == 1
+    assert asked_for_page_2.wait(1)
+    media.close()
+
+
+def test_prefetch_runs_in_the_callers_context():
+    fetch, requested = catalogue(6)
+    token = request_tag.set("req-1")
+    try:
+        list(iter_media(fetch, {"perPage": 3}))
+    finally:
+        request_tag.reset(token)
+    assert requested == [(1, "req-1"), (2, "req-1")]
+
+# --------------------------------------------------------------------------- #
+#  Async
+# --------------------------------------------------------------------------- #
+
+def test_async_walk_matches_sync():
+    fetch, requested = catalogue(20)
+
+    async def afetch(variables):
+        await asyncio.sleep(0)
+        return fetch(variables)
+
+    async def main():
+        return [m async for m in aiter_media(afetch, {"perPage": 3}, limit=7)]
+
+    assert ids(asyncio.run(main())) == list(range(1, 8))
+    assert [page for page, _ in requested] == [1, 2, 3]
+
+
+def test_closing_the_async_walk_cancels_the_prefetch():
+    cancelled = []
+
+    async def afetch(variables):
+        if variables["page"] > 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(variables["page"])
+                raise
+        return {"media": [{"id": 1}, {"id": 2}], "pageInfo": {"hasNextPage": True}}
+
+    async def main():
+        media = aiter_media(afetch, {"perPage": 2})
+        first = await media.__anext__()
+        await asyncio.sleep(0)
+        await media.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(main())["id"] == 1
+    assert cancelled == [2]
+
+
+def test_fetch_errors_reach_the_caller():
+    def fetch(variables):
+        raise RuntimeError("AniList is down")
+
+    with pytest.raises(RuntimeError, match="down"):
+        list(iter_media(fetch, {}))
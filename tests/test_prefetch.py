@@ -0,0 +1,138 @@
+import datetime
+import time
+
+import pytest
+
+from src import prefetch
+from src.prefetch import Prefetcher, QueryLog
+from src.rate_limiter import Priority, _current_priority
+from src.request_parser import OFFICIAL_GENRES
+
+TODAY = datetime.date(2024, 5, 10)
+QUERY = "query"
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.depth = {}
+
+    def stats(self):
+        return {"queue_depth": self.depth}
+
+
+@pytest.fixture
+def cycle(monkeypatch):
+    """Stub out AniList, the cache and the limiter; return their shared state."""
+    state = {"ttl": {}, "local": set(), "fail": set(), "refreshed": [], "limiter": FakeLimiter()}
+
+    def key(variables):
+        return tuple(sorted((k, str(v)) for k, v in variables.items()))
+
+    def refresh(fetch, query, variables):
+        state["refreshed"].append((variables, _current_priority.get()))
+        if key(variables) in state["fail"]:
+            raise RuntimeError("AniList is down")
+
+    monkeypatch.setattr(prefetch, "_PACE_S", 0)
+    monkeypatch.setattr(prefetch, "refresh_query", refresh)
+    monkeypatch.setattr(prefetch, "remaining_ttl", lambda query, variables: state["ttl"].get(key(variables)))
+    monkeypatch.setattr(prefetch, "search_local", lambda variables: [] if key(variables) in state["local"] else None)
+    monkeypatch.setattr(prefetch, "get_rate_limiter", lambda: state["limiter"])
+    state["key"] = key
+    return state
+
+# --------------------------------------------------------------------------- #
+#  Recent searches
+# --------------------------------------------------------------------------- #
+
+def test_query_log_ranks_by_frequency_then_recency():
+    log = QueryLog()
+    for n in (1, 2, 2, 3, 1, 2):
+        log.record(QUERY, {"n": n})
+    assert log.most_common(3) == [{"n": 2}, {"n": 1}, {"n": 3}]
+
+    log.record(QUERY, {"n": 3})
+    log.record(QUERY, {"n": 3})
+    assert log.most_common(2) == [{"n": 3}, {"n": 2}]
+
+
+def test_query_log_forgets_searches_outside_the_window():
+    log = QueryLog(window=2)
+    for n in (1, 1, 2, 3):
+        log.record(QUERY, {"n": n})
+    assert log.most_common(5) == [{"n": 3}, {"n": 2}]
+
+# --------------------------------------------------------------------------- #
+#  Targets and cycles
+# --------------------------------------------------------------------------- #
+
+def test_targets_are_seasons_then_frequent_searches_then_genres():
+    log = QueryLog()
+    searches = [Prefetcher._tool_variables(search_term="Frieren"), Prefetcher._tool_variables(genres=["Action"])]
+    for variables in (searches[0], searches[0], searches[1]):
+        log.record(Prefetcher._query(), variables)
+    targets = Prefetcher(log=log).targets(TODAY)
+
+    assert [(t.get("season"), t.get("seasonYear")) for t in targets[:2]] == [("SPRING", 2024), ("WINTER", 2024)]
+    assert targets[2]["search"] == "Frieren"
+    assert targets[3] == searches[1]
+    # The frequent "Action" search isn't repeated among the genres.
+    assert [t["genres"] for t in targets[4:]] == [[g] for g in OFFICIAL_GENRES if g != "Action"]
+
+
+def test_cycle_skips_fresh_and_local_targets(cycle):
+    prefetcher = Prefetcher(budget=100, refresh_ahead_s=60, log=QueryLog())
+    targets = prefetcher.targets(TODAY)
+    cycle["ttl"][cycle["key"](targets[0])] = 3600
+    cycle["ttl"][cycle["key"](targets[1])] = 30
+    cycle["local"].add(cycle["key"](targets[2]))
+
+    result = prefetcher.run_once(TODAY)
+
+    assert result == {"refreshed": len(targets) - 2, "fresh": 1, "local": 1, "deferred": 0, "failed": 0}
+    assert cycle["refreshed"][0][0] == targets[1]
+    assert {priority for _, priority in cycle["refreshed"]} == {Priority.BACKGROUND}
+
+
+def test_cycle_respects_its_budget_and_counts_failures(cycle):
+    prefetcher = Prefetcher(budget=3, log=QueryLog())
+    targets = prefetcher.targets(TODAY)
+    cycle["fail"].add(cycle["key"](targets[0]))
+
+    result = prefetcher.run_once(TODAY)
+
+    assert result == {"refreshed": 2, "fresh": 0, "local": 0, "deferred": len(targets) - 3, "failed": 1}
+    assert prefetcher.stats()["cycles"] == 1
+
+
+def test_cycle_yields_to_waiting_requests(cycle):
+    cycle["limiter"].depth = {Priority.BACKGROUND.name: 2, Priority.INTERACTIVE.name: 1}
+    result = Prefetcher(budget=100, log=QueryLog()).run_once(TODAY)
+    assert result["refreshed"] == 0
+    assert cycle["refreshed"] == []
+
+    cycle["limiter"].depth = {Priority.BACKGROUND.name: 2}
+    assert Prefetcher(budget=1, log=QueryLog()).run_once(TODAY)["refreshed"] == 1
+
+# --------------------------------------------------------------------------- #
+#  Background thread
+# --------------------------------------------------------------------------- #
+
+def test_start_runs_cycles_until_stopped(cycle, monkeypatch):
+    monkeypatch.setattr(prefetch, "_CACHE_DISABLED", False)
+    prefetcher = Prefetcher(interval_s=60, budget=1, log=QueryLog())
+    prefetcher.start()
+    try:
+        deadline = time.monotonic() + 2
+        while prefetcher.stats()["cycles"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert prefetcher.stats()["running"]
+    finally:
+        prefetcher.stop()
+    stats = prefetcher.stats()
+    assert (stats["cycles"], stats["refreshed"], stats["running"]) == (1, 1, False)
+
+
+def test_prefetcher_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(prefetch, "_ENABLED", False)
+    assert prefetch.start_prefetcher() is False
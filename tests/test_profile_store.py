@@ -0,0 +1,57 @@
+from src import profile_store
+from src.profile_store import ProfileStore
+
+
+def test_hits_persist_across_store_instances(tmp_path):
+    path = str(tmp_path / "profiles.sqlite3")
+    store = ProfileStore(path)
+    store.put(1, "fp", ["Action"], ["Isekai"])
+    assert store.get(1, "fp") == (["Action"], ["Isekai"])
+    assert store.get(2, "fp") is None
+    store.close()
+
+    # A new process (here: a new instance) starts its own counters at zero
+    # but still sees the lifetime totals.
+    stats = ProfileStore(path).stats()
+    assert stats["hits"] == 0
+    assert stats["lifetime"] == {"hits": 1, "misses": 1, "stored": 1, "expired": 0}
+    assert stats["llm_calls_saved"] == 1
+
+
+def test_expired_entries_count_as_misses(tmp_path):
+    store = ProfileStore(str(tmp_path / "profiles.sqlite3"), max_age_s=1e-9)
+    store.put(1, "fp", ["Action"], ["Isekai"])
+    assert store.get(1, "fp") is None
+    assert store.stats()["lifetime"]["expired"] == 1
+
+
+def test_metrics_text_exports_process_counters(tmp_path):
+    store = ProfileStore(str(tmp_path / "profiles.sqlite3"))
+    store.put(1, "fp", ["Action"], ["Isekai"])
+    store.get(1, "fp")
+    text = store.metrics_text()
+    assert 'osusume_profile_store_lookups_total{result="hit"} 1' in text
+    assert "osusume_profile_store_llm_calls_saved_total 1" in text
+
+
+def test_lookups_do_not_write_until_flushed(tmp_path):
+    path = str(tmp_path / "profiles.sqlite3")
+    store = ProfileStore(path)
+    store.put(1, "fp", ["Action"], ["Isekai"])
+    writes = store._db.total_changes
+    for _ in range(10):
+        store.get(1, "fp")
+    assert store._db.total_changes == writes
+    assert ProfileStore(path).stats()["lifetime"]["hits"] == 0
+
+    store.flush()
+    assert ProfileStore(path).stats()["lifetime"] == {"hits": 10, "misses": 0, "stored": 1, "expired": 0}
+
+
+def test_counters_flush_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_store, "_COUNTER_FLUSH_EVERY", 5)
+    path = str(tmp_path / "profiles.sqlite3")
+    store = ProfileStore(path)
+    for _ in range(7):
+        store.get(1, "fp")
+    assert ProfileStore(path).stats()["lifetime"]["misses"] == 5
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from src.ranking import FEATURES, Ranker, RankingWeights
+from src.request_parser import AnimeSearchParams
+
+
+def anime(media_id, title, genres=(), tags=(), score=None, year=None, cover=True):
+    return {
+        "id": media_id,
+        "title": {"romaji": title, "english": title},
+        "genres": list(genres),
+        "tags": [
+            {"id": i, "name": name, "rank": rank, "isMediaSpoiler": spoiler}
+            for i, (name, rank, spoiler) in enumerate(tags)
+        ],
+        "averageScore": score,
+        "episodes": 12,
+        "format": "TV",
+        "status": "FINISHED",
+        "seasonYear": year,
+        "coverImage": {"medium": f"https://x.y/{media_id}.jpg" if cover else None},
+    }
+
+
+def test_weights_parse_overrides_defaults():
+    weights = RankingWeights.parse(" tags=1.5, diversity=0 ")
+    assert (weights.tags, weights.diversity, weights.genres) == (1.5, 0.0, 1.0)
+    assert weights.vector()[FEATURES.index("spoiler")] == -weights.spoiler
+    assert RankingWeights.parse("") == RankingWeights()
+    with pytest.raises(ValueError):
+        RankingWeights.parse("colour=1")
+
+
+def test_features():
+    candidates = [
+        anime(1, "A", ["Action"], [("Isekai", 80, False)], score=90, year=2020),
+        anime(2, "B", ["Action", "Comedy"], [("Isekai", 60, True)], score=None, year=2017),
+        anime(3, "C", ["Drama"], score=70),
+    ]
+    params = AnimeSearchParams(genres=["Action", "Comedy"], tags=["Isekai"], year=2020)
+    f = Ranker().features(candidates, params)
+    col = {name: f[:, i] for i, name in enumerate(FEATURES)}
+    np.testing.assert_allclose(col["tags"], [0.8, 0.0, 0.0])
+    np.testing.assert_allclose(col["spoiler"], [0.0, 0.6, 0.0])
+    np.testing.assert_allclose(col["genres"], [0.5, 1.0, 0.0])
+    # Unscored titles get the pool's mean score.
+    np.testing.assert_allclose(col["score"], [0.9, 0.8, 0.7])
+    np.testing.assert_allclose(col["recency"], [1.0, np.exp(-1.0), 0.0], rtol=1e-6)
+
+
+def test_rank_skips_missing_covers_and_repeated_titles():
+    candidates = [
+        anime(1, "A", ["Action"], score=90, cover=False),
+        anime(2, "B", ["Action"], score=80),
+        anime(3, "B", ["Action"], score=85),
+        anime(4, "C", ["Action"], score=70),
+    ]
+    picks = Ranker().rank(candidates, AnimeSearchParams(genres=["Action"]), k=5)
+    assert [m["id"] for m in picks] == [3, 4]
+
+
+def test_mmr_diversity_breaks_up_near_duplicates():
+    candidates = [
+        anime(1, "A1", ["Action"], [("Mecha", 90, False)], score=90),
+        anime(2, "A2", ["Action"], [("Mecha", 90, False)], score=89),
+        anime(3, "D", ["Drama"], [("Tragedy", 90, False)], score=80),
+    ]
+    params = AnimeSearchParams()
+    relevance_only = Ranker(RankingWeights(diversity=0)).rank(candidates, params, k=2)
+    diverse = Ranker(RankingWeights(diversity=0.6)).rank(candidates, params, k=2)
+    assert [m["id"] for m in relevance_only] == [1, 2]
+    assert [m["id"] for m in diverse] == [1, 3]
+
+
+def test_rank_empty_inputs():
+    assert Ranker().rank([], AnimeSearchParams()) == []
+    assert Ranker().rank([anime(1, "A")], AnimeSearchParams(), k=0) == []
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src import rate_limiter
+from src.rate_limiter import Priority, RateLimiter, RateLimitTimeout, _MemoryBucket, _SqliteBucket
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = _MemoryBucket(rate_per_s=20, capacity=2)
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.0
+    assert bucket.take() == pytest.approx(0.05, abs=0.01)
+    time.sleep(0.06)
+    assert bucket.take() == 0.0
+
+
+def test_drain_pauses_refills():
+    bucket = _MemoryBucket(rate_per_s=1000, capacity=5)
+    bucket.drain(0.2)
+    assert bucket.take() == pytest.approx(0.2, abs=0.02)
+
+
+def test_sqlite_buckets_share_one_budget(tmp_path):
+    path = str(tmp_path / "ratelimit.sqlite3")
+    a = _SqliteBucket(0.001, 3, path)
+    b = _SqliteBucket(0.001, 3, path)
+    assert [a.take(), b.take(), a.take()] == [0.0, 0.0, 0.0]
+    assert b.take() > 0
+    # A 429 seen by one process holds back the other.
+    c = _SqliteBucket(1000, 3, str(tmp_path / "other.sqlite3"))
+    d = _SqliteBucket(1000, 3, str(tmp_path / "other.sqlite3"))
+    c.drain(0.5)
+    assert d.take() == pytest.approx(0.5, abs=0.05)
+
+
+def test_higher_priority_is_served_first():
+    bucket = _MemoryBucket(rate_per_s=50, capacity=1)
+    bucket.drain(0.05)
+    limiter = RateLimiter(bucket)
+    order = []
+
+    def acquire(priority):
+        limiter.acquire(priority)
+        order.append(priority)
+
+    background = threading.Thread(target=acquire, args=(Priority.BACKGROUND,))
+    background.start()
+    time.sleep(0.01)
+    interactive = threading.Thread(target=acquire, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+
+    assert order == [Priority.INTERACTIVE, Priority.BACKGROUND]
+    assert limiter.stats()["acquired"] == {"INTERACTIVE": 1, "TASTE_PROFILE": 0, "BACKGROUND": 1}
+
+
+def test_waiting_too_long_raises(monkeypatch):
+    monkeypatch.setitem(rate_limiter._MAX_WAIT_S, Priority.INTERACTIVE, 0.05)
+    bucket = _MemoryBucket(rate_per_s=20, capacity=1)
+    bucket.drain(0.2)
+    limiter = RateLimiter(bucket)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(Priority.INTERACTIVE)
+    assert limiter.stats()["timeouts"]["INTERACTIVE"] == 1
+    assert limiter.stats()["queue_depth"]["INTERACTIVE"] == 0
+
+
+def test_aacquire_keeps_blocking_buckets_off_the_event_loop():
+    class SlowBucket(_MemoryBucket):
+        blocking = True
+
+        def take(self):
+            threads.append(threading.get_ident())
+            time.sleep(0.01)
+            return super().take()
+
+    threads = []
+    limiter = RateLimiter(SlowBucket(rate_per_s=1000, capacity=5))
+
+    async def main():
+        loop_thread = threading.get_ident()
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.005)
+
+        await asyncio.gather(limiter.aacquire(), limiter.aacquire(), ticker())
+        return loop_thread, ticks
+
+    loop_thread, ticks = asyncio.run(main())
+    assert threads and loop_thread not in threads
+    assert len(ticks) == 5
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from src import recommender
+from src.recommender import SearchAnimeTool, SearchAnimeToolInput
+
+
+def seed(title, delay):
+    return {"title": {"english": title}, "delay": delay}
+
+
+def lookup(media):
+    time.sleep(media["delay"])
+    return media["title"]["english"]
+
+
+def test_map_seeds_keeps_order_and_skips_failures():
+    def flaky(media):
+        if media["title"]["english"] == "B":
+            raise RuntimeError("boom")
+        return None if media["title"]["english"] == "C" else lookup(media)
+
+    seeds = [seed(t, 0.0) for t in "ABCD"]
+    assert SearchAnimeTool._map_seeds(seeds, flaky) == ["A", "D"]
+
+
+def test_map_seeds_times_out_each_seed_from_its_own_start(monkeypatch):
+    monkeypatch.setattr(recommender, "_TASTE_PROFILE_WORKERS", 2)
+    monkeypatch.setattr(recommender, "_TASTE_PROFILE_TIMEOUT_S", 0.2)
+    # "slow" would still beat a shared ceil(3 / 2) * 0.2 s deadline.
+    seeds = [seed("fast", 0.01), seed("slow", 0.3), seed("queued", 0.15)]
+    assert SearchAnimeTool._map_seeds(seeds, lookup) == ["fast", "queued"]
+
+
+def test_map_seeds_gives_queued_seeds_a_full_timeout(monkeypatch):
+    monkeypatch.setattr(recommender, "_TASTE_PROFILE_WORKERS", 1)
+    monkeypatch.setattr(recommender, "_TASTE_PROFILE_TIMEOUT_S", 0.2)
+    seeds = [seed(t, 0.12) for t in "ABC"]
+    assert SearchAnimeTool._map_seeds(seeds, lookup) == ["A", "B", "C"]
+
+
+def test_snap_keeps_the_single_genre_required():
+    params, changed = SearchAnimeTool._snap(SearchAnimeToolInput(genre="Actoin", genres=["Dram"], tags=["Cats"]))
+    assert changed
+    assert (params.genre, params.genres, params.tags) == ("Action", None, None)
+
+    params, changed = SearchAnimeTool._snap(SearchAnimeToolInput(genre="Action", genres=["Comedy"]))
+    assert not changed
+    assert (params.genre, params.genres) == ("Action", ["Comedy"])
+
+    params, _ = SearchAnimeTool._snap(SearchAnimeToolInput(genre="romcom", tags=["Isekai"]))
+    assert (params.genre, params.genres, params.tags) == ("Romance", ["Comedy"], ["Isekai"])
+
+
+def test_amap_seeds_skips_cancelled_lookups():
+    async def alookup(media):
+        if media["title"]["english"] == "B":
+            raise asyncio.CancelledError()
+        return media["title"]["english"], []
+
+    seeds = [seed(t, 0.0) for t in "ABC"]
+    assert asyncio.run(SearchAnimeTool._amap_seeds(seeds, alookup)) == [("A", []), ("C", [])]
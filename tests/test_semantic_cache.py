@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from src import semantic_cache
+from src.semantic_cache import SemanticCache, embed, fingerprint
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable stand-in for ``time.time`` inside the cache."""
+    now = [1_000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    return now
+
+# --------------------------------------------------------------------------- #
+#  Fingerprints
+# --------------------------------------------------------------------------- #
+
+def test_confident_paraphrases_share_a_fingerprint():
+    assert fingerprint("funny isekai") == fingerprint("comedy isekai anime") == fingerprint("isekai with comedy")
+
+
+def test_loose_requests_keep_numbers_and_negations_in_the_guard():
+    text, guard = fingerprint("something dark and slow without romance")
+    assert text == "dark slow without romance"
+    assert guard == "text:|romance"
+
+
+def test_embedding_is_unit_length():
+    assert np.isclose(np.linalg.norm(embed("dark slow without romance")), 1.0)
+    assert not embed("").any()
+
+# --------------------------------------------------------------------------- #
+#  Lookups
+# --------------------------------------------------------------------------- #
+
+def test_paraphrases_hit():
+    cache = SemanticCache()
+    cache.set("funny isekai", ["Konosuba"])
+    assert cache.get("comedy isekai anime") == ["Konosuba"]
+
+    cache.set("something dark and slow without romance", ["Mushishi"])
+    assert cache.get("something slow and dark without romance") == ["Mushishi"]
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("funny isekai from 2020", "funny isekai from 2021"),
+    ("something dark and slow without romance", "something dark and slow without gore"),
+    ("something dark and slow without romance", "something dark and slow with romance"),
+])
+def test_guard_must_match(stored, asked):
+    cache = SemanticCache()
+    cache.set(stored, "stored")
+    assert cache.get(asked) is None
+
+
+def test_entries_expire(clock):
+    cache = SemanticCache(ttl_s=10)
+    cache.set("funny isekai", 1)
+    cache.set("mecha", 2, ttl_s=100)
+    clock[0] += 11
+    assert cache.get("funny isekai") is None
+    assert cache.get("mecha") == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.set("funny isekai", 1)
+    cache.set("mecha", 2)
+    assert cache.get("funny isekai") == 1
+    cache.set("sports anime", 3)
+    assert cache.get("mecha") is None
+    assert (cache.get("funny isekai"), cache.get("sports anime")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_set_replaces_the_same_request():
+    cache = SemanticCache(max_entries=1)
+    cache.set("funny isekai", 1)
+    cache.set("comedy isekai", 2)
+    assert cache.get("funny isekai") == 2
+    assert cache.stats()["evictions"] == 0
+
+
+def test_stats_and_clear():
+    cache = SemanticCache()
+    cache.set("funny isekai", 1)
+    cache.get("comedy isekai")
+    cache.get("something dark and slow without romance")
+    stats = cache.stats()
+    assert (stats["hits"], stats["exact_hits"], stats["misses"], stats["entries"]) == (1, 1, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+    assert stats["hit_similarity_mean"] == 1.0
+
+    cache.clear()
+    assert cache.get("funny isekai") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_shared_cache_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(semantic_cache, "_DISABLED", True)
+    assert semantic_cache.get_result_cache() is None
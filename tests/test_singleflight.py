@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.singleflight import SingleFlight, flight_stats
+
+
+def test_do_shares_one_call_between_threads():
+    group = SingleFlight("test-do")
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {"n": len(calls)}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(group.do("k", fn))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while group.stats()["calls"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == [{"n": 1}] * 4
+    assert flight_stats()["test-do"]["coalescing_ratio"] == 0.75
+
+
+def test_do_shares_errors_and_forgets_finished_calls():
+    group = SingleFlight("test-errors")
+    with pytest.raises(ValueError):
+        group.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert group.do("k", lambda: 2) == 2
+
+
+def test_ado_coalesces_within_a_loop():
+    group = SingleFlight("test-ado")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "page"
+
+    async def main():
+        return await asyncio.gather(*(group.ado("k", fetch) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["page"] * 3
+    assert calls == [1]
+
+
+def test_cancelled_leader_hands_the_call_to_a_follower():
+    group = SingleFlight("test-cancel")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "page"
+
+    async def main():
+        leader = asyncio.ensure_future(asyncio.wait_for(group.ado("k", fetch), 0.01))
+        await asyncio.sleep(0)
+        followers = asyncio.gather(*(group.ado("k", fetch) for _ in range(2)))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        return await followers
+
+    assert asyncio.run(main()) == ["page", "page"]
+    # The leader's call plus one re-run shared by both followers.
+    assert calls == [1, 1]
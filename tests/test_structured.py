@@ -0,0 +1,161 @@
+import types
+
+import pytest
+
+from service import RecommendationItem
+from src import structured, tracing
+from src.request_parser import AnimeSearchParams
+from src.structured import StructuredOutputError, extract_json, parse_list, parse_object
+
+ITEM = '{"title": "A", "description": "d", "image_url": "https://x.y/a.jpg"}'
+
+
+@pytest.fixture
+def outcomes():
+    """Parse outcomes recorded during the test, as {(stage, outcome): n}."""
+    tracing.reset_metrics()
+    yield lambda: dict(tracing._registry._parses)
+    tracing.reset_metrics()
+
+# --------------------------------------------------------------------------- #
+#  Extraction
+# --------------------------------------------------------------------------- #
+
+def test_clean_json_is_flagged_clean():
+    assert extract_json(f"[{ITEM}]", list) == ([{"title": "A", "description": "d", "image_url": "https://x.y/a.jpg"}], True)
+
+
+def test_fenced_block_wins_over_prose():
+    value, clean = extract_json('Sure, here [is] one:\n```json\n[{"a": "x]"}]\n```\nDone.', list)
+    assert value == [{"a": "x]"}]
+    assert not clean
+
+
+def test_python_literals_and_trailing_commas():
+    assert extract_json("Tags: ['Isekai', 'Comedy', None] ok", list)[0] == ["Isekai", "Comedy", None]
+    assert extract_json('{"a": [1, 2,]}', dict)[0] == {"a": [1, 2]}
+
+
+def test_unbalanced_and_empty_output_raise():
+    with pytest.raises(StructuredOutputError):
+        extract_json('[{"a": 1}', list)
+    with pytest.raises(StructuredOutputError):
+        extract_json("   ", list)
+
+# --------------------------------------------------------------------------- #
+#  parse_list
+# --------------------------------------------------------------------------- #
+
+def test_prose_with_brackets_before_records(outcomes):
+    # Regression: "[5]" used to be taken as the answer and fail validation.
+    items = parse_list(f"My top [5] picks:\n[{ITEM}]", RecommendationItem, stage="researcher")
+    assert [i.title for i in items] == ["A"]
+    assert outcomes() == {("researcher", "extracted"): 1}
+
+
+def test_parse_outcomes_are_counted_without_tracing(outcomes):
+    was_enabled = tracing.is_enabled()
+    tracing.disable()
+    try:
+        parse_list(f"[{ITEM}]", RecommendationItem, stage="researcher")
+    finally:
+        if was_enabled:
+            tracing.enable()
+    assert outcomes() == {("researcher", "clean"): 1}
+    assert 'osusume_parse_outcomes_total{stage="researcher",outcome="clean"} 1' in tracing.metrics_text()
+
+
+def test_prose_with_bracketed_words_and_apostrophes():
+    text = f"I'd say [these, they're great] fit — see [1] and [2]: [{ITEM}] [note]"
+    assert [i.title for i in parse_list(text, RecommendationItem, stage="researcher")] == ["A"]
+
+
+def test_broken_item_is_repaired_by_fixer(outcomes):
+    text = f'[{ITEM}, {{"title": "B", "description": "d", "image_url": "not a url"}}]'
+    seen = []
+
+    def fix(record, errors):
+        seen.append(set(errors))
+        return {"image_url": "https://x.y/b.jpg"}
+
+    items = parse_list(text, RecommendationItem, stage="researcher", repair=[fix])
+    assert [str(i.image_url) for i in items] == ["https://x.y/a.jpg", "https://x.y/b.jpg"]
+    # Only the broken field is handed to the fixer.
+    assert seen == [{"image_url"}]
+    assert outcomes() == {("researcher", "repaired"): 1}
+
+
+def test_unrepairable_item_is_dropped(outcomes):
+    items = parse_list(f'[{ITEM}, {{"title": "C"}}, "junk"]', RecommendationItem, stage="researcher")
+    assert [i.title for i in items] == ["A"]
+    assert outcomes() == {("researcher", "dropped"): 1}
+
+
+def test_empty_array_is_a_valid_answer():
+    assert parse_list("[]", RecommendationItem, stage="researcher") == []
+
+
+def test_no_valid_record_raises(outcomes):
+    with pytest.raises(StructuredOutputError):
+        parse_list('[{"title": "C"}]', RecommendationItem, stage="researcher")
+    with pytest.raises(StructuredOutputError):
+        parse_list("Sorry, nothing.", RecommendationItem, stage="researcher")
+    assert outcomes() == {("researcher", "failed"): 2}
+
+# --------------------------------------------------------------------------- #
+#  parse_object
+# --------------------------------------------------------------------------- #
+
+def test_unknown_keys_and_broken_optional_fields_are_dropped(outcomes):
+    params = parse_object(
+        'Filters {"note": 1}: {"genres": ["Action"], "season": "autumn", "bogus": 1}',
+        AnimeSearchParams, stage="mapper",
+    )
+    assert params.genres == ["Action"]
+    assert params.season is None
+    assert outcomes() == {("mapper", "dropped"): 1}
+
+
+def test_dict_input_is_clean(outcomes):
+    assert parse_object({"year": 2020}, AnimeSearchParams, stage="mapper").year == 2020
+    assert outcomes() == {("mapper", "clean"): 1}
+
+# --------------------------------------------------------------------------- #
+#  repair_fields
+# --------------------------------------------------------------------------- #
+
+def test_repair_fields_asks_only_for_broken_fields(monkeypatch):
+    import litellm
+
+    calls = []
+
+    def completion(**kwargs):
+        calls.append(kwargs)
+        content = '```json\n{"description": "Fixed.", "title": "ignored"}\n```'
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+            usage=None,
+        )
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    monkeypatch.setattr(structured, "_REPAIR", True)
+    fixed = structured.repair_fields(
+        {"title": "B", "description": None, "image_url": "https://x.y/b.jpg"},
+        {"description": "Input should be a valid string"},
+        RecommendationItem,
+        {"model": "gpt-4.1"},
+    )
+    assert fixed == {"description": "Fixed."}
+    schema = calls[0]["response_format"]["json_schema"]["schema"]
+    assert list(schema["properties"]) == ["description"]
+
+
+def test_repair_fields_swallows_call_failures(monkeypatch):
+    import litellm
+
+    def completion(**kwargs):
+        raise RuntimeError("offline")
+
+    monkeypatch.setattr(litellm, "completion", completion)
+    monkeypatch.setattr(structured, "_REPAIR", True)
+    assert structured.repair_fields({"title": None}, {"title": "missing"}, RecommendationItem, {}) == {}
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from src import tracing
+from src.tracing import current_span, record_span, span, trace_stats, traced
+
+
+@pytest.fixture
+def traces():
+    """Tracing turned on with empty metrics; yields :func:`trace_stats`."""
+    was_enabled = tracing.is_enabled()
+    tracing.enable()
+    tracing.reset_metrics()
+    yield trace_stats
+    tracing.reset_metrics()
+    if not was_enabled:
+        tracing.disable()
+
+
+@pytest.fixture
+def untraced():
+    was_enabled = tracing.is_enabled()
+    tracing.disable()
+    tracing.reset_metrics()
+    yield
+    if was_enabled:
+        tracing.enable()
+
+# --------------------------------------------------------------------------- #
+#  Disabled
+# --------------------------------------------------------------------------- #
+
+def test_disabled_tracing_records_nothing(untraced):
+    with span("stage") as s:
+        assert s is current_span() is tracing._NOOP
+        s.tokens(1, 2)
+        s.http_bytes(3, 4)
+        s.cache_hit(True)
+
+    @traced("decorated")
+    def work():
+        return current_span()
+
+    assert work() is tracing._NOOP
+    record_span("late", 0.0, 1.0)
+    assert trace_stats() == {}
+
+# --------------------------------------------------------------------------- #
+#  Spans
+# --------------------------------------------------------------------------- #
+
+def test_spans_nest_and_restore_the_parent(traces):
+    with span("request") as outer:
+        with span("anilist") as inner:
+            assert current_span() is inner
+            assert inner.parent is outer
+        assert current_span() is outer
+    assert current_span() is tracing._NOOP
+    assert set(traces()) == {"request", "anilist"}
+
+
+def test_span_attributes_reach_the_stats(traces):
+    with span("analyzer") as s:
+        s.tokens(100, 20)
+        s.tokens(None, 5)
+        s.http_bytes(10, 200)
+        s.cache_hit(False)
+    stats = traces()["analyzer"]
+    assert (stats["count"], stats["prompt_tokens"], stats["completion_tokens"]) == (1, 100, 25)
+    assert (stats["bytes_sent"], stats["bytes_received"]) == (10, 200)
+    assert (stats["cache_hits"], stats["cache_misses"]) == (0, 1)
+
+
+def test_errors_are_counted(traces):
+    with pytest.raises(ValueError):
+        with span("tool"):
+            raise ValueError("boom")
+    assert traces()["tool"]["errors"] == 1
+
+
+def test_traced_wraps_sync_and_async_functions(traces):
+    @traced("sync")
+    def sync_work():
+        return current_span().name
+
+    @traced("async")
+    async def async_work():
+        await asyncio.sleep(0)
+        return current_span().name
+
+    assert sync_work() == "sync"
+    assert asyncio.run(async_work()) == "async"
+    assert {name: s["count"] for name, s in traces().items()} == {"sync": 1, "async": 1}
+
+
+def test_spans_follow_asyncio_tasks(traces):
+    async def child(name):
+        with span(name) as s:
+            await asyncio.sleep(0)
+            return s.parent.name
+
+    async def main():
+        with span("request"):
+            return await asyncio.gather(child("a"), child("b"))
+
+    assert asyncio.run(main()) == ["request", "request"]
+
+
+def test_record_span_uses_the_given_times(traces):
+    with span("request"):
+        record_span("streamed", 10.0, 10.3)
+    assert traces()["streamed"]["total_s"] == pytest.approx(0.3)
+
+# --------------------------------------------------------------------------- #
+#  Prometheus text
+# --------------------------------------------------------------------------- #
+
+def test_metrics_text_histogram_and_counters(traces):
+    record_span("anilist", 0.0, 0.2)
+    record_span("anilist", 0.0, 3.0)
+    with span("anilist") as s:
+        s.cache_hit(True)
+    text = tracing.metrics_text()
+    assert "# TYPE osusume_stage_duration_seconds histogram" in text
+    assert 'osusume_stage_duration_seconds_bucket{stage="anilist",le="0.25"} 2' in text
+    assert 'osusume_stage_duration_seconds_bucket{stage="anilist",le="5"} 3' in text
+    assert 'osusume_stage_duration_seconds_bucket{stage="anilist",le="+Inf"} 3' in text
+    assert 'osusume_stage_duration_seconds_count{stage="anilist"} 3' in text
+    assert 'osusume_cache_lookups_total{stage="anilist",result="hit"} 1' in text
+
+
+def test_reset_clears_everything(traces):
+    with span("request"):
+        pass
+    tracing.record_parse("researcher", "clean")
+    tracing.reset_metrics()
+    assert traces() == {}
+    assert "researcher" not in tracing.metrics_text()
+
+# --------------------------------------------------------------------------- #
+#  OpenTelemetry bridge
+# --------------------------------------------------------------------------- #
+
+def test_otel_spans_mirror_the_tree(traces, monkeypatch):
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    # conftest disables the SDK globally; this provider is local to the test.
+    monkeypatch.delenv("OTEL_SDK_DISABLED", raising=False)
+    exporter = InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(tracing, "_otel_tracer", provider.get_tracer("test"))
+
+    with span("request", user="u1"):
+        with span("analyzer") as s:
+            s.tokens(7, 3)
+        with pytest.raises(RuntimeError):
+            with span("tool"):
+                raise RuntimeError("boom")
+
+    finished = {s.name: s for s in exporter.get_finished_spans()}
+    assert set(finished) == {"request", "analyzer", "tool"}
+    request = finished["request"]
+    assert finished["analyzer"].parent.span_id == request.context.span_id
+    assert request.attributes["user"] == "u1"
+    assert finished["analyzer"].attributes["llm.usage.prompt_tokens"] == 7
+    assert not finished["tool"].status.is_ok
@@ -0,0 +1,105 @@
+import pytest
+
+from src.filter_extractor import _variants
+from src.request_parser import AnimeSearchParams
+from src.vocabulary import VocabularyIndex, get_vocabulary
+
+
+@pytest.fixture
+def vocab():
+    return get_vocabulary()
+
+
+@pytest.mark.parametrize("name, expected, method", [
+    ("Isekai", [("tag", "Isekai")], "exact"),
+    ("Comedy", [("genre", "Comedy")], "exact"),
+    ("isekai", [("tag", "Isekai")], "alias"),
+    ("Time Skips", [("tag", "Time Skip")], "alias"),
+    ("sci fi", [("genre", "Sci-Fi")], "alias"),
+    ("romcom", [("genre", "Romance"), ("genre", "Comedy")], "alias"),
+    ("Isekaii", [("tag", "Isekai")], "fuzzy"),
+    ("Reincarnaton", [("tag", "Reincarnation")], "fuzzy"),
+    ("Slice of lfe", [("genre", "Slice of Life")], "fuzzy"),
+    ("Xyzzyq", [], "unknown"),
+    ("", [], "unknown"),
+])
+def test_lookup(vocab, name, expected, method):
+    targets, found_by = vocab.lookup(name)
+    assert (list(targets), found_by) == (expected, method)
+
+
+@pytest.mark.parametrize("word", [
+    # Ordinary words one edit away from a sexual-content tag.
+    "Cats", "Cape", "Grape", "Inest", "Incests", "Rapes",
+    # Short or ambiguous words.
+    "Bats", "Iseka", "Mecah", "Barr", "Works",
+])
+def test_fuzzy_matching_does_not_guess(vocab, word):
+    targets, method = vocab.lookup(word)
+    if method == "alias":
+        # Plain plurals of real names still resolve, but never fuzzily.
+        assert word.rstrip("s").casefold() == targets[0][1].casefold()
+    else:
+        assert (targets, method) == ((), "unknown")
+
+
+def test_adult_tags_still_match_exactly(vocab):
+    assert vocab.lookup("Scat") == ((("tag", "Scat"),), "exact")
+    assert vocab.lookup("scat") == ((("tag", "Scat"),), "alias")
+
+
+def test_fuzzy_similarity_holds_for_both_names():
+    index = VocabularyIndex([], ["Survival"], synonyms={})
+    assert index.lookup("Survivl")[1] == "fuzzy"
+    # Two edits are 80% of "survivalxx" but only 75% of "survival".
+    assert index.lookup("Survivalxx") == ((), "unknown")
+
+
+def test_snap_filters_regroups_and_drops(vocab):
+    snap = vocab.snap_filters(["Action", "Isekai"], ["Comedy", "Isekaii", "Xyzzyq", "time skip"])
+    assert snap.genres == ["Action", "Comedy"]
+    assert snap.tags == ["Isekai", "Time Skip"]
+    # A correct name under the wrong kind is a correction too.
+    assert snap.corrections == {
+        "Isekai": ["Isekai"], "Comedy": ["Comedy"], "Isekaii": ["Isekai"], "time skip": ["Time Skip"],
+    }
+    assert snap.dropped == ["Xyzzyq"]
+
+
+def test_snap_params(vocab):
+    clean = AnimeSearchParams(genres=["Action"], tags=["Isekai"])
+    assert vocab.snap_params(clean) is clean
+
+    snapped = vocab.snap_params(AnimeSearchParams(genres=["Actoin"], tags=["Comedy"], year=2020))
+    assert snapped.genres == ["Action", "Comedy"]
+    assert snapped.tags is None
+    assert snapped.year == 2020
+
+
+def test_stats_count_methods_and_rescues():
+    index = VocabularyIndex(["Action"], ["Isekai"], synonyms={})
+    index.snap_filters(["Action", "Actoin"], ["isekai", "Nope"])
+    index.record_outcome(True)
+    index.record_outcome(False)
+    stats = index.stats()
+    assert {k: stats[k] for k in ("exact", "alias", "fuzzy", "unknown", "snapped_queries")} == {
+        "exact": 1, "alias": 1, "fuzzy": 1, "unknown": 1, "snapped_queries": 1,
+    }
+    assert stats["rescue_rate"] == 0.5
+
+
+@pytest.mark.parametrize("word, variant", [
+    ("robots", "robot"),
+    ("robot", "robots"),
+    ("villainess", "villainesses"),
+    ("succubus", "succubuses"),
+])
+def test_variants_only_strip_a_plural_s(word, variant):
+    assert list(_variants([word])) == [(word,), (variant,)]
+
+
+def test_villain_is_not_an_alias_of_villainess(vocab):
+    assert vocab.lookup("Villainess") == ((("tag", "Villainess"),), "exact")
+    assert vocab.lookup("Villain") == ((), "unknown")
+    # Still a one-letter typo of it, but no longer an alias.
+    assert vocab.lookup("villaines")[1] == "fuzzy"
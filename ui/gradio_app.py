@@ -1,7 +1,9 @@
 import gradio as gr
-from service import get_recommendations
+from service import stream_recommendations_async, warm_up
+from src.prefetch import start_prefetcher
 import os
-import base64
+import time
+import threading
 
 # Intro text parts
 INTRO_TEXT = (
@@ -12,29 +14,12 @@ INTRO_TEXT = (
     "• A dark fantasy from 2020"
 )
 
-def recommend_cb(query: str) -> str:
-    """
-    Returns HTML string rendering horizontal cards: white text on dark theme.
-    """
-    q = query.strip()
-    if not q:
-        return "<p style='color:white;'>⚠️ Please enter a request first.</p>"
+def _render_card(rec) -> str:
+    title = rec.title
+    desc = rec.description
+    img_url = rec.image_url
 
-    try:
-        recs = get_recommendations(q)
-    except Exception as e:
-        return f"<p style='color:white;'>❌ An error occurred: {e}</p>"
-
-    if not recs:
-        return "<p style='color:white;'>⚠️ No recommendations found.</p>"
-
-    cards_html = []
-    for rec in recs:
-        title = rec.title
-        desc = rec.description
-        img_url = rec.image_url
-
-        card = f"""
+    return f"""
         <div style="display:flex; flex-direction:row; width:90%; max-width:800px; margin:20px auto; border-radius:8px; box-shadow:0 2px 8px rgba(0,0,0,0.2); overflow:hidden; background:#111;">
           <div style="flex:1; padding:16px; color:white;">
             <h3 style="margin:0 0 8px; font-size:1.2rem; color:white;">{title}</h3>
@@ -43,20 +28,55 @@ def recommend_cb(query: str) -> str:
           <img src="{img_url}" alt="{title}" style="width:200px; height:auto; object-fit:cover;"/>
         </div>
         """
-        cards_html.append(card)
 
-    html = f"""
+def _render_page(cards_html: list, status: str = "") -> str:
+    status_html = f"<p style='color:#aaa; margin:0;'>{status}</p>" if status else ""
+    return f"""
     <div style="display:flex; flex-direction:column; align-items:center; gap:16px; padding-bottom:20px;">
       {''.join(cards_html)}
+      {status_html}
     </div>
     """
-    return html
 
-# Get logo as base64 for embedding
-logo_path = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "media", "logo.png"))
-with open(logo_path, "rb") as f:
-    logo_data = f.read()
-    encoded_logo = base64.b64encode(logo_data).decode("utf-8")
+async def recommend_cb(query: str):
+    """
+    Streams HTML horizontal cards (white text on dark theme), appending each
+    card as soon as the service yields it.
+    """
+    q = query.strip()
+    if not q:
+        yield "<p style='color:white;'>⚠️ Please enter a request first.</p>"
+        return
+
+    started = time.perf_counter()
+    first_card_s = None
+    cards_html = []
+    yield _render_page(cards_html, "🔍 Looking for recommendations…")
+
+    try:
+        async for rec in stream_recommendations_async(q):
+            if first_card_s is None:
+                first_card_s = time.perf_counter() - started
+            cards_html.append(_render_card(rec))
+            yield _render_page(cards_html, "🔍 Looking for more…")
+    except Exception as e:
+        yield _render_page(cards_html, f"❌ An error occurred: {e}")
+        return
+
+    if not cards_html:
+        yield "<p style='color:white;'>⚠️ No recommendations found.</p>"
+        return
+
+    total_s = time.perf_counter() - started
+    yield _render_page(
+        cards_html, f"First card in {first_card_s:.1f} s · {len(cards_html)} results in {total_s:.1f} s"
+    )
+
+# Serve the logo as a static file; inlining it as base64 meant reading and
+# encoding ~4 MB at import and shipping it inside every page.
+media_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "media"))
+gr.set_static_paths(paths=[media_dir])
+logo_url = f"/gradio_api/file={os.path.join(media_dir, 'logo.png')}"
 
 # Custom header HTML with perfect alignment
 header_html = f'''
@@ -72,7 +92,7 @@ header_html = f'''
         </ul>
     </div>
     <div style="flex:2; margin:0; padding:0; display:flex; justify-content:flex-end;">
-        <img src="data:image/png;base64,{encoded_logo}" style="height:auto; width:450px; margin:0; padding:0; object-fit:contain;">
+        <img src="{logo_url}" style="height:auto; width:450px; margin:0; padding:0; object-fit:contain;">
     </div>
 </div>
 '''
@@ -122,4 +142,7 @@ with gr.Blocks(
     inp.submit(fn=recommend_cb, inputs=inp, outputs=card_output)
 
 if __name__ == '__main__':
+    # Load the crew/LLM stack while the server starts instead of on the first request
+    threading.Thread(target=warm_up, daemon=True).start()
+    start_prefetcher()
     demo.launch(server_port=7860)